@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -40,8 +41,8 @@ CSRF_TRUSTED_ORIGINS = [
     if origin.strip()
 ]
 
-# ЖЁСТКИЙ СПИСОК АДРЕСОВ (2 штуки)
-# Можно переопределять через .env:
+# Начальный список залов: по нему миграция schedule.0017 создаёт записи Location.
+# Дальше залы ведутся в админке (Расписание → Залы).
 # WOOMFIT_LOCATIONS="Адрес 1|Адрес 2"
 WOOMFIT_LOCATIONS = [
     x.strip()
@@ -148,11 +149,26 @@ DATABASES = {
 }
 
 # ✅ Кэш (под оптимизацию расписания/новостей)
+# Общий для всех воркеров gunicorn: иначе инвалидация (core.cache.bump) видна
+# только процессу, который её сделал.
+#   file   — каталог на диске (по умолчанию; общий для воркеров одного контейнера)
+#   db     — таблица в MySQL (общая и для нескольких контейнеров; createcachetable)
+#   locmem — кэш процесса, только для разработки
+DJANGO_CACHE_BACKEND = os.environ.get("DJANGO_CACHE_BACKEND", "file")
+_CACHE_BACKENDS = {
+    "file": (
+        "django.core.cache.backends.filebased.FileBasedCache",
+        os.environ.get("DJANGO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "woomfit-cache")),
+    ),
+    "db": ("django.core.cache.backends.db.DatabaseCache", "django_cache"),
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "woomfit-cache"),
+}
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "woomfit-cache",
+        "BACKEND": _CACHE_BACKENDS[DJANGO_CACHE_BACKEND][0],
+        "LOCATION": _CACHE_BACKENDS[DJANGO_CACHE_BACKEND][1],
         "TIMEOUT": int(os.environ.get("DJANGO_CACHE_TIMEOUT", "60")),
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("DJANGO_CACHE_MAX_ENTRIES", "5000"))},
     }
 }
 
@@ -200,6 +216,11 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 TBANK_TERMINAL_KEY = os.getenv("TBANK_TERMINAL_KEY", "")
 TBANK_PASSWORD = os.getenv("TBANK_PASSWORD", "")  # именно SecretKey!
 TBANK_IS_TEST = os.getenv("TBANK_IS_TEST", "1") in ("1", "true", "True", "yes")
+# свой адрес API (например, локальная заглушка: python manage.py run_tbank_stub);
+# пусто — боевой или тестовый шлюз по TBANK_IS_TEST
+TBANK_BASE_URL = os.getenv("TBANK_BASE_URL", "")
+# куда archive_webhook_logs складывает старые записи журнала вебхука (не под MEDIA_ROOT!)
+PAYMENTS_ARCHIVE_DIR = os.getenv("PAYMENTS_ARCHIVE_DIR", str(BASE_DIR / "archive" / "payments"))
 
 
 TBANK_NOTIFICATION_URL = os.getenv("TBANK_NOTIFICATION_URL", "")
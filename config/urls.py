@@ -14,6 +14,7 @@ urlpatterns = [
     # ✅ ВАЖНО: planning ДО admin.site.urls
     path("admin/planning/", crm_views.planning, name="crm_planning"),
     path("admin/planning/move/", crm_views.move_session, name="crm_planning_move"),
+    path("admin/planning/move-batch/", crm_views.session_move_batch, name="crm_planning_move_batch"),
     path("admin/planning/repeat-week/", crm_views.repeat_week, name="crm_planning_repeat_week"),
 
 
@@ -0,0 +1,85 @@
+"""Версионированный кэш: инвалидация по пространствам имён между процессами.
+
+Каждое пространство имён ("schedule", "news", ...) имеет счётчик поколения в
+общем кэше. Ключи значений включают текущее поколение, поэтому ``bump()`` в
+одном воркере мгновенно «прячет» всё закэшированное остальными — без перебора
+и удаления ключей. Работает только поверх общего бэкенда (файлы/БД), см.
+``CACHES`` в settings.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+
+def _generation_key(namespace: str) -> str:
+    return f"gen:{namespace}"
+
+
+def _new_generation() -> int:
+    # Не инкремент: incr у файлового/DB-бэкенда — это get+set, и два
+    # параллельных bump() записали бы одно и то же значение. Метка времени
+    # в наносекундах уникальна, а после вытеснения ключа не совпадёт со старой.
+    return time.time_ns()
+
+
+def generation(namespace: str) -> int:
+    """Текущее поколение пространства имён (создаёт его при первом обращении)."""
+    key = _generation_key(namespace)
+    gen = cache.get(key)
+    if gen is None:
+        cache.add(key, _new_generation(), timeout=None)
+        gen = cache.get(key)
+    return int(gen or 0)
+
+
+def bump(namespace: str) -> None:
+    """Инвалидирует все значения пространства имён во всех процессах."""
+    cache.set(_generation_key(namespace), _new_generation(), timeout=None)
+
+
+def versioned_key(namespace: str, key: str) -> str:
+    return f"{namespace}:{generation(namespace)}:{key}"
+
+
+def get_versioned(namespace: str, key: str, default=None):
+    return cache.get(versioned_key(namespace, key), default)
+
+
+def set_versioned(namespace: str, key: str, value, timeout=DEFAULT_TIMEOUT) -> None:
+    cache.set(versioned_key(namespace, key), value, timeout)
+
+
+class HeldLock:
+    """Захваченная блокировка; refresh() продлевает её для долгих циклов."""
+
+    def __init__(self, key: str, token: str, timeout: int):
+        self.key = key
+        self.token = token
+        self.timeout = timeout
+
+    def refresh(self) -> bool:
+        if cache.get(self.key) != self.token:
+            return False
+        cache.set(self.key, self.token, self.timeout)
+        return True
+
+
+@contextmanager
+def exclusive(name: str, timeout: int):
+    """Межпроцессная блокировка на cache.add: отдаёт HeldLock или None, если занята.
+
+    Держится не дольше timeout — упавший процесс не блокирует остальных навсегда.
+    """
+    key = f"lock:{name}"
+    token = uuid.uuid4().hex
+    if not cache.add(key, token, timeout):
+        yield None
+        return
+    try:
+        yield HeldLock(key, token, timeout)
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
@@ -0,0 +1,67 @@
+"""Conditional GET (ETag / Last-Modified) для публичных страниц.
+
+Страница получает дешёвую «метку изменений» своего домена (поколение из
+core.cache или max(updated_at) одним запросом) и вариант зрителя: base.html
+персонализирован (пользователь, корзина, язык). Если у браузера та же версия —
+отвечаем 304 без рендеринга шаблонов.
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, quote_etag
+from django.utils.http import http_date
+from django.utils.translation import get_language
+
+from shop.cart import Cart
+
+
+def _viewer_variant(request) -> tuple[str, bool]:
+    """(вариант страницы для зрителя, персонализирована ли она)."""
+    user_id = request.user.pk if request.user.is_authenticated else None
+    cart_count = Cart(request).count
+    return f"{user_id or ''}:{cart_count}:{get_language()}", bool(user_id or cart_count)
+
+
+def conditional_page(stamp_func):
+    """Декоратор view: ``stamp_func(request, *args, **kwargs)`` возвращает
+    ``(stamp, last_modified)`` или ``None``, если метку посчитать нельзя
+    (например, объекта нет — тогда view сам ответит 404).
+    """
+    def decorator(view):
+        @wraps(view)
+        def _wrapped(request, *args, **kwargs):
+            # flash-сообщения показываются один раз — такую страницу надо отрендерить
+            if request.method not in ("GET", "HEAD") or len(get_messages(request)):
+                return view(request, *args, **kwargs)
+
+            stamped = stamp_func(request, *args, **kwargs)
+            if stamped is None:
+                return view(request, *args, **kwargs)
+            stamp, last_modified = stamped
+
+            variant, personalised = _viewer_variant(request)
+            digest = hashlib.blake2b(f"{stamp}|{variant}".encode(), digest_size=12).hexdigest()
+            etag = quote_etag(digest)
+            # Last-Modified не различает зрителей — отдаём его только «гостевому» варианту
+            if personalised:
+                last_modified = None
+            last_modified_ts = int(last_modified.timestamp()) if isinstance(last_modified, datetime) else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified_ts)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.headers.setdefault("ETag", etag)
+            if last_modified_ts is not None:
+                response.headers.setdefault("Last-Modified", http_date(last_modified_ts))
+            # браузер/nginx хранят копию, но каждый раз переспрашивают
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ("Cookie",))
+            return response
+
+        return _wrapped
+
+    return decorator
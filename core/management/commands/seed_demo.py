@@ -1,8 +1,7 @@
-from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-from schedule.models import Trainer, Session
+from schedule.models import Location, Trainer, Session
 from shop.models import Category, Product
 
 class Command(BaseCommand):
@@ -13,14 +12,15 @@ class Command(BaseCommand):
 
         now = timezone.localtime()
         start_at = now.replace(hour=11, minute=0, second=0, microsecond=0)
-        locations = [x.strip() for x in getattr(settings, "WOOMFIT_LOCATIONS", []) if str(x).strip()]
-        default_location = locations[0] if locations else "Сакко и Ванцетти, 93а"
+        hall = Location.objects.active().first()
+        if hall is None:
+            hall, _ = Location.objects.get_or_create(name="Сакко и Ванцетти, 93а", defaults={"rent_enabled": True})
 
         Session.objects.get_or_create(
             title="Плоский живот",
             start_at=start_at,
             trainer=trainer,
-            defaults={"duration_min": 50, "location": default_location, "capacity": 18},
+            defaults={"duration_min": 50, "hall": hall, "capacity": 18},
         )
 
         c1, _ = Category.objects.get_or_create(name="Абонементы", defaults={"sort": 10})
@@ -104,7 +104,7 @@ def _fmt_session_time(session) -> str:
 
 def _session_occupancy(session):
     try:
-        current = session.bookings.filter(booking_status="booked").count()
+        current = int(getattr(session, "booked_count", 0) or 0)
         capacity = getattr(session, "capacity", None)
         return occupancy_line(current, capacity), occupancy_note(current, capacity)
     except Exception:
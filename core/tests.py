@@ -1,19 +1,36 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 from datetime import datetime, time, timedelta
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
-from schedule.models import Session, Trainer
+from core import cache as versioned
+from news.models import NewsPost
+from schedule.models import RentPaymentIntent, Session, SlotReservation, Trainer
 
 
 class RentPrivacyTests(TestCase):
     def setUp(self):
+        # сетка аренды кэшируется по дням, а сброс идёт on_commit
+        cache.clear()
         user_model = get_user_model()
-        self.owner = user_model.objects.create_user(username="owner", password="pass12345")
-        self.other = user_model.objects.create_user(username="other", password="pass12345")
+        self.owner = user_model.objects.create_user(
+            username="owner", password="pass12345", phone="79000000011", email="owner@example.com",
+        )
+        self.other = user_model.objects.create_user(
+            username="other", password="pass12345", phone="79000000012", email="other@example.com",
+        )
 
         self.location = settings.WOOMFIT_LOCATIONS[0]
         self.trainer = Trainer.objects.create(name="Rent trainer")
@@ -80,3 +97,173 @@ class RentPrivacyTests(TestCase):
         self.assertEqual(response.context["booked_slots"], [])
         self.assertFalse(response.context["show_paid_rent_details"])
         self.assertFalse(response.context["show_my_paid_rent_legend"])
+
+    def test_anonymous_browsing_issues_no_writes(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("core:rent"))
+        self.assertEqual(response.status_code, 200)
+        writes = [q["sql"] for q in ctx.captured_queries if q["sql"].lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE"))]
+        self.assertEqual(writes, [])
+
+
+    def test_posting_a_booked_hour_leaves_no_intent_or_reservation(self):
+        self.client.force_login(self.other)
+        response = self.client.post(reverse("core:rent"), {
+            "slot": self.slot_key,
+            "method": "online",
+            "full_name": "Other",
+            "phone": "+7 999 000 00 02",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "уже занята")
+        self.assertFalse(RentPaymentIntent.objects.exists())
+        self.assertFalse(SlotReservation.objects.exists())
+
+    def _slot_code(self, week: dict) -> str:
+        local = timezone.localtime(self.slot_start)
+        day = next(d for d in week["days"] if d["date"] == local.date().isoformat())
+        return day["slots"][local.hour - week["open_hour"]]
+
+    def test_week_api_returns_one_string_per_day(self):
+        self.client.force_login(self.owner)
+        week = self.client.get(reverse("core:rent_week_api")).json()
+        self.assertEqual(len(week["days"]), 7)
+        self.assertEqual({len(d["slots"]) for d in week["days"]}, {week["close_hour"] - week["open_hour"]})
+        self.assertEqual(self._slot_code(week), "m")
+        self.assertEqual(len(week["booked"]), 1)
+
+        self.client.logout()
+        week = self.client.get(reverse("core:rent_week_api")).json()
+        self.assertEqual(self._slot_code(week), "b")
+        self.assertNotIn("booked", week)
+
+    def test_submit_api_returns_structured_errors(self):
+        url = reverse("core:rent_submit_api")
+        response = self.client.post(url, {"slot": self.slot_key, "method": "online", "phone": "+7 999 000 00 02"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "full_name")
+
+        response = self.client.post(url, {
+            "slot": self.slot_key,
+            "method": "online",
+            "full_name": "Other",
+            "phone": "+7 999 000 00 02",
+        })
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["taken"], [self.slot_key])
+
+_CACHE_WORKER = """
+import json, sys
+import django
+django.setup()
+from core import cache as versioned
+cmd, namespace = sys.argv[1], sys.argv[2]
+if cmd == "bump":
+    versioned.bump(namespace)
+elif cmd == "set":
+    versioned.set_versioned(namespace, "k", sys.argv[3])
+print(json.dumps({"gen": versioned.generation(namespace), "value": versioned.get_versioned(namespace, "k")}))
+"""
+
+
+class VersionedCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp(prefix="woomfit-cache-test-")
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        override = override_settings(CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": self.cache_dir,
+            }
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _worker(self, *args: str) -> dict:
+        # Отдельный интерпретатор = отдельный «воркер gunicorn» со своей памятью
+        env = {
+            **os.environ,
+            "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "config.settings"),
+            "DJANGO_CACHE_BACKEND": "file",
+            "DJANGO_CACHE_DIR": self.cache_dir,
+        }
+        out = subprocess.run(
+            [sys.executable, "-c", _CACHE_WORKER, *args],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+    def test_bump_hides_values_of_the_namespace_only(self):
+        versioned.set_versioned("schedule", "k", "old")
+        versioned.set_versioned("news", "k", "kept")
+
+        versioned.bump("schedule")
+
+        self.assertIsNone(versioned.get_versioned("schedule", "k"))
+        self.assertEqual(versioned.get_versioned("news", "k"), "kept")
+
+    def test_invalidation_is_seen_by_other_processes(self):
+        versioned.set_versioned("schedule", "k", "from-parent")
+        seen = self._worker("get", "schedule")
+        self.assertEqual(seen["value"], "from-parent")
+        self.assertEqual(seen["gen"], versioned.generation("schedule"))
+
+        bumped = self._worker("bump", "schedule")
+        self.assertEqual(versioned.generation("schedule"), bumped["gen"])
+        self.assertNotEqual(bumped["gen"], seen["gen"])
+        self.assertIsNone(versioned.get_versioned("schedule", "k"))
+
+        self._worker("set", "schedule", "from-child")
+        self.assertEqual(self._worker("get", "schedule")["value"], "from-child")
+        self.assertEqual(versioned.get_versioned("schedule", "k"), "from-child")
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _revalidate(self, url: str, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_trainers_page_returns_304_until_a_trainer_changes(self):
+        url = reverse("core:trainers")
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("no-cache", first["Cache-Control"])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self._revalidate(url, first).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Trainer.objects.create(name="Новый тренер")
+        changed = self._revalidate(url, first)
+        self.assertEqual(changed.status_code, 200)
+        self.assertContains(changed, "Новый тренер")
+
+    def test_news_pages_use_a_single_stamp_query(self):
+        post = NewsPost.objects.create(title="Открытие", body="Текст")
+        for url in (reverse("news:list"), post.get_absolute_url()):
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertIn("Last-Modified", first)
+            with self.assertNumQueries(1):
+                self.assertEqual(self._revalidate(url, first).status_code, 304)
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+            self.assertEqual(response.status_code, 304)
+
+        NewsPost.objects.filter(pk=post.pk).update(updated_at=timezone.now() + timedelta(seconds=5))
+        self.assertEqual(self._revalidate(post.get_absolute_url(), first).status_code, 200)
+
+    def test_logged_in_viewer_gets_own_variant(self):
+        url = reverse("core:trainers")
+        anonymous = self.client.get(url)
+
+        user = get_user_model().objects.create_user(
+            username="viewer", password="pass12345", phone="79000000020", email="viewer@example.com",
+        )
+        self.client.force_login(user)
+        response = self._revalidate(url, anonymous)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], anonymous["ETag"])
+        self.assertNotIn("Last-Modified", response)
@@ -17,6 +17,8 @@ urlpatterns = [
     path("legal/requisites/", views.requisites, name="requisites"),
     path("trainers/", views.trainers, name="trainers"),
     path("rent/", views.rent, name="rent"),
+    path("rent/api/week/", views.rent_week_api, name="rent_week_api"),
+    path("rent/api/submit/", views.rent_submit_api, name="rent_submit_api"),
     path("rent/pay/success/<int:intent_id>/", views.rent_pay_success, name="rent_pay_success"),
     path("rent/pay/fail/<int:intent_id>/", views.rent_pay_fail, name="rent_pay_fail"),
     path("call/", views.call, name="call"),
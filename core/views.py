@@ -1,3 +1,4 @@
+from dataclasses import dataclass, field
 from datetime import date, datetime, time, timedelta
 import re
 from decimal import Decimal
@@ -6,12 +7,20 @@ from django.conf import settings
 from django.contrib import messages
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import Q
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.utils import timezone
+from django.views.decorators.http import require_POST
 
+from core.cache import generation
+from core.conditional import conditional_page
 from core.telegram_notify import notify_rent_request_paid
-from schedule.models import Booking, Trainer, Session, RentPaymentIntent, RentRequest
+from schedule import rent as rent_booking
+from schedule import reservations
+from schedule.availability import occupancy_for_days
+from schedule.models import Booking, Location, Trainer, RentPaymentIntent, SlotReservation
 
 
 def home(request):
@@ -99,18 +108,19 @@ def about(request):
     })
 
 
+def _trainers_stamp(request):
+    return str(generation("trainers")), None
+
+
+@conditional_page(_trainers_stamp)
 def trainers(request):
     return render(request, "core/trainers.html", {"trainers": Trainer.objects.order_by('name')})
 
 
-RENT_OPEN_HOUR = 8
-RENT_CLOSE_HOUR = 22
-RENT_SLOT_MIN = 60
-RENT_PRICE_RUB = 650
+# часы работы и цена — в карточке зала (Location)
 RENT_PAYMENT_TTL_MIN = 15
-RENT_LOCATION_FALLBACK = "Сакко и Ванцетти, 93а"
-RENT_LOCATION_TOKEN = "саккоиванцетти"
-RENT_TRAINER_NAME = "Аренда зала"
+# сколько часов можно взять одной оплатой
+RENT_MAX_SLOTS = 12
 _RU_WEEKDAYS = ("пн", "вт", "ср", "чт", "пт", "сб", "вс")
 
 
@@ -123,19 +133,11 @@ def _parse_iso_date(raw: str) -> date | None:
         return None
 
 
-def _norm_addr(raw: str) -> str:
-    if not raw:
-        return ""
-    s = raw.strip().lower().replace("ё", "е")
-    return re.sub(r"[^0-9a-zа-я]+", "", s)
-
-
-def _rent_location() -> str:
-    locations = [x.strip() for x in getattr(settings, "WOOMFIT_LOCATIONS", []) if str(x).strip()]
-    for loc in locations:
-        if RENT_LOCATION_TOKEN in _norm_addr(loc):
-            return loc
-    return RENT_LOCATION_FALLBACK
+def _rent_location() -> Location:
+    location = Location.objects.rentable().first()
+    if location is None:
+        raise Http404("Нет зала, доступного для аренды")
+    return location
 
 
 def _slot_start(day: date, hour: int):
@@ -160,135 +162,44 @@ def _parse_slot_key(raw: str):
     return timezone.make_aware(naive, tz)
 
 
-def _intervals_overlap(start_a, end_a, start_b, end_b) -> bool:
-    return start_a < end_b and start_b < end_a
-
-
-def _sessions_for_location_between(*, location: str, range_start, range_end, lock: bool = False):
-    qs = Session.objects.filter(start_at__lt=range_end, start_at__gte=range_start).order_by("start_at")
-    if lock:
-        qs = qs.select_for_update()
-    target = _norm_addr(location)
-    sessions = []
-    for s in qs:
-        if _norm_addr(s.location) == target:
-            sessions.append(s)
-    return sessions
-
-
-def _expire_rent_payment_intents() -> None:
-    RentPaymentIntent.objects.filter(
-        status__in=(RentPaymentIntent.Status.NEW, RentPaymentIntent.Status.PENDING),
-        expires_at__lte=timezone.now(),
-    ).update(status=RentPaymentIntent.Status.CANCELED, tb_status="DEADLINE_EXPIRED")
-
-
-def _pending_intents_for_location_between(
-    *,
-    location: str,
-    range_start,
-    range_end,
-    lock: bool = False,
-    exclude_intent_id: int | None = None,
-):
-    now = timezone.now()
-    qs = (
-        RentPaymentIntent.objects
-        .filter(slot_start__lt=range_end, slot_start__gte=range_start)
-        .filter(status__in=(RentPaymentIntent.Status.NEW, RentPaymentIntent.Status.PENDING))
-        .filter(expires_at__gt=now)
-        .order_by("slot_start")
-    )
-    if exclude_intent_id:
-        qs = qs.exclude(id=exclude_intent_id)
-    if lock:
-        qs = qs.select_for_update()
-
-    target = _norm_addr(location)
-    intents = []
-    for intent in qs:
-        if _norm_addr(intent.location) == target:
-            intents.append(intent)
-    return intents
-
-
-def _slot_is_busy(slot_start, sessions: list[Session], pending_intents: list[RentPaymentIntent]) -> bool:
-    slot_end = slot_start + timedelta(minutes=RENT_SLOT_MIN)
-    for s in sessions:
-        s_start = timezone.localtime(s.start_at)
-        s_end = s_start + timedelta(minutes=max(1, int(s.duration_min or 0)))
-        if _intervals_overlap(slot_start, slot_end, s_start, s_end):
-            return True
-    for intent in pending_intents:
-        i_start = timezone.localtime(intent.slot_start)
-        i_end = i_start + timedelta(minutes=max(1, int(intent.duration_min or 0)))
-        if _intervals_overlap(slot_start, slot_end, i_start, i_end):
-            return True
-    return False
-
-
-def _busy_slot_states_for_week(*, week_start: date, location: str, viewer_user_id: int | None = None) -> dict[str, str]:
-    week_end = week_start + timedelta(days=7)
-    week_start_dt = _slot_start(week_start, 0)
-    week_end_dt = _slot_start(week_end, 0)
-    sessions = _sessions_for_location_between(
-        location=location,
-        range_start=week_start_dt - timedelta(days=1),
-        range_end=week_end_dt + timedelta(days=1),
-    )
-    pending_intents = _pending_intents_for_location_between(
-        location=location,
-        range_start=week_start_dt,
-        range_end=week_end_dt,
-    )
+def _reserve_rent_slots(*, location: Location, slot_starts: list, user, contact: dict, phone: str) -> RentPaymentIntent | None:
+    """Создаёт одно намерение оплаты на все слоты и резервирует их; None — что-то уже занято."""
+    runs = rent_booking.slot_runs(slot_starts)
+    try:
+        with transaction.atomic():
+            intent = RentPaymentIntent.objects.create(
+                user=user,
+                hall=location,
+                # интервал намерения — от первого до последнего слота; сами слоты — в резервах
+                slot_start=runs[0].start,
+                duration_min=int((runs[-1].end - runs[0].start).total_seconds() // 60),
+                full_name=contact["full_name"],
+                email=contact["email"],
+                phone=phone,
+                social_handle=contact["social_handle"],
+                comment=contact["comment"],
+                promo_code=contact["promo_code"],
+                amount_rub=location.rent_price_rub * len(slot_starts),
+                expires_at=timezone.now() + timedelta(minutes=RENT_PAYMENT_TTL_MIN),
+                status=RentPaymentIntent.Status.NEW,
+            )
+            reservations.reserve(location, slot_starts, intent=intent)
+            # занятия клуба резервов не ставят — сверяемся с ними уже после вставки,
+            # чтобы параллельная аренда тех же часов ждала на уникальном ключе
+            if rent_booking.busy_runs(location.id, runs):
+                raise reservations.SlotTaken
+    except reservations.SlotTaken:
+        return None
+    return intent
 
-    busy_states: dict[str, str] = {}
-    priority = {"pending": 1, "busy": 2, "training": 2, "rent_paid": 3}
-
-    def put_state(slot_key: str, state: str):
-        current = busy_states.get(slot_key)
-        if not current or priority[state] > priority[current]:
-            busy_states[slot_key] = state
-
-    for s in sessions:
-        s_start = timezone.localtime(s.start_at)
-        s_end = s_start + timedelta(minutes=max(1, int(s.duration_min or 0)))
-        if s.kind == Session.Kind.RENT:
-            state = "rent_paid" if (viewer_user_id and s.client_id == viewer_user_id) else "busy"
-        else:
-            state = "training"
-        cur = s_start.replace(minute=0, second=0, microsecond=0)
-        while cur < s_end:
-            cur_end = cur + timedelta(hours=1)
-            if (
-                week_start <= cur.date() < week_end
-                and RENT_OPEN_HOUR <= cur.hour < RENT_CLOSE_HOUR
-                and _intervals_overlap(cur, cur_end, s_start, s_end)
-            ):
-                put_state(_slot_key(cur), state)
-            cur = cur_end
-
-    for intent in pending_intents:
-        i_start = timezone.localtime(intent.slot_start)
-        i_end = i_start + timedelta(minutes=max(1, int(intent.duration_min or 0)))
-        cur = i_start.replace(minute=0, second=0, microsecond=0)
-        while cur < i_end:
-            cur_end = cur + timedelta(hours=1)
-            if (
-                week_start <= cur.date() < week_end
-                and RENT_OPEN_HOUR <= cur.hour < RENT_CLOSE_HOUR
-                and _intervals_overlap(cur, cur_end, i_start, i_end)
-            ):
-                put_state(_slot_key(cur), "pending")
-            cur = cur_end
-
-    return busy_states
-
-
-def _slot_label(slot_start) -> str:
-    local_start = timezone.localtime(slot_start)
-    local_end = local_start + timedelta(minutes=RENT_SLOT_MIN)
-    return f"{local_start.strftime('%d.%m.%Y %H:%M')} - {local_end.strftime('%H:%M')}"
+
+def _slots_label(slot_starts) -> str:
+    parts = []
+    for run in rent_booking.slot_runs(slot_starts):
+        local_start = timezone.localtime(run.start)
+        local_end = timezone.localtime(run.end)
+        parts.append(f"{local_start.strftime('%d.%m.%Y %H:%M')} - {local_end.strftime('%H:%M')}")
+    return ", ".join(parts)
 
 
 def _initial_rent_contact(request):
@@ -318,272 +229,312 @@ def _clean_phone(raw: str) -> str:
     return digits
 
 
-def rent(request):
-    _expire_rent_payment_intents()
+# Одна буква на час рабочего дня зала — компактное состояние для сетки и API
+_RENT_CELL_CODES = {"": ".", "pending": "p", "training": "b", "busy": "b", "rent_paid": "m"}
+_RENT_CELL_PAST = "-"
 
+
+@dataclass
+class RentSubmitResult:
+    redirect_url: str = ""
+    success_message: str = ""
+    error: str = ""
+    message: str = ""
+    taken: list[str] = field(default_factory=list)
+
+
+def _rent_week(location: Location, week_start: date, viewer_user_id: int | None) -> dict:
+    """Состояние недели: по строке на день (буква на час) и оплаченные брони зрителя."""
+    week_days = [week_start + timedelta(days=i) for i in range(7)]
+    # занятость по часам — из кэша на (зал, день), без обхода интервалов
+    occupancy = occupancy_for_days(location.id, week_days)
+    now_ts = timezone.now().timestamp()
+    now_local = timezone.localtime(timezone.now())
+
+    days = []
+    booked = []
+    for day_obj in week_days:
+        codes = []
+        for hour in range(location.open_hour, location.close_hour):
+            code = _RENT_CELL_CODES[occupancy[day_obj].state(hour, viewer_id=viewer_user_id, now_ts=now_ts)]
+            if code == "." and _slot_start(day_obj, hour) <= now_local:
+                code = _RENT_CELL_PAST
+            codes.append(code)
+        slots = "".join(codes)
+        days.append({
+            "date": day_obj.isoformat(),
+            "weekday": _RU_WEEKDAYS[day_obj.weekday()],
+            "day": day_obj.day,
+            "slots": slots,
+        })
+        # свои брони — подряд идущие «m» того же дня
+        for match in re.finditer(r"m+", slots):
+            first = location.open_hour + match.start()
+            last = location.open_hour + match.end()
+            booked.append({
+                "day_label": f"{_RU_WEEKDAYS[day_obj.weekday()]}, {day_obj.strftime('%d.%m')}",
+                "time_label": f"{first:02d}:00–{last:02d}:00",
+            })
+
+    return {
+        "week": week_start.isoformat(),
+        "label": f"{week_days[0].strftime('%d.%m')} — {week_days[-1].strftime('%d.%m')}",
+        "prev": (week_start - timedelta(days=7)).isoformat(),
+        "next": (week_start + timedelta(days=7)).isoformat(),
+        "can_prev": week_start > timezone.localdate(),
+        "open_hour": location.open_hour,
+        "close_hour": location.close_hour,
+        "days": days,
+        "booked": booked,
+    }
+
+
+def _selected_week(request) -> date:
     today = timezone.localdate()
     selected_week = _parse_iso_date(request.GET.get("week") or request.POST.get("week") or "") or today
-    if selected_week < today:
-        selected_week = today
+    return max(selected_week, today)
+
+
+def _rent_contact_from_post(request) -> dict:
+    contact = _initial_rent_contact(request)
+    for name in contact:
+        contact[name] = (request.POST.get(name) or "").strip()
+    return contact
+
+
+def _taken_slots(location: Location, slot_starts: list) -> list[str]:
+    """Какие из слотов заняты прямо сейчас — для ответа «уже занято»."""
+    step = timedelta(minutes=rent_booking.SLOT_MIN)
+    taken = set(
+        SlotReservation.objects
+        .filter(hall=location, slot_start__in=slot_starts)
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()))
+        .values_list("slot_start", flat=True)
+    )
+    single = [rent_booking.SlotRun(start, start + step, 1) for start in slot_starts]
+    taken.update(run.start for run in rent_booking.busy_runs(location.id, single))
+    return [_slot_key(start) for start in sorted(taken)]
+
+
+def _submit_rent(request, location: Location) -> RentSubmitResult:
+    """Проверяет заявку на аренду, резервирует слоты и проводит оплату.
+
+    Общая часть формы /rent/ и JSON-эндпоинта: возвращает адрес перехода
+    либо код и текст ошибки.
+    """
+    selected_week = _selected_week(request)
+    week_url = f"{reverse('core:rent')}?week={selected_week.isoformat()}"
+    contact = _rent_contact_from_post(request)
+    selected_slots = sorted({key.strip() for key in request.POST.getlist("slot") if key.strip()})
+    parsed_slots = [_parse_slot_key(key) for key in selected_slots]
+    slot_starts = sorted(start for start in parsed_slots if start)
+    payment_method = (request.POST.get("method") or "online").strip()
+    phone_digits = _clean_phone(contact["phone"])
+
+    if payment_method not in {"online", "wallet"}:
+        return RentSubmitResult(error="method", message="Выберите способ оплаты.")
+    if payment_method == "wallet" and not request.user.is_authenticated:
+        return RentSubmitResult(error="login", message="Для оплаты из кошелька войдите в аккаунт.")
+    if not slot_starts or None in parsed_slots:
+        return RentSubmitResult(error="slots", message="Выберите свободный слот в сетке.")
+    if len(slot_starts) > RENT_MAX_SLOTS:
+        return RentSubmitResult(error="too_many", message=f"За одну оплату можно выбрать не больше {RENT_MAX_SLOTS} слотов.")
+    if slot_starts[0] <= timezone.localtime(timezone.now()):
+        return RentSubmitResult(error="past", message="Нельзя бронировать прошедшее время.")
+    if any(start.minute or not (location.open_hour <= start.hour < location.close_hour) for start in slot_starts):
+        return RentSubmitResult(error="hours", message="Выберите слот в рабочем диапазоне аренды.")
+    if not contact["full_name"]:
+        return RentSubmitResult(error="full_name", message="Укажите имя.")
+    if len(phone_digits) != 11 or not phone_digits.startswith("7"):
+        return RentSubmitResult(error="phone", message="Телефон должен быть в формате +7 999 999 99 99.")
+
+    with transaction.atomic():
+        intent = _reserve_rent_slots(
+            location=location,
+            slot_starts=slot_starts,
+            user=request.user if request.user.is_authenticated else None,
+            contact=contact,
+            phone=phone_digits,
+        )
+        if intent is None:
+            return RentSubmitResult(
+                error="taken",
+                message="Часть выбранных слотов уже занята. Выберите другие.",
+                taken=_taken_slots(location, slot_starts),
+            )
+        if payment_method == "wallet":
+            from wallet.services import debit
+
+            try:
+                debit(
+                    request.user,
+                    Decimal(str(intent.amount_rub)),
+                    reason=f"Оплата аренды зала: {location} ({_slots_label(slot_starts)})",
+                )
+            except ValidationError:
+                intent.status = RentPaymentIntent.Status.CANCELED
+                intent.tb_status = "WALLET_INSUFFICIENT"
+                intent.save(update_fields=["status", "tb_status"])
+                return RentSubmitResult(error="wallet", message="Недостаточно средств в кошельке.")
+            booked = rent_booking.book(intent, paid_at=timezone.now(), tb_status="WALLET_PAID")
+
+    if payment_method == "wallet":
+        for rent_session, rent_request in booked:
+            notify_rent_request_paid(session=rent_session, request_obj=rent_request)
+        return RentSubmitResult(
+            redirect_url=week_url,
+            success_message=f"Оплата прошла. Бронь подтверждена: {_slots_label(slot_starts)}",
+        )
+
+    from payments.receipt import build_receipt, receipt_item
+    from payments.tbank import TBankError, get_client
+
+    client = get_client()
+    notification_url = request.build_absolute_uri(reverse("payments:tbank_webhook"))
+    success_url = request.build_absolute_uri(reverse("core:rent_pay_success", args=[intent.id]))
+    fail_url = request.build_absolute_uri(reverse("core:rent_pay_fail", args=[intent.id]))
+    amount_kopeks = int(intent.amount_rub) * 100
+    receipt = build_receipt(
+        request.user if request.user.is_authenticated else None,
+        [receipt_item(
+            name=f"Аренда зала: {location}",
+            price_kopeks=int(location.rent_price_rub) * 100,
+            quantity=len(slot_starts),
+            amount_kopeks=amount_kopeks,
+        )],
+    )
+    try:
+        pay = client.init_payment(
+            order_id=f"R-{intent.id}",
+            amount_kopeks=amount_kopeks,
+            description=f"WOOM FIT rent intent #{intent.id}",
+            notification_url=notification_url,
+            success_url=success_url,
+            fail_url=fail_url,
+            receipt=receipt,
+            redirect_due_date=intent.expires_at.isoformat(timespec="seconds"),
+        )
+    except TBankError:
+        pay = {"Status": "INIT_FAILED"}
 
+    if pay.get("Success"):
+        intent.tb_payment_id = str(pay.get("PaymentId") or "")
+        intent.tb_status = str(pay.get("Status") or "")
+        intent.status = RentPaymentIntent.Status.PENDING
+        intent.save(update_fields=["tb_payment_id", "tb_status", "status"])
+        return RentSubmitResult(redirect_url=pay["PaymentURL"])
+
+    intent.status = RentPaymentIntent.Status.CANCELED
+    intent.tb_status = str(pay.get("Status") or "")
+    intent.save(update_fields=["status", "tb_status"])
+    return RentSubmitResult(error="payment", message="Не удалось создать оплату. Попробуйте ещё раз.")
+
+
+def rent(request):
+    selected_week = _selected_week(request)
     rent_location = _rent_location()
+
+    if request.method == "POST":
+        result = _submit_rent(request, rent_location)
+        if result.redirect_url:
+            if result.success_message:
+                messages.success(request, result.success_message)
+            return redirect(result.redirect_url)
+        messages.error(request, result.message)
+        contact = _rent_contact_from_post(request)
+        raw_slots = request.POST.getlist("slot")
+    else:
+        contact = _initial_rent_contact(request)
+        raw_slots = request.GET.getlist("slot")
+
     wallet_balance = None
     if request.user.is_authenticated:
         from wallet.models import Wallet
         wallet, _ = Wallet.objects.get_or_create(user=request.user)
         wallet_balance = wallet.balance
 
-    selected_slot = request.POST.get("slot", "").strip() if request.method == "POST" else (request.GET.get("slot", "").strip())
-    contact = _initial_rent_contact(request)
-    if request.method == "POST":
-        contact.update({
-            "full_name": (request.POST.get("full_name") or "").strip(),
-            "email": (request.POST.get("email") or "").strip(),
-            "phone": (request.POST.get("phone") or "").strip(),
-            "social_handle": (request.POST.get("social_handle") or "").strip(),
-            "comment": (request.POST.get("comment") or "").strip(),
-            "promo_code": (request.POST.get("promo_code") or "").strip(),
-        })
-
-    selected_slot_start = _parse_slot_key(selected_slot)
-    payment_method = ((request.POST.get("method") or "online").strip() if request.method == "POST" else "online")
-    intent_for_redirect = None
-
-    if request.method == "POST":
-        if payment_method not in {"online", "wallet"}:
-            messages.error(request, "Выберите способ оплаты.")
-        elif payment_method == "wallet" and not request.user.is_authenticated:
-            messages.error(request, "Для оплаты из кошелька войдите в аккаунт.")
-        elif not selected_slot_start:
-            messages.error(request, "Выберите свободный слот в сетке.")
-        elif selected_slot_start <= timezone.localtime(timezone.now()):
-            messages.error(request, "Нельзя бронировать прошедшее время.")
-        elif not (RENT_OPEN_HOUR <= selected_slot_start.hour < RENT_CLOSE_HOUR):
-            messages.error(request, "Выберите слот в рабочем диапазоне аренды.")
-        elif not contact["full_name"]:
-            messages.error(request, "Укажите имя.")
-        else:
-            phone_digits = _clean_phone(contact["phone"])
-            if len(phone_digits) != 11 or not phone_digits.startswith("7"):
-                messages.error(request, "Телефон должен быть в формате +7 999 999 99 99.")
-            else:
-                with transaction.atomic():
-                    slot_end = selected_slot_start + timedelta(minutes=RENT_SLOT_MIN)
-                    sessions = _sessions_for_location_between(
-                        location=rent_location,
-                        range_start=selected_slot_start - timedelta(days=1),
-                        range_end=slot_end + timedelta(days=1),
-                        lock=True,
-                    )
-                    pending_intents = _pending_intents_for_location_between(
-                        location=rent_location,
-                        range_start=selected_slot_start - timedelta(days=1),
-                        range_end=slot_end + timedelta(days=1),
-                        lock=True,
-                    )
-                    if _slot_is_busy(selected_slot_start, sessions, pending_intents):
-                        messages.error(request, "Этот слот уже занят. Выберите другой.")
-                    else:
-                        now = timezone.now()
-                        intent_for_redirect = RentPaymentIntent.objects.create(
-                            user=request.user if request.user.is_authenticated else None,
-                            location=rent_location,
-                            slot_start=selected_slot_start,
-                            duration_min=RENT_SLOT_MIN,
-                            full_name=contact["full_name"],
-                            email=contact["email"],
-                            phone=phone_digits,
-                            social_handle=contact["social_handle"],
-                            comment=contact["comment"],
-                            promo_code=contact["promo_code"],
-                            amount_rub=RENT_PRICE_RUB,
-                            expires_at=now + timedelta(minutes=RENT_PAYMENT_TTL_MIN),
-                            status=RentPaymentIntent.Status.NEW,
-                        )
-                        if payment_method == "wallet":
-                            from wallet.services import debit
-
-                            try:
-                                debit(
-                                    request.user,
-                                    Decimal(str(RENT_PRICE_RUB)),
-                                    reason=(
-                                        f"Оплата аренды зала: {rent_location} "
-                                        f"({timezone.localtime(selected_slot_start).strftime('%d.%m %H:%M')})"
-                                    ),
-                                )
-                            except ValidationError:
-                                messages.error(request, "Недостаточно средств в кошельке.")
-                                intent_for_redirect.status = RentPaymentIntent.Status.CANCELED
-                                intent_for_redirect.tb_status = "WALLET_INSUFFICIENT"
-                                intent_for_redirect.save(update_fields=["status", "tb_status"])
-                            else:
-                                trainer, _ = Trainer.objects.get_or_create(name=RENT_TRAINER_NAME)
-                                session_title = f"Аренда зала — {contact['full_name']}".strip()[:160]
-                                rent_session = Session.objects.create(
-                                    title=session_title or "Аренда зала",
-                                    kind=Session.Kind.RENT,
-                                    client=request.user,
-                                    start_at=selected_slot_start,
-                                    duration_min=RENT_SLOT_MIN,
-                                    location=rent_location,
-                                    trainer=trainer,
-                                    capacity=1,
-                                )
-                                rent_request = RentRequest.objects.create(
-                                    session=rent_session,
-                                    user=request.user,
-                                    full_name=contact["full_name"],
-                                    email=contact["email"],
-                                    phone=phone_digits,
-                                    social_handle=contact["social_handle"],
-                                    comment=contact["comment"],
-                                    promo_code=contact["promo_code"],
-                                    price_rub=RENT_PRICE_RUB,
-                                )
-
-                                intent_for_redirect.session = rent_session
-                                intent_for_redirect.status = RentPaymentIntent.Status.PAID
-                                intent_for_redirect.tb_status = "WALLET_PAID"
-                                intent_for_redirect.paid_at = now
-                                intent_for_redirect.save(update_fields=["session", "status", "tb_status", "paid_at"])
-
-                                notify_rent_request_paid(session=rent_session, request_obj=rent_request)
-                                messages.success(request, f"Оплата прошла. Бронь подтверждена: {_slot_label(selected_slot_start)}")
-                                return redirect(f"{reverse('core:rent')}?week={selected_week.isoformat()}")
-
-        if intent_for_redirect and payment_method == "online":
-            from payments.receipt import build_receipt, receipt_item
-            from payments.tbank import TBankClient
-
-            client = TBankClient(settings.TBANK_TERMINAL_KEY, settings.TBANK_PASSWORD, settings.TBANK_IS_TEST)
-            notification_url = request.build_absolute_uri(reverse("payments:tbank_webhook"))
-            success_url = request.build_absolute_uri(reverse("core:rent_pay_success", args=[intent_for_redirect.id]))
-            fail_url = request.build_absolute_uri(reverse("core:rent_pay_fail", args=[intent_for_redirect.id]))
-            amount_kopeks = int(RENT_PRICE_RUB) * 100
-            receipt = build_receipt(
-                request.user if request.user.is_authenticated else None,
-                [receipt_item(name=f"Аренда зала: {rent_location}", price_kopeks=amount_kopeks, quantity=1)],
-            )
-            try:
-                pay = client.init_payment(
-                    order_id=f"R-{intent_for_redirect.id}",
-                    amount_kopeks=amount_kopeks,
-                    description=f"WOOM FIT rent intent #{intent_for_redirect.id}",
-                    notification_url=notification_url,
-                    success_url=success_url,
-                    fail_url=fail_url,
-                    receipt=receipt,
-                    redirect_due_date=intent_for_redirect.expires_at.isoformat(timespec="seconds"),
-                )
-            except Exception:
-                intent_for_redirect.status = RentPaymentIntent.Status.CANCELED
-                intent_for_redirect.tb_status = "INIT_FAILED"
-                intent_for_redirect.save(update_fields=["status", "tb_status"])
-                messages.error(request, "Не удалось создать оплату. Попробуйте ещё раз.")
-                return redirect(f"{reverse('core:rent')}?week={selected_week.isoformat()}")
-
-            if pay.get("Success"):
-                intent_for_redirect.tb_payment_id = str(pay.get("PaymentId") or "")
-                intent_for_redirect.tb_status = str(pay.get("Status") or "")
-                intent_for_redirect.status = RentPaymentIntent.Status.PENDING
-                intent_for_redirect.save(update_fields=["tb_payment_id", "tb_status", "status"])
-                return redirect(pay["PaymentURL"])
-
-            intent_for_redirect.status = RentPaymentIntent.Status.CANCELED
-            intent_for_redirect.tb_status = str(pay.get("Status") or "")
-            intent_for_redirect.save(update_fields=["status", "tb_status"])
-            messages.error(request, "Не удалось создать оплату. Попробуйте ещё раз.")
-
-    week_days = [selected_week + timedelta(days=i) for i in range(7)]
-    week_start_dt = _slot_start(selected_week, 0)
-    week_end_dt = _slot_start(selected_week + timedelta(days=7), 0)
+    selected_slots = sorted({key.strip() for key in raw_slots if key.strip()})
     viewer_user_id = request.user.id if request.user.is_authenticated else None
-    busy_states = _busy_slot_states_for_week(
-        week_start=selected_week,
-        location=rent_location,
-        viewer_user_id=viewer_user_id,
-    )
-    now_local = timezone.localtime(timezone.now())
-
-    booked_slots = []
-    if viewer_user_id:
-        paid_rent_sessions = [
-            s for s in _sessions_for_location_between(
-                location=rent_location,
-                range_start=week_start_dt,
-                range_end=week_end_dt,
-            )
-            if s.kind == Session.Kind.RENT and s.client_id == viewer_user_id
-        ]
-        for s in paid_rent_sessions:
-            start_local = timezone.localtime(s.start_at)
-            end_local = start_local + timedelta(minutes=max(1, int(s.duration_min or 0)))
-            booked_slots.append({
-                "day_label": f"{_RU_WEEKDAYS[start_local.weekday()]}, {start_local.strftime('%d.%m')}",
-                "time_label": f"{start_local.strftime('%H:%M')}–{end_local.strftime('%H:%M')}",
-            })
+    week = _rent_week(rent_location, selected_week, viewer_user_id)
 
+    cell_states = {".": "", "-": "", "p": "pending", "b": "busy", "m": "rent_paid"}
     rows = []
-    for hour in range(RENT_OPEN_HOUR, RENT_CLOSE_HOUR):
+    for i, hour in enumerate(range(rent_location.open_hour, rent_location.close_hour)):
         row = {"label": f"{hour:02d}:00", "cells": []}
-        for day_obj in week_days:
-            cell_start = _slot_start(day_obj, hour)
-            key = _slot_key(cell_start)
-            state = busy_states.get(key, "")
-            is_busy = bool(state)
-            is_past = cell_start <= now_local
+        for day in week["days"]:
+            day_obj = date.fromisoformat(day["date"])
+            code = day["slots"][i]
+            key = _slot_key(_slot_start(day_obj, hour))
             row["cells"].append({
                 "key": key,
-                "state": state,
-                "is_busy": is_busy,
-                "is_past": is_past,
-                "is_selected": selected_slot == key,
+                "state": cell_states[code],
+                "is_busy": code in "pbm",
+                "is_past": code == _RENT_CELL_PAST,
+                "is_selected": key in selected_slots,
                 "label": f"{day_obj.strftime('%d.%m')} {hour:02d}:00-{(hour + 1):02d}:00",
             })
         rows.append(row)
 
-    show_my_paid_rent_legend = any(
-        cell.get("state") == "rent_paid"
-        for row in rows
-        for cell in row.get("cells", [])
-    )
-
-    selected_slot_label = _slot_label(selected_slot_start) if selected_slot_start else ""
-
     return render(request, "core/rent.html", {
         "location": rent_location,
-        "week_label": f"{week_days[0].strftime('%d.%m')} — {week_days[-1].strftime('%d.%m')}",
-        "prev_week_iso": (selected_week - timedelta(days=7)).isoformat(),
-        "next_week_iso": (selected_week + timedelta(days=7)).isoformat(),
-        "can_prev_week": selected_week > today,
+        "week_label": week["label"],
+        "prev_week_iso": week["prev"],
+        "next_week_iso": week["next"],
+        "can_prev_week": week["can_prev"],
         "days": [
-            {"iso": d.isoformat(), "weekday": _RU_WEEKDAYS[d.weekday()], "day": d.day}
-            for d in week_days
+            {"iso": d["date"], "weekday": d["weekday"], "day": d["day"]}
+            for d in week["days"]
         ],
         "rows": rows,
-        "selected_slot": selected_slot,
-        "selected_slot_label": selected_slot_label,
-        "price_rub": RENT_PRICE_RUB,
+        "selected_slots": selected_slots,
+        "selected_slot_label": _slots_label(filter(None, map(_parse_slot_key, selected_slots))),
+        "price_rub": rent_location.rent_price_rub,
+        "total_price_rub": rent_location.rent_price_rub * len(selected_slots),
+        "max_slots": RENT_MAX_SLOTS,
         "payment_ttl_min": RENT_PAYMENT_TTL_MIN,
         "wallet_balance": wallet_balance,
         "contact": contact,
         "selected_week_iso": selected_week.isoformat(),
-        "booked_slots": booked_slots,
+        "booked_slots": week["booked"],
         "show_paid_rent_details": bool(viewer_user_id),
-        "show_my_paid_rent_legend": show_my_paid_rent_legend,
+        "show_my_paid_rent_legend": bool(week["booked"]),
     })
 
 
+def rent_week_api(request):
+    """Неделя сетки аренды в JSON: смена недели без перезагрузки страницы."""
+    rent_location = _rent_location()
+    viewer_user_id = request.user.id if request.user.is_authenticated else None
+    week = _rent_week(rent_location, _selected_week(request), viewer_user_id)
+    if not viewer_user_id:
+        week.pop("booked")
+    week["price_rub"] = rent_location.rent_price_rub
+    return JsonResponse(week)
+
+
+@require_POST
+def rent_submit_api(request):
+    """Оформление аренды без перерисовки страницы: адрес перехода или ошибка с кодом."""
+    result = _submit_rent(request, _rent_location())
+    if result.redirect_url:
+        if result.success_message:
+            messages.success(request, result.success_message)
+        return JsonResponse({"ok": True, "redirect": result.redirect_url})
+    return JsonResponse(
+        {"ok": False, "error": result.error, "message": result.message, "taken": result.taken},
+        status=409 if result.error == "taken" else 400,
+    )
+
+
 def rent_pay_success(request, intent_id: int):
-    _expire_rent_payment_intents()
     intent = get_object_or_404(RentPaymentIntent, id=intent_id)
     back_week_iso = timezone.localtime(intent.slot_start).date().isoformat()
 
     if intent.status == RentPaymentIntent.Status.PAID:
         messages.success(request, "Оплата прошла. Бронь аренды подтверждена.")
         return redirect(f"{reverse('core:rent')}?week={back_week_iso}")
-    if intent.status == RentPaymentIntent.Status.CANCELED:
+    # истёкшее намерение отменит фоновый expire_rent_intents; читаем его как отменённое уже сейчас
+    if intent.status == RentPaymentIntent.Status.CANCELED or intent.expires_at <= timezone.now():
         messages.error(request, "Оплата не завершена или время на оплату истекло.")
         return redirect(f"{reverse('core:rent')}?week={back_week_iso}")
 
@@ -596,7 +547,6 @@ def rent_pay_success(request, intent_id: int):
 
 
 def rent_pay_fail(request, intent_id: int):
-    _expire_rent_payment_intents()
     intent = get_object_or_404(RentPaymentIntent, id=intent_id)
     back_week_iso = timezone.localtime(intent.slot_start).date().isoformat()
 
@@ -23,6 +23,7 @@ else:
 PY
 
 python manage.py migrate --noinput
+python manage.py createcachetable
 python manage.py collectstatic --noinput
 
 if [ "${WOOMFIT_SEED_DEMO:-0}" = "1" ]; then
@@ -33,9 +34,12 @@ python manage.py createsuperuser --noinput || true
 
 GUNICORN_WORKERS="${GUNICORN_WORKERS:-3}"
 GUNICORN_TIMEOUT="${GUNICORN_TIMEOUT:-120}"
+# потоки: long-poll /schedule/changes/ ждёт, не занимая целый воркер
+GUNICORN_THREADS="${GUNICORN_THREADS:-8}"
 
 exec gunicorn config.wsgi:application \
   --bind 0.0.0.0:8000 \
   --workers "${GUNICORN_WORKERS}" \
+  --threads "${GUNICORN_THREADS}" \
   --timeout "${GUNICORN_TIMEOUT}" \
   --access-logfile -
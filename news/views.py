@@ -1,9 +1,26 @@
 from django.core.paginator import Paginator
+from django.db.models import Count, Max
 from django.shortcuts import get_object_or_404, render
 
+from core.conditional import conditional_page
+
 from .models import NewsPost
 
 
+def _news_list_stamp(request):
+    # count ловит удаление и выход отложенной публикации, max(updated_at) — правки
+    agg = NewsPost.objects.published().aggregate(n=Count("id"), updated=Max("updated_at"), published=Max("published_at"))
+    return f"{agg['n']}:{agg['updated']}:{agg['published']}", agg["updated"]
+
+
+def _news_detail_stamp(request, slug: str):
+    updated_at = NewsPost.objects.published().filter(slug=slug).values_list("updated_at", flat=True).first()
+    if updated_at is None:
+        return None
+    return updated_at.isoformat(), updated_at
+
+
+@conditional_page(_news_list_stamp)
 def news_list(request):
     qs = NewsPost.objects.published().select_related().prefetch_related("images")
     paginator = Paginator(qs, 12)
@@ -11,6 +28,7 @@ def news_list(request):
     return render(request, "news/list.html", {"page": page})
 
 
+@conditional_page(_news_detail_stamp)
 def news_detail(request, slug: str):
     post = get_object_or_404(
         NewsPost.objects.published().prefetch_related("images"),
@@ -28,6 +28,12 @@ class Order(models.Model):
 
     fulfilled_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # сверка зависших оплат: status=payment_pending и created_at < порога
+            models.Index(fields=["status", "created_at"], name="order_status_created_idx"),
+        ]
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
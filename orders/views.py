@@ -1,6 +1,5 @@
 from decimal import Decimal
 
-from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ValidationError
@@ -10,7 +9,7 @@ from django.utils import timezone
 
 from core.legal import client_ip, is_checked
 from payments.receipt import build_receipt, receipt_item
-from payments.tbank import TBankClient
+from payments.tbank import TBankError, get_client
 from shop.cart import Cart
 from shop.models import Product
 
@@ -118,7 +117,7 @@ def checkout(request):
         cart.clear()
         return redirect("payments:success")
 
-    client = TBankClient(settings.TBANK_TERMINAL_KEY, settings.TBANK_PASSWORD, settings.TBANK_IS_TEST)
+    client = get_client()
 
     notification_url = request.build_absolute_uri(reverse("payments:tbank_webhook"))
     success_url = request.build_absolute_uri(reverse("payments:success"))
@@ -127,15 +126,18 @@ def checkout(request):
     total_kopeks = int(total) * 100
     receipt = _build_tbank_receipt_for_order(request, order, items, total_kopeks)
 
-    pay = client.init_payment(
-        order_id=str(order.id),
-        amount_kopeks=total_kopeks,  # ✅ копейки
-        description=f"WOOM FIT order #{order.id}",
-        notification_url=notification_url,
-        success_url=success_url,
-        fail_url=fail_url,
-        receipt=receipt,
-    )
+    try:
+        pay = client.init_payment(
+            order_id=str(order.id),
+            amount_kopeks=total_kopeks,  # ✅ копейки
+            description=f"WOOM FIT order #{order.id}",
+            notification_url=notification_url,
+            success_url=success_url,
+            fail_url=fail_url,
+            receipt=receipt,
+        )
+    except TBankError:
+        pay = {"Status": "INIT_FAILED"}
 
     if pay.get("Success"):
         order.tb_payment_id = str(pay.get("PaymentId") or "")
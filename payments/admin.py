@@ -1,6 +1,29 @@
 from django.contrib import admin
-from .models import PaymentWebhookLog
+from django.utils import timezone
+
+from .models import PaymentNotification, PaymentWebhookLog
 
 @admin.register(PaymentWebhookLog)
 class PaymentWebhookLogAdmin(admin.ModelAdmin):
-    list_display=("id","created_at")
+    list_display = ("id", "created_at", "order_id", "payment_id", "status", "success", "processing_result")
+    # точные совпадения — поиск идёт по индексам, а не по LIKE
+    search_fields = ("=order_id", "=payment_id")
+    list_filter = ("processing_result", "status")
+
+
+@admin.register(PaymentNotification)
+class PaymentNotificationAdmin(admin.ModelAdmin):
+    list_display = ("id", "order_id", "tb_payment_id", "status", "state", "attempts", "received_at", "processed_at")
+    search_fields = ("order_id", "tb_payment_id")
+    list_filter = ("state", "status")
+    readonly_fields = ("received_at", "processed_at", "last_error")
+    actions = ["retry_now"]
+
+    @admin.action(description="Обработать заново")
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(state=PaymentNotification.State.DONE).update(
+            state=PaymentNotification.State.PENDING,
+            attempts=0,
+            next_attempt_at=timezone.now(),
+        )
+        self.message_user(request, f"Вернули в очередь: {updated}")
@@ -0,0 +1,101 @@
+"""Разбор ящика уведомлений T-Bank (PaymentNotification).
+
+Уведомления одного OrderId применяются строго по порядку поступления:
+пока более раннее ждёт повтора, следующие за ним не трогаем. Ошибка
+откатывает применение целиком и откладывает попытку с растущей паузой;
+после MAX_ATTEMPTS уведомление уходит в dead и больше не блокирует заказ.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PaymentNotification, PaymentWebhookLog
+from .processing import process_notification
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SEC = 30
+BACKOFF_MAX_SEC = 60 * 60
+
+
+@dataclass
+class DrainResult:
+    done: int = 0
+    retried: int = 0
+    dead: int = 0
+
+
+def backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2 ** max(0, attempts - 1)))
+
+
+def _log_result(row: PaymentNotification, result: str) -> None:
+    # итог применения виден в журнале вебхука рядом с самой доставкой
+    PaymentWebhookLog.objects.filter(
+        order_id=row.order_id,
+        payment_id=row.tb_payment_id or "",
+        status=row.status,
+        processing_result=PaymentWebhookLog.Result.QUEUED,
+    ).update(processing_result=result)
+
+
+def _apply(row: PaymentNotification, *, max_attempts: int, result: DrainResult) -> bool:
+    """Применяет уведомление; False — заказ заблокирован до следующей попытки."""
+    row.attempts += 1
+    try:
+        with transaction.atomic():
+            process_notification(row.payload)
+            processed_at = timezone.now()
+            # объект в памяти меняем только после коммита: откат не оставит его DONE
+            PaymentNotification.objects.filter(pk=row.pk).update(
+                attempts=row.attempts,
+                state=PaymentNotification.State.DONE,
+                processed_at=processed_at,
+                last_error="",
+            )
+            _log_result(row, PaymentWebhookLog.Result.APPLIED)
+    except Exception as exc:
+        logger.exception("T-Bank notification #%s failed (attempt %s)", row.id, row.attempts)
+        # строка откатилась в PENDING — считаем повтор от этого же состояния
+        row.state = PaymentNotification.State.PENDING
+        row.processed_at = None
+        row.last_error = f"{type(exc).__name__}: {exc}"[:2000]
+        if row.attempts >= max_attempts:
+            row.state = PaymentNotification.State.DEAD
+            _log_result(row, PaymentWebhookLog.Result.DEAD)
+            result.dead += 1
+        else:
+            row.next_attempt_at = timezone.now() + backoff(row.attempts)
+            result.retried += 1
+        row.save(update_fields=["attempts", "state", "processed_at", "next_attempt_at", "last_error"])
+        return row.state == PaymentNotification.State.DEAD
+    row.state = PaymentNotification.State.DONE
+    row.processed_at = processed_at
+    row.last_error = ""
+    result.done += 1
+    return True
+
+
+def drain(*, batch: int = 100, max_attempts: int = MAX_ATTEMPTS, now: datetime | None = None) -> DrainResult:
+    """Применяет до batch готовых уведомлений в порядке поступления."""
+    now = now or timezone.now()
+    result = DrainResult()
+    blocked: set[str] = set()
+    pending = PaymentNotification.objects.filter(state=PaymentNotification.State.PENDING).order_by("id")
+    for row in pending.iterator(chunk_size=batch):
+        if result.done + result.retried + result.dead >= batch:
+            break
+        key = row.order_id or f"#{row.id}"
+        if key in blocked:
+            continue
+        if row.next_attempt_at > now:
+            # ждёт повтора — более поздние уведомления того же заказа ждут вместе с ним
+            blocked.add(key)
+            continue
+        if not _apply(row, max_attempts=max_attempts, result=result):
+            blocked.add(key)
+    return result
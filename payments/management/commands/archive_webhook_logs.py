@@ -0,0 +1,64 @@
+import gzip
+import json
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from core.cache import exclusive
+from payments.models import PaymentWebhookLog
+
+LOCK_NAME = "archive_webhook_logs"
+FIELDS = ("id", "created_at", "order_id", "payment_id", "status", "success", "processing_result", "payload")
+
+
+class Command(BaseCommand):
+    help = "Move webhook log rows older than N days into gzipped JSONL archive chunks and delete them from the table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=90, help="Keep rows newer than this many days")
+        parser.add_argument("--chunk", type=int, default=5000, help="Rows per archive file")
+        parser.add_argument("--dir", default=settings.PAYMENTS_ARCHIVE_DIR, help="Archive directory")
+
+    def handle(self, *args, **opts):
+        cutoff = timezone.now() - timedelta(days=max(0, opts["days"]))
+        chunk = max(1, opts["chunk"])
+        out_dir = Path(opts["dir"])
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        with exclusive(LOCK_NAME, timeout=60 * 60) as lock:
+            if lock is None:
+                self.stdout.write("Another archiver is running, exiting")
+                return
+            rows_total = files = 0
+            old = PaymentWebhookLog.objects.filter(created_at__lt=cutoff).order_by("created_at", "id")
+            while True:
+                # заархивированные строки удаляются, поэтому каждый раз берём голову заново
+                rows = list(old.values(*FIELDS)[:chunk])
+                if not rows:
+                    break
+                self._write(out_dir, rows)
+                PaymentWebhookLog.objects.filter(id__in=[r["id"] for r in rows]).delete()
+                rows_total += len(rows)
+                files += 1
+                lock.refresh()
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {rows_total} webhook log rows into {files} files in {out_dir}"))
+
+    def _write(self, out_dir: Path, rows: list[dict]) -> Path:
+        first, last = rows[0], rows[-1]
+        path = out_dir / f"webhook_log_{first['created_at']:%Y%m%d}_{first['id']}-{last['id']}.jsonl.gz"
+        part = path.with_name(path.name + ".part")
+        # строки удаляются только после того, как файл целиком лёг на диск
+        with open(part, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                for row in rows:
+                    gz.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False).encode() + b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(part, path)
+        return path
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.cache import exclusive
+from payments.inbox import MAX_ATTEMPTS, drain
+
+LOCK_NAME = "process_payment_notifications"
+
+
+class Command(BaseCommand):
+    help = "Apply queued T-Bank notifications in order per OrderId, with retries and a dead-letter state."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep draining until stopped")
+        parser.add_argument("--interval", type=float, default=2.0, help="Seconds to sleep when the inbox is empty")
+        parser.add_argument("--batch", type=int, default=100, help="Notifications per pass")
+        parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS, help="Attempts before a notification goes dead")
+
+    def handle(self, *args, **opts):
+        interval = max(0.1, float(opts["interval"]))
+        batch = max(1, int(opts["batch"]))
+        with exclusive(LOCK_NAME, timeout=int(interval * 4) + 300) as lock:
+            if lock is None:
+                self.stdout.write("Another worker is running, exiting")
+                return
+            while True:
+                result = drain(batch=batch, max_attempts=max(1, int(opts["max_attempts"])))
+                handled = result.done + result.retried + result.dead
+                if handled or not opts["loop"]:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Applied {result.done}, retry later {result.retried}, dead {result.dead}"
+                    ))
+                if not opts["loop"]:
+                    return
+                # полная пачка — сразу следующая, иначе ждём новых уведомлений
+                if handled < batch:
+                    time.sleep(interval)
+                if not lock.refresh():
+                    self.stdout.write("Worker lock lost, exiting")
+                    return
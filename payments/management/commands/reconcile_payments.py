@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.cache import exclusive
+from payments.reconcile import reconcile
+from payments.tbank import get_client
+
+LOCK_NAME = "reconcile_payments"
+
+
+class Command(BaseCommand):
+    help = "Ask T-Bank (GetState) about orders and intents stuck in pending and apply final statuses. Run from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=10, help="Minutes a payment must be pending before it is checked")
+        parser.add_argument("--limit", type=int, default=1000, help="Max rows per kind (orders, session and rent intents)")
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent GetState requests")
+
+    def handle(self, *args, **opts):
+        with exclusive(LOCK_NAME, timeout=15 * 60) as lock:
+            if lock is None:
+                self.stdout.write("Another reconciliation is running, exiting")
+                return
+            result = reconcile(
+                get_client(),
+                older_than=timedelta(minutes=max(0, opts["older_than"])),
+                limit=max(1, opts["limit"]),
+                workers=opts["workers"],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {result.checked} in {result.elapsed:.2f}s ({result.rate:.1f}/s): "
+            f"fixed {result.fixed} (paid {result.paid}, canceled {result.canceled}), "
+            f"still pending {result.still_pending}, errors {result.errors}"
+        ))
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.tbank_stub import TBankStub
+
+
+class Command(BaseCommand):
+    help = "Run a local fake T-Bank API (Init, GetState). Point TBANK_BASE_URL at the printed URL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8099)
+        parser.add_argument("--latency-ms", type=int, default=0, help="Artificial delay per request")
+
+    def handle(self, *args, **opts):
+        stub = TBankStub(
+            opts["host"],
+            opts["port"],
+            terminal_key=settings.TBANK_TERMINAL_KEY,
+            password=settings.TBANK_PASSWORD,
+            latency=max(0, opts["latency_ms"]) / 1000,
+        )
+        self.stdout.write(f"T-Bank stub listening, TBANK_BASE_URL={stub.base_url}")
+        try:
+            stub.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.stop()
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentNotification",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("tb_payment_id", models.CharField(max_length=64, verbose_name="TBank payment id")),
+                ("status", models.CharField(max_length=32, verbose_name="Статус")),
+                ("order_id", models.CharField(blank=True, default="", max_length=64, verbose_name="OrderId")),
+                ("payload", models.JSONField()),
+                ("received_at", models.DateTimeField(auto_now_add=True, verbose_name="Получено")),
+            ],
+            options={
+                "verbose_name": "Уведомление T-Bank",
+                "verbose_name_plural": "Уведомления T-Bank",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="paymentnotification",
+            constraint=models.UniqueConstraint(fields=("tb_payment_id", "status"), name="uniq_tb_notification"),
+        ),
+    ]
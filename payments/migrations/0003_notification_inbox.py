@@ -0,0 +1,58 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_done(apps, schema_editor):
+    # до появления ящика уведомления применялись сразу в вебхуке
+    PaymentNotification = apps.get_model("payments", "PaymentNotification")
+    PaymentNotification.objects.update(state="done", processed_at=F("received_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0002_payment_notification"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="paymentnotification",
+            name="attempts",
+            field=models.PositiveSmallIntegerField(default=0, verbose_name="Попыток"),
+        ),
+        migrations.AddField(
+            model_name="paymentnotification",
+            name="last_error",
+            field=models.TextField(blank=True, default="", verbose_name="Последняя ошибка"),
+        ),
+        migrations.AddField(
+            model_name="paymentnotification",
+            name="next_attempt_at",
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name="Следующая попытка"),
+        ),
+        migrations.AddField(
+            model_name="paymentnotification",
+            name="processed_at",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Обработано"),
+        ),
+        migrations.AddField(
+            model_name="paymentnotification",
+            name="state",
+            field=models.CharField(choices=[("pending", "Ожидает обработки"), ("done", "Обработано"), ("dead", "Не удалось обработать")], default="pending", max_length=8, verbose_name="Состояние"),
+        ),
+        migrations.AlterField(
+            model_name="paymentnotification",
+            name="tb_payment_id",
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name="TBank payment id"),
+        ),
+        migrations.AddIndex(
+            model_name="paymentnotification",
+            index=models.Index(fields=["state", "id"], name="tbnotif_state_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="paymentnotification",
+            index=models.Index(fields=["order_id", "state"], name="tbnotif_order_state_idx"),
+        ),
+        migrations.RunPython(mark_existing_done, migrations.RunPython.noop),
+    ]
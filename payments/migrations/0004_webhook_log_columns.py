@@ -0,0 +1,74 @@
+from django.db import migrations, models
+
+BATCH = 1000
+
+
+def backfill_columns(apps, schema_editor):
+    # раскладываем payload уже накопленных записей по новым колонкам
+    PaymentWebhookLog = apps.get_model("payments", "PaymentWebhookLog")
+    last_id = 0
+    while True:
+        rows = list(PaymentWebhookLog.objects.filter(id__gt=last_id).order_by("id")[:BATCH])
+        if not rows:
+            break
+        for row in rows:
+            data = row.payload if isinstance(row.payload, dict) else {}
+            success = data.get("Success")
+            row.order_id = str(data.get("OrderId") or "").strip()[:64]
+            row.payment_id = str(data.get("PaymentId") or "").strip()[:64]
+            row.status = str(data.get("Status") or "").strip()[:32]
+            row.success = None if success is None else str(success).lower() in ("true", "1", "yes")
+        PaymentWebhookLog.objects.bulk_update(rows, ["order_id", "payment_id", "status", "success"])
+        last_id = rows[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0003_notification_inbox"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="paymentwebhooklog",
+            options={"verbose_name": "Журнал вебхука T-Bank", "verbose_name_plural": "Журнал вебхука T-Bank"},
+        ),
+        migrations.AddField(
+            model_name="paymentwebhooklog",
+            name="order_id",
+            field=models.CharField(blank=True, default="", max_length=64, verbose_name="OrderId"),
+        ),
+        migrations.AddField(
+            model_name="paymentwebhooklog",
+            name="payment_id",
+            field=models.CharField(blank=True, default="", max_length=64, verbose_name="PaymentId"),
+        ),
+        migrations.AddField(
+            model_name="paymentwebhooklog",
+            name="processing_result",
+            field=models.CharField(blank=True, choices=[("queued", "В очереди"), ("applied", "Применено"), ("dead", "Не удалось применить"), ("invalid_token", "Неверная подпись")], default="", max_length=16, verbose_name="Результат"),
+        ),
+        migrations.AddField(
+            model_name="paymentwebhooklog",
+            name="status",
+            field=models.CharField(blank=True, default="", max_length=32, verbose_name="Статус"),
+        ),
+        migrations.AddField(
+            model_name="paymentwebhooklog",
+            name="success",
+            field=models.BooleanField(blank=True, null=True, verbose_name="Success"),
+        ),
+        migrations.AddIndex(
+            model_name="paymentwebhooklog",
+            index=models.Index(fields=["order_id", "created_at"], name="tblog_order_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="paymentwebhooklog",
+            index=models.Index(fields=["payment_id", "created_at"], name="tblog_payment_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="paymentwebhooklog",
+            index=models.Index(fields=["created_at"], name="tblog_created_idx"),
+        ),
+        migrations.RunPython(backfill_columns, migrations.RunPython.noop),
+    ]
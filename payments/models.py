@@ -1,4 +1,98 @@
 from django.db import models
+from django.utils import timezone
+
+
+def _payload_fields(data) -> dict:
+    """Поля уведомления T-Bank, по которым ищут историю платежа."""
+    if not isinstance(data, dict):
+        return {}
+    success = data.get("Success")
+    return {
+        "order_id": str(data.get("OrderId") or "").strip()[:64],
+        "payment_id": str(data.get("PaymentId") or "").strip()[:64],
+        "status": str(data.get("Status") or "").strip()[:32],
+        "success": None if success is None else str(success).lower() in ("true", "1", "yes"),
+    }
+
+
 class PaymentWebhookLog(models.Model):
+    """Журнал входящих уведомлений T-Bank.
+
+    Ключевые поля payload разложены по индексированным колонкам при вставке:
+    история заказа — поиск по индексу, а не разбор JSON. Старые записи
+    уносит в сжатые архивы команда archive_webhook_logs.
+    """
+
+    class Result(models.TextChoices):
+        QUEUED = "queued", "В очереди"
+        APPLIED = "applied", "Применено"
+        DEAD = "dead", "Не удалось применить"
+        INVALID_TOKEN = "invalid_token", "Неверная подпись"
+
     created_at = models.DateTimeField(auto_now_add=True)
     payload = models.JSONField()
+
+    order_id = models.CharField("OrderId", max_length=64, blank=True, default="")
+    payment_id = models.CharField("PaymentId", max_length=64, blank=True, default="")
+    status = models.CharField("Статус", max_length=32, blank=True, default="")
+    success = models.BooleanField("Success", null=True, blank=True)
+    # пусто — запись сделана до появления колонки
+    processing_result = models.CharField("Результат", max_length=16, choices=Result.choices, blank=True, default="")
+
+    class Meta:
+        verbose_name = "Журнал вебхука T-Bank"
+        verbose_name_plural = "Журнал вебхука T-Bank"
+        indexes = [
+            models.Index(fields=["order_id", "created_at"], name="tblog_order_idx"),
+            models.Index(fields=["payment_id", "created_at"], name="tblog_payment_idx"),
+            models.Index(fields=["created_at"], name="tblog_created_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.order_id or self.payment_id}: {self.status} ({self.processing_result})"
+
+    @classmethod
+    def record(cls, data, result: str) -> "PaymentWebhookLog":
+        return cls.objects.create(payload=data, processing_result=result, **_payload_fields(data))
+
+
+class PaymentNotification(models.Model):
+    """Входящий ящик уведомлений T-Bank.
+
+    Вебхук только проверяет подпись и кладёт сюда payload; применяет их
+    команда process_payment_notifications — по порядку внутри OrderId, с
+    повторами и отказом в dead после исчерпания попыток. Пара
+    (PaymentId, Status) уникальна: повтор доставки отсекается одним поиском.
+    """
+
+    class State(models.TextChoices):
+        PENDING = "pending", "Ожидает обработки"
+        DONE = "done", "Обработано"
+        DEAD = "dead", "Не удалось обработать"
+
+    # null — уведомление без PaymentId: дедупликации не подлежит
+    tb_payment_id = models.CharField("TBank payment id", max_length=64, null=True, blank=True)
+    status = models.CharField("Статус", max_length=32)
+    order_id = models.CharField("OrderId", max_length=64, blank=True, default="")
+    payload = models.JSONField()
+    received_at = models.DateTimeField("Получено", auto_now_add=True)
+
+    state = models.CharField("Состояние", max_length=8, choices=State.choices, default=State.PENDING)
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    next_attempt_at = models.DateTimeField("Следующая попытка", default=timezone.now)
+    last_error = models.TextField("Последняя ошибка", blank=True, default="")
+    processed_at = models.DateTimeField("Обработано", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Уведомление T-Bank"
+        verbose_name_plural = "Уведомления T-Bank"
+        constraints = [
+            models.UniqueConstraint(fields=["tb_payment_id", "status"], name="uniq_tb_notification"),
+        ]
+        indexes = [
+            models.Index(fields=["state", "id"], name="tbnotif_state_idx"),
+            models.Index(fields=["order_id", "state"], name="tbnotif_order_state_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.order_id or self.tb_payment_id}: {self.status}"
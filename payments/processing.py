@@ -0,0 +1,223 @@
+"""Применение уведомлений T-Bank к заказам, разовым оплатам и аренде.
+
+Вызывается воркером ящика уведомлений (payments.inbox). Каждая ветка
+блокирует свой объект оплаты, поэтому повторное применение безопасно.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.telegram_notify import (
+    notify_booking_created,
+    notify_order_payment,
+    notify_rent_request_paid,
+    notify_session_payment,
+)
+from loyalty.services import add_spent
+from orders.models import Order
+from orders.services import fulfill_order
+from schedule import rent
+from schedule.models import Booking, PaymentIntent, RentPaymentIntent, SessionFull
+
+# итоговые статусы T-Bank; промежуточные (NEW, AUTHORIZED, ...) после них
+# приходят только с опозданием и не должны затирать tb_status
+FINAL_TB_STATUSES = {
+    "CONFIRMED", "CANCELED", "REJECTED", "DEADLINE_EXPIRED", "AUTH_FAIL",
+    "REVERSED", "PARTIAL_REVERSED", "REFUNDED", "PARTIAL_REFUNDED",
+}
+
+
+def _is_late(status: str, terminal: bool) -> bool:
+    return terminal and status.upper() not in FINAL_TB_STATUSES
+
+
+def _order_purchase_summary(order: Order, *, max_items: int = 5, max_len: int = 220) -> str:
+    items = list(order.items.all())
+    if not items:
+        return ""
+
+    parts = []
+    for it in items[:max_items]:
+        qty = int(it.qty or 0)
+        name = (it.product_name or "").strip() or "Товар"
+        parts.append(f"{name} x{qty}")
+    if len(items) > max_items:
+        parts.append(f"+{len(items) - max_items} поз.")
+
+    summary = ", ".join(parts).strip()
+    if len(summary) <= max_len:
+        return summary
+    return summary[: max_len - 1].rstrip() + "…"
+
+
+def _create_single_visit_membership(user):
+    from memberships.models import Membership
+
+    return Membership.objects.create(
+        user=user,
+        title="Разовое посещение",
+        kind=Membership.Kind.VISITS,
+        scope=Membership.Scope.GROUP,
+        total_visits=1,
+        left_visits=1,
+        is_active=True,
+    )
+
+
+def _finalize_rent_intent(intent_id: int, tb_status: str) -> None:
+    with transaction.atomic():
+        locked = RentPaymentIntent.objects.select_for_update().filter(id=intent_id).first()
+        if not locked:
+            return
+
+        locked.tb_status = tb_status
+        if locked.status == RentPaymentIntent.Status.PAID:
+            locked.save(update_fields=["tb_status"])
+            return
+        if locked.status == RentPaymentIntent.Status.CANCELED:
+            locked.save(update_fields=["tb_status"])
+            return
+
+        now = timezone.now()
+        if locked.expires_at <= now:
+            locked.status = RentPaymentIntent.Status.CANCELED
+            locked.save(update_fields=["tb_status", "status"])
+            return
+
+        # все слоты намерения проверяются одним запросом и оформляются вместе
+        if rent.busy_runs(locked.hall_id, rent.slot_runs(rent.intent_slots(locked)), lock=True):
+            locked.status = RentPaymentIntent.Status.CANCELED
+            locked.tb_status = "SLOT_CONFLICT"
+            locked.save(update_fields=["tb_status", "status"])
+            return
+
+        booked = rent.book(locked, paid_at=now, tb_status=tb_status)
+
+        # уведомления — только после коммита: откат и повтор из ящика не шлют их дважды
+        def notify():
+            for rent_session, rent_request in booked:
+                notify_rent_request_paid(session=rent_session, request_obj=rent_request)
+        transaction.on_commit(notify)
+
+
+def _process_order(order_id: int, status: str, success: bool) -> None:
+    order = Order.objects.select_for_update().filter(id=order_id).first()
+    if not order or _is_late(status, order.status in ("paid", "canceled")):
+        return
+    order.tb_status = status
+    if success and status.upper() == "CONFIRMED":
+        was_paid = (order.status == "paid")
+        order.status = "paid"
+        order.save(update_fields=["tb_status", "status"])
+        if not was_paid:
+            fulfill_order(order)
+            if order.user_id:
+                add_spent(order.user, Decimal(str(order.total_rub)))
+            purchase = _order_purchase_summary(order)
+            transaction.on_commit(lambda: notify_order_payment(
+                user=order.user,
+                order_id=order.id,
+                amount_rub=order.total_rub,
+                method="Онлайн (T-Bank)",
+                purchase=purchase,
+            ))
+        return
+    if status.upper() in ("CANCELED", "REJECTED", "DEADLINE_EXPIRED") and order.status != "paid":
+        order.status = "canceled"
+    order.save(update_fields=["tb_status", "status"])
+
+
+def _process_session_intent(intent_id: int, status: str, success: bool) -> None:
+    intent = PaymentIntent.objects.select_for_update().filter(id=intent_id).first()
+    if not intent or _is_late(status, intent.status in (PaymentIntent.Status.PAID, PaymentIntent.Status.CANCELED)):
+        return
+    intent.tb_status = status
+
+    if success and status.upper() == "CONFIRMED":
+        if intent.status == PaymentIntent.Status.PAID:
+            # повтор подтверждения: абонемент и запись уже выданы
+            intent.save(update_fields=["tb_status"])
+            return
+        intent.status = PaymentIntent.Status.PAID
+        intent.paid_at = timezone.now()
+        intent.save(update_fields=["tb_status", "status", "paid_at"])
+        add_spent(intent.user, Decimal(str(intent.amount_rub)))
+
+        # после оплаты создаём абонемент на 1 посещение и сразу списываем
+        m = _create_single_visit_membership(intent.user)
+        try:
+            with transaction.atomic():
+                m.consume_visit()
+                b, _ = Booking.objects.get_or_create(user=intent.user, session=intent.session)
+                b.session = intent.session
+                b.booking_status = Booking.Status.BOOKED
+                b.canceled_at = None
+                b.membership = m
+                b.invite_sent_at = None
+                b.invite_expires_at = None
+                b.save(update_fields=[
+                    "booking_status",
+                    "canceled_at",
+                    "membership",
+                    "invite_sent_at",
+                    "invite_expires_at",
+                ])
+        except SessionFull:
+            # последнее место заняли, пока клиент платил: посещение остаётся на абонементе
+            booked = False
+        else:
+            booked = True
+
+        def notify():
+            notify_session_payment(
+                user=intent.user,
+                session=intent.session,
+                amount_rub=intent.amount_rub,
+                method="Онлайн (T-Bank)",
+            )
+            if booked:
+                notify_booking_created(
+                    user=intent.user,
+                    session=intent.session,
+                    source="Разовая оплата (онлайн)",
+                )
+        transaction.on_commit(notify)
+        return
+
+    if status.upper() in ("CANCELED", "REJECTED", "DEADLINE_EXPIRED") and intent.status != PaymentIntent.Status.PAID:
+        intent.status = PaymentIntent.Status.CANCELED
+    intent.save(update_fields=["tb_status", "status"])
+
+
+def _process_rent_intent(intent_id: int, status: str, success: bool) -> None:
+    if success and status.upper() == "CONFIRMED":
+        _finalize_rent_intent(intent_id, status)
+        return
+    intent = RentPaymentIntent.objects.select_for_update().filter(id=intent_id).first()
+    if not intent or _is_late(status, intent.status in (RentPaymentIntent.Status.PAID, RentPaymentIntent.Status.CANCELED)):
+        return
+    intent.tb_status = status
+    if status.upper() in ("CANCELED", "REJECTED", "DEADLINE_EXPIRED") and intent.status != RentPaymentIntent.Status.PAID:
+        intent.status = RentPaymentIntent.Status.CANCELED
+    intent.save(update_fields=["tb_status", "status"])
+
+
+def process_notification(data: dict) -> None:
+    """Применяет уведомление T-Bank. Идемпотентно: объект оплаты блокируется,
+    и повторное подтверждение уже оплаченного ничего не выдаёт второй раз."""
+    order_id = str(data.get("OrderId", "")).strip()
+    status = str(data.get("Status", "")).strip()
+    success = str(data.get("Success", "")).lower() in ("true", "1", "yes")
+    prefix, _, raw_id = order_id.partition("-")
+
+    with transaction.atomic():
+        if order_id.isdigit():
+            # --- заказы магазина ---
+            _process_order(int(order_id), status, success)
+        elif prefix == "S" and raw_id.isdigit():
+            # --- оплата разового занятия: OrderId = S-<intent_id> ---
+            _process_session_intent(int(raw_id), status, success)
+        elif prefix == "R" and raw_id.isdigit():
+            # --- оплата аренды: OrderId = R-<intent_id> ---
+            _process_rent_intent(int(raw_id), status, success)
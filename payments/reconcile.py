@@ -0,0 +1,102 @@
+"""Сверка зависших оплат с T-Bank через GetState.
+
+Если уведомление потерялось, заказ или намерение навсегда остаются в
+ожидании оплаты. Сверка выбирает такие строки старше порога (по индексам
+(status, created_at)), спрашивает у шлюза их состояние пулом потоков и
+применяет итоговые статусы тем же кодом, что и вебхук (process_notification).
+HTTP идёт в потоках, вся работа с БД — в вызывающем потоке.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Iterator
+
+from django.utils import timezone
+
+from orders.models import Order
+from schedule.models import PaymentIntent, RentPaymentIntent
+
+from .processing import process_notification
+from .tbank import POOL_SIZE, TBankClient, TBankError, TBankUnavailable
+
+logger = logging.getLogger(__name__)
+
+# итоговые статусы, которые умеет применять process_notification
+FINAL_STATUSES = {"CONFIRMED", "CANCELED", "REJECTED", "DEADLINE_EXPIRED"}
+
+
+@dataclass
+class ReconcileResult:
+    checked: int = 0
+    paid: int = 0
+    canceled: int = 0
+    still_pending: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def fixed(self) -> int:
+        return self.paid + self.canceled
+
+    @property
+    def rate(self) -> float:
+        return self.checked / self.elapsed if self.elapsed else 0.0
+
+
+def stale_payments(older_than: timedelta, limit: int) -> Iterator[tuple[str, str]]:
+    """(OrderId, PaymentId) ожидающих оплаты строк, созданных раньше порога."""
+    cutoff = timezone.now() - older_than
+    sources = [
+        (Order.objects.filter(status="payment_pending", created_at__lt=cutoff), "{}"),
+        (PaymentIntent.objects.filter(status=PaymentIntent.Status.PENDING, created_at__lt=cutoff), "S-{}"),
+        (RentPaymentIntent.objects.filter(status=RentPaymentIntent.Status.PENDING, created_at__lt=cutoff), "R-{}"),
+    ]
+    for qs, order_id in sources:
+        rows = qs.exclude(tb_payment_id="").order_by("created_at").values_list("id", "tb_payment_id")[:limit]
+        for pk, payment_id in rows:
+            yield order_id.format(pk), payment_id
+
+
+def reconcile(client: TBankClient, *, older_than: timedelta, limit: int = 1000, workers: int = 8) -> ReconcileResult:
+    result = ReconcileResult()
+    started = time.monotonic()
+    candidates = list(stale_payments(older_than, limit))
+    # потоков не больше, чем соединений в пуле клиента
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, POOL_SIZE))) as pool:
+        futures = {pool.submit(client.get_state, payment_id): order_id for order_id, payment_id in candidates}
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            order_id = futures[future]
+            result.checked += 1
+            try:
+                state = future.result()
+            except TBankUnavailable:
+                # шлюз лежит: остальные запросы отменяем, досверим в следующий запуск
+                result.errors += 1
+                for pending in futures:
+                    pending.cancel()
+                continue
+            except TBankError as exc:
+                logger.warning("GetState for %s failed: %s", order_id, exc)
+                result.errors += 1
+                continue
+
+            status = str(state.get("Status", "")).upper()
+            if not state.get("Success") or status not in FINAL_STATUSES:
+                result.still_pending += 1
+                continue
+            process_notification({
+                "OrderId": order_id,
+                "PaymentId": state.get("PaymentId"),
+                "Status": status,
+                "Success": True,
+            })
+            if status == "CONFIRMED":
+                result.paid += 1
+            else:
+                result.canceled += 1
+    result.elapsed = time.monotonic() - started
+    return result
@@ -1,16 +1,120 @@
 import hashlib
+import logging
+import random
+import threading
+import time
+
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+PRODUCTION_URL = "https://rest-api.tinkoff.ru/v2"
+TEST_URL = "https://rest-api-test.tinkoff.ru/v2"
+
+# (connect, read): подключение к шлюзу должно быть быстрым, ответ Init — нет
+TIMEOUT = (3.05, 15)
+RETRIES = 2
+RETRY_BACKOFF_SEC = 0.2
+POOL_SIZE = 10
+# ответы, после которых шлюз точно не провёл запрос; 502/504 сюда не входят:
+# за таймаутом прокси платёж мог уже создаться
+RETRY_STATUSES = {429, 503}
+
+
+class TBankError(Exception):
+    """Шлюз недоступен или ответил не 2xx (после всех повторов)."""
+
+
+class TBankUnavailable(TBankError):
+    """Цепь разомкнута: шлюз недавно падал, запрос даже не отправляем."""
+
+
+class CircuitBreaker:
+    """После threshold сбоев подряд отвечает отказом reset_after секунд,
+    затем пропускает один пробный запрос: успех замыкает цепь, сбой — снова размыкает."""
+
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._probing or self.clock() - self.opened_at < self.reset_after:
+                return False
+            self._probing = True
+            return True
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                if self.opened_at is None or self._probing:
+                    logger.warning("T-Bank circuit opened after %s failures", self.failures)
+                self.opened_at = self.clock()
+            self._probing = False
 
 
 class TBankClient:
-    def __init__(self, terminal_key, password, is_test=True):
+    """Клиент T-Bank API.
+
+    Соединения держит пул requests.Session (keep-alive, без TLS-рукопожатия на
+    каждый платёж). Сбои транспорта и 429/5xx повторяются с экспоненциальной
+    паузой и джиттером — но Init только тогда, когда запрос точно не дошёл до
+    шлюза (нет соединения, 429, 503), иначе можно создать второй платёж.
+    Повторяющиеся сбои размыкают CircuitBreaker, и пока шлюз лежит, вызовы
+    сразу падают с TBankUnavailable.
+    """
+
+    def __init__(
+        self,
+        terminal_key,
+        password,
+        is_test=True,
+        *,
+        base_url: str | None = None,
+        timeout=TIMEOUT,
+        retries: int = RETRIES,
+        retry_backoff: float = RETRY_BACKOFF_SEC,
+        breaker: CircuitBreaker | None = None,
+        session: requests.Session | None = None,
+    ):
         self.terminal_key = terminal_key
         self.password = password
-        self.base_url = (
-            "https://rest-api-test.tinkoff.ru/v2"
-            if is_test
-            else "https://rest-api.tinkoff.ru/v2"
-        )
+        self.base_url = (base_url or (TEST_URL if is_test else PRODUCTION_URL)).rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.session = session or self._make_session()
+
+    @staticmethod
+    def _make_session() -> requests.Session:
+        session = requests.Session()
+        # повторы делаем сами: urllib3 не знает, какие вызовы безопасно повторять
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
 
     def _token(self, payload: dict) -> str:
         data = payload.copy()
@@ -88,6 +192,77 @@ class TBankClient:
 
         payload["Token"] = self._token(payload)
 
-        r = requests.post(f"{self.base_url}/Init", json=payload, timeout=15)
-        r.raise_for_status()
-        return r.json()
+        return self._post("Init", payload, idempotent=False)
+
+    def get_state(self, payment_id: str) -> dict:
+        payload = {"TerminalKey": self.terminal_key, "PaymentId": str(payment_id)}
+        payload["Token"] = self._token(payload)
+        return self._post("GetState", payload, idempotent=True)
+
+    def _sleep_before_retry(self, attempt: int) -> None:
+        # полный джиттер: повторы разных воркеров не бьют в шлюз одновременно
+        time.sleep(random.uniform(0, self.retry_backoff * 2 ** attempt))
+
+    def _post(self, method: str, payload: dict, *, idempotent: bool) -> dict:
+        if not self.breaker.allow():
+            raise TBankUnavailable(f"T-Bank {method}: circuit open")
+
+        url = f"{self.base_url}/{method}"
+        attempt = 0
+        while True:
+            cause = None
+            try:
+                r = self.session.post(url, json=payload, timeout=self.timeout)
+            except requests.RequestException as exc:
+                # обрыв после отправки повторяем только у идемпотентных вызовов
+                cause, reason, retryable = exc, str(exc), idempotent or _not_sent(exc)
+            else:
+                if r.status_code < 400:
+                    try:
+                        data = r.json()
+                    except ValueError as exc:
+                        # HTML-страница прокси вместо ответа API
+                        cause, reason, retryable = exc, "response is not JSON", idempotent
+                    else:
+                        self.breaker.success()
+                        return data
+                elif r.status_code < 500 and r.status_code != 429:
+                    # шлюз жив, ошибка в самом запросе — цепь не размыкаем
+                    self.breaker.success()
+                    raise TBankError(f"T-Bank {method}: HTTP {r.status_code}")
+                else:
+                    reason = f"HTTP {r.status_code}"
+                    retryable = idempotent or r.status_code in RETRY_STATUSES
+            if not retryable or attempt >= self.retries:
+                self.breaker.failure()
+                raise TBankError(f"T-Bank {method}: {reason}") from cause
+            self._sleep_before_retry(attempt)
+            attempt += 1
+
+
+def _not_sent(exc: requests.RequestException) -> bool:
+    """Запрос не ушёл в шлюз: не удалось подключиться."""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+_shared: TBankClient | None = None
+_shared_lock = threading.Lock()
+
+
+def get_client() -> TBankClient:
+    """Общий клиент процесса: пул соединений и CircuitBreaker живут между запросами."""
+    global _shared
+    base_url = settings.TBANK_BASE_URL or (TEST_URL if settings.TBANK_IS_TEST else PRODUCTION_URL)
+    client = _shared
+    if (
+        client is None
+        or client.terminal_key != settings.TBANK_TERMINAL_KEY
+        or client.password != settings.TBANK_PASSWORD
+        or client.base_url != base_url.rstrip("/")
+    ):
+        with _shared_lock:
+            client = _shared = TBankClient(settings.TBANK_TERMINAL_KEY, settings.TBANK_PASSWORD, base_url=base_url)
+    return client
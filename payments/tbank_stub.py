@@ -0,0 +1,142 @@
+"""Локальная заглушка T-Bank API для интеграционных тестов и замеров задержки.
+
+Понимает Init и GetState, держит keep-alive (HTTP/1.1) и умеет изображать
+сбои: очередь кодов ответа fail_next (0 — HTML-страница с кодом 200) и искусственную задержку latency.
+Клиент направляется сюда через TBANK_BASE_URL или base_url= конструктора.
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def setup(self):
+        super().setup()
+        with self.server.stub.lock:
+            self.server.stub.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        stub = self.server.stub
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        method = self.path.rstrip("/").rsplit("/", 1)[-1]
+        if stub.latency:
+            time.sleep(stub.latency)
+        with stub.lock:
+            stub.calls.append(method)
+            fail = stub.fail_next.pop(0) if stub.fail_next else None
+        if fail == 0:
+            return self._reply_raw(200, b"<html><body>Bad gateway</body></html>", "text/html")
+        if fail:
+            return self._reply(fail, {"Success": False, "ErrorCode": "9999", "Message": "stub failure"})
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return self._reply(400, {"Success": False, "ErrorCode": "9999", "Message": "bad json"})
+        handler = {"Init": stub.init, "GetState": stub.get_state}.get(method)
+        if handler is None:
+            return self._reply(404, {"Success": False, "ErrorCode": "9999", "Message": "unknown method"})
+        return self._reply(200, handler(payload))
+
+    def _reply(self, status: int, data: dict):
+        self._reply_raw(status, json.dumps(data).encode(), "application/json")
+
+    def _reply_raw(self, status: int, raw: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    stub: "TBankStub"
+
+
+class TBankStub:
+    """Заглушка в отдельном потоке: with TBankStub() as stub: ... stub.base_url."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, *, terminal_key: str = "", password: str = "", latency: float = 0.0):
+        self.terminal_key = terminal_key
+        self.password = password
+        self.latency = latency
+        self.fail_next: list[int] = []
+        self.calls: list[str] = []
+        self.connections = 0
+        self.payments: dict[str, dict] = {}
+        self.lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.stub = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v2"
+
+    def _token_ok(self, payload: dict) -> bool:
+        if not self.password:
+            return True
+        data = {k: v for k, v in payload.items() if k != "Token" and v is not None and not isinstance(v, (dict, list, tuple))}
+        data["Password"] = self.password
+        raw = "".join(str(data[k]) for k in sorted(data))
+        return hashlib.sha256(raw.encode()).hexdigest() == str(payload.get("Token", "")).lower()
+
+    def init(self, payload: dict) -> dict:
+        if not self._token_ok(payload):
+            return {"Success": False, "ErrorCode": "204", "Message": "Неверный токен"}
+        with self.lock:
+            payment_id = str(100000 + len(self.payments) + 1)
+            self.payments[payment_id] = {
+                "OrderId": str(payload.get("OrderId", "")),
+                "Amount": payload.get("Amount"),
+                "Status": "NEW",
+            }
+        return {
+            "Success": True,
+            "ErrorCode": "0",
+            "TerminalKey": payload.get("TerminalKey", self.terminal_key),
+            "Status": "NEW",
+            "PaymentId": payment_id,
+            "OrderId": payload.get("OrderId"),
+            "Amount": payload.get("Amount"),
+            "PaymentURL": f"{self.base_url.rsplit('/v2', 1)[0]}/pay/{payment_id}",
+        }
+
+    def get_state(self, payload: dict) -> dict:
+        if not self._token_ok(payload):
+            return {"Success": False, "ErrorCode": "204", "Message": "Неверный токен"}
+        payment = self.payments.get(str(payload.get("PaymentId", "")))
+        if payment is None:
+            return {"Success": False, "ErrorCode": "7", "Message": "Платёж не найден"}
+        return {"Success": True, "ErrorCode": "0", "PaymentId": payload["PaymentId"], **payment}
+
+    def set_status(self, payment_id: str, status: str) -> None:
+        with self.lock:
+            self.payments[str(payment_id)]["Status"] = status
+
+    def start(self) -> "TBankStub":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "TBankStub":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,414 @@
+import gzip
+import io
+import json
+import tempfile
+from datetime import datetime, time, timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from memberships.models import Membership
+from orders.models import Order
+from payments import inbox
+from payments.models import PaymentNotification, PaymentWebhookLog
+from payments.processing import process_notification
+from payments.tbank import CircuitBreaker, TBankClient, TBankError, TBankUnavailable
+from payments.tbank_stub import TBankStub
+from schedule.models import Booking, PaymentIntent, Session, Trainer
+
+
+def _session_intent(test):
+    test.user = get_user_model().objects.create_user(
+        username="payer",
+        password="pass12345",
+        phone="79000000071",
+        email="payer@example.com",
+    )
+    start = timezone.make_aware(
+        datetime.combine(timezone.localdate() + timedelta(days=1), time(hour=10)),
+        timezone.get_current_timezone(),
+    )
+    test.session = Session.objects.create(
+        title="Stretch",
+        start_at=start,
+        duration_min=50,
+        location="Сакко и Ванцетти, 93а",
+        trainer=Trainer.objects.create(name="Coach"),
+        capacity=5,
+    )
+    test.intent = PaymentIntent.objects.create(user=test.user, session=test.session, amount_rub=900)
+
+
+def _drain():
+    call_command("process_payment_notifications", stdout=io.StringIO())
+
+
+class WebhookDedupeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        _session_intent(self)
+
+    def _deliver(self, status: str, success: bool = True):
+        payload = {
+            "OrderId": f"S-{self.intent.id}",
+            "PaymentId": "7001",
+            "Status": status,
+            "Success": success,
+        }
+        return self.client.post(reverse("payments:tbank_webhook"), json.dumps(payload), content_type="application/json")
+
+    def test_replayed_confirmation_grants_once_and_costs_one_query(self):
+        self.assertEqual(self._deliver("CONFIRMED").content, b"OK")
+        with self.assertNumQueries(1):
+            self.assertEqual(self._deliver("CONFIRMED").content, b"OK")
+        _drain()
+
+        self.intent.refresh_from_db()
+        self.assertEqual(self.intent.status, PaymentIntent.Status.PAID)
+        self.assertEqual(Membership.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(Booking.objects.filter(user=self.user, booking_status=Booking.Status.BOOKED).count(), 1)
+        self.assertEqual(PaymentNotification.objects.count(), 1)
+        self.assertEqual(PaymentWebhookLog.objects.count(), 1)
+
+    def test_log_row_carries_lookup_columns_and_outcome(self):
+        self._deliver("CONFIRMED")
+        log = PaymentWebhookLog.objects.get(order_id=f"S-{self.intent.id}")
+        self.assertEqual((log.payment_id, log.status, log.success), ("7001", "CONFIRMED", True))
+        self.assertEqual(log.processing_result, PaymentWebhookLog.Result.QUEUED)
+
+        _drain()
+        log.refresh_from_db()
+        self.assertEqual(log.processing_result, PaymentWebhookLog.Result.APPLIED)
+
+    def test_late_cancel_does_not_undo_a_paid_intent(self):
+        self._deliver("CONFIRMED")
+        self._deliver("CANCELED", success=False)
+        _drain()
+
+        self.intent.refresh_from_db()
+        self.assertEqual(self.intent.status, PaymentIntent.Status.PAID)
+        self.assertEqual(self.intent.tb_status, "CANCELED")
+        self.assertEqual(PaymentNotification.objects.count(), 2)
+
+
+class FakeTBank:
+    """T-Bank в процессе теста: подписывает уведомления и шлёт их в вебхук."""
+
+    TERMINAL_KEY = "TestTerminal"
+    PASSWORD = "secret"
+
+    def __init__(self, http):
+        self.http = http
+        self.signer = TBankClient(self.TERMINAL_KEY, self.PASSWORD)
+
+    def notify(self, order_id: str, payment_id: str, status: str, *, success: bool = True, amount: int = 90000):
+        payload = {
+            "TerminalKey": self.TERMINAL_KEY,
+            "OrderId": order_id,
+            "PaymentId": payment_id,
+            "Status": status,
+            "Success": success,
+            "Amount": amount,
+        }
+        payload["Token"] = self.signer._token(payload)
+        return self.http.post(reverse("payments:tbank_webhook"), json.dumps(payload), content_type="application/json")
+
+
+@override_settings(TBANK_TERMINAL_KEY=FakeTBank.TERMINAL_KEY, TBANK_PASSWORD=FakeTBank.PASSWORD)
+class NotificationInboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        _session_intent(self)
+        self.bank = FakeTBank(self.client)
+        self.order_id = f"S-{self.intent.id}"
+
+    def test_webhook_only_queues_and_worker_applies_in_order(self):
+        # повторы и обгон: CONFIRMED пришёл трижды, AUTHORIZED — после него
+        for status in ("CONFIRMED", "CONFIRMED", "AUTHORIZED", "CONFIRMED"):
+            self.assertEqual(self.bank.notify(self.order_id, "8001", status).content, b"OK")
+
+        self.assertEqual(PaymentNotification.objects.filter(state=PaymentNotification.State.PENDING).count(), 2)
+        self.intent.refresh_from_db()
+        self.assertNotEqual(self.intent.status, PaymentIntent.Status.PAID)
+        self.assertFalse(Membership.objects.filter(user=self.user).exists())
+
+        _drain()
+
+        self.intent.refresh_from_db()
+        self.assertEqual(self.intent.status, PaymentIntent.Status.PAID)
+        # опоздавший AUTHORIZED не затирает итоговый статус
+        self.assertEqual(self.intent.tb_status, "CONFIRMED")
+        self.assertEqual(Membership.objects.filter(user=self.user).count(), 1)
+        self.assertFalse(PaymentNotification.objects.exclude(state=PaymentNotification.State.DONE).exists())
+
+    def test_staff_are_notified_only_after_commit(self):
+        payload = {"OrderId": self.order_id, "PaymentId": "8004", "Status": "CONFIRMED", "Success": True}
+        with mock.patch("payments.processing.notify_session_payment") as notify:
+            with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    process_notification(payload)
+                    raise RuntimeError("inbox row save failed")
+            notify.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                process_notification(payload)
+            notify.assert_called_once()
+
+    def test_payment_for_a_full_session_keeps_the_visit(self):
+        self.session.capacity = 0
+        self.session.save(update_fields=["capacity"])
+
+        self.bank.notify(self.order_id, "8005", "CONFIRMED")
+        _drain()
+
+        self.intent.refresh_from_db()
+        self.assertEqual(self.intent.status, PaymentIntent.Status.PAID)
+        self.assertFalse(Booking.objects.filter(user=self.user).exists())
+        self.assertEqual(Membership.objects.get(user=self.user).left_visits, 1)
+
+    def test_forged_notification_is_rejected_and_not_queued(self):
+        payload = {"OrderId": self.order_id, "PaymentId": "8002", "Status": "CONFIRMED", "Token": "forged"}
+        response = self.client.post(reverse("payments:tbank_webhook"), json.dumps(payload), content_type="application/json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentNotification.objects.exists())
+
+    def test_failure_backs_off_blocks_the_order_and_goes_dead(self):
+        self.bank.notify(self.order_id, "8003", "AUTHORIZED")
+        self.bank.notify(self.order_id, "8003", "CONFIRMED")
+        first, second = PaymentNotification.objects.order_by("id")
+
+        with mock.patch("payments.inbox.process_notification", side_effect=RuntimeError("db away")), \
+                self.assertLogs("payments.inbox", "ERROR"):
+            result = inbox.drain(max_attempts=2)
+        self.assertEqual((result.done, result.retried, result.dead), (0, 1, 0))
+        first.refresh_from_db()
+        self.assertEqual(first.attempts, 1)
+        self.assertGreater(first.next_attempt_at, timezone.now())
+        self.assertIn("db away", first.last_error)
+        # следующее уведомление того же заказа ждёт, пока не разрешится первое
+        second.refresh_from_db()
+        self.assertEqual(second.attempts, 0)
+
+        def fail_authorized(data):
+            if data["Status"] == "AUTHORIZED":
+                raise RuntimeError("db away")
+            process_notification(data)
+
+        later = timezone.now() + inbox.backoff(1) + timedelta(seconds=1)
+        with mock.patch("payments.inbox.process_notification", side_effect=fail_authorized), \
+                self.assertLogs("payments.inbox", "ERROR"):
+            result = inbox.drain(max_attempts=2, now=later)
+        # мёртвое уведомление заказ больше не держит — следующее применяется в том же проходе
+        self.assertEqual((result.done, result.retried, result.dead), (1, 0, 1))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.intent.refresh_from_db()
+        self.assertEqual(first.state, PaymentNotification.State.DEAD)
+        self.assertEqual(second.state, PaymentNotification.State.DONE)
+        self.assertEqual(self.intent.status, PaymentIntent.Status.PAID)
+
+
+    def test_failure_after_apply_leaves_the_row_pending(self):
+        self.bank.notify(self.order_id, "8004", "CONFIRMED")
+        row = PaymentNotification.objects.get()
+
+        # применение прошло, но запись итога упала — откатывается всё, строка ждёт повтора
+        with mock.patch("payments.inbox._log_result", side_effect=RuntimeError("db away")), \
+                self.assertLogs("payments.inbox", "ERROR"):
+            result = inbox.drain()
+        self.assertEqual((result.done, result.retried, result.dead), (0, 1, 0))
+        row.refresh_from_db()
+        self.intent.refresh_from_db()
+        self.assertEqual(row.state, PaymentNotification.State.PENDING)
+        self.assertIsNone(row.processed_at)
+        self.assertEqual(row.attempts, 1)
+        self.assertNotEqual(self.intent.status, PaymentIntent.Status.PAID)
+
+
+class TBankClientTests(TestCase):
+    def setUp(self):
+        self.stub = TBankStub(password="secret").start()
+        self.addCleanup(self.stub.stop)
+        self.client_ = TBankClient("TestTerminal", "secret", base_url=self.stub.base_url, retry_backoff=0)
+
+    def _init(self, order_id="1"):
+        return self.client_.init_payment(
+            order_id=order_id,
+            amount_kopeks=90000,
+            description="test",
+            notification_url="http://testserver/hook",
+            success_url="http://testserver/ok",
+            fail_url="http://testserver/fail",
+        )
+
+    def test_requests_reuse_one_pooled_connection(self):
+        for n in range(3):
+            pay = self._init(str(n))
+            self.assertTrue(pay["Success"])
+        self.assertEqual(self.stub.connections, 1)
+        self.assertEqual(self.client_.get_state(pay["PaymentId"])["Status"], "NEW")
+
+    def test_init_retries_only_when_the_gateway_refused_it(self):
+        self.stub.fail_next = [503]
+        self.assertTrue(self._init()["Success"])
+        self.assertEqual(self.stub.calls, ["Init", "Init"])
+
+        # 500/502/504 после отправки: платёж мог создаться — Init не повторяем
+        for n, status in enumerate((500, 502, 504)):
+            self.stub.fail_next = [status]
+            with self.assertRaises(TBankError):
+                self._init(f"2{n}")
+        self.assertEqual(self.stub.calls.count("Init"), 5)
+
+    def test_non_json_response_is_a_gateway_error(self):
+        self.stub.fail_next = [0]
+        with self.assertRaises(TBankError):
+            self._init()
+        self.assertEqual(self.client_.breaker.failures, 1)
+
+        # GetState идемпотентен — его повторяем
+        payment_id = self._init("2")["PaymentId"]
+        self.stub.fail_next = [0]
+        self.assertEqual(self.client_.get_state(payment_id)["Status"], "NEW")
+
+    def test_get_state_retries_server_errors(self):
+        payment_id = self._init()["PaymentId"]
+        self.stub.fail_next = [500, 502]
+        self.assertEqual(self.client_.get_state(payment_id)["Status"], "NEW")
+
+    def test_breaker_fails_fast_while_gateway_is_down_then_probes(self):
+        now = [0.0]
+        breaker = CircuitBreaker(threshold=2, reset_after=30, clock=lambda: now[0])
+        client = TBankClient("TestTerminal", "secret", base_url=self.stub.base_url, retries=0, breaker=breaker)
+        self.stub.fail_next = [503, 503]
+        with self.assertLogs("payments.tbank", "WARNING"):
+            for _ in range(2):
+                with self.assertRaises(TBankError):
+                    client.get_state("1")
+        with self.assertRaises(TBankUnavailable):
+            client.get_state("1")
+        self.assertEqual(len(self.stub.calls), 2)
+
+        now[0] = 31.0
+        payment_id = self._init()["PaymentId"]
+        self.assertEqual(client.get_state(payment_id)["Status"], "NEW")
+        self.assertFalse(breaker.is_open)
+
+
+class SessionPayGatewayTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        _session_intent(self)
+        self.client.force_login(self.user)
+        self.stub = TBankStub(password="secret").start()
+        self.addCleanup(self.stub.stop)
+
+    def _pay(self):
+        return self.client.post(
+            reverse("schedule:pay", args=[self.session.id]),
+            {"method": "online", "agree_offer": "1", "agree_personal_data": "1"},
+        )
+
+    def test_online_payment_goes_through_the_configured_gateway(self):
+        with override_settings(TBANK_BASE_URL=self.stub.base_url, TBANK_TERMINAL_KEY="TestTerminal", TBANK_PASSWORD="secret"):
+            response = self._pay()
+
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("/pay/", response["Location"])
+        intent = PaymentIntent.objects.exclude(id=self.intent.id).get()
+        self.assertEqual(intent.status, PaymentIntent.Status.PENDING)
+        self.assertEqual(self.stub.payments[intent.tb_payment_id]["OrderId"], f"S-{intent.id}")
+
+    def test_gateway_outage_cancels_the_intent_instead_of_erroring(self):
+        self.stub.fail_next = [503] * 3
+        with override_settings(TBANK_BASE_URL=self.stub.base_url, TBANK_TERMINAL_KEY="TestTerminal", TBANK_PASSWORD="secret"):
+            response = self._pay()
+
+        self.assertEqual(response.status_code, 200)
+        intent = PaymentIntent.objects.exclude(id=self.intent.id).get()
+        self.assertEqual(intent.status, PaymentIntent.Status.CANCELED)
+        self.assertEqual(intent.tb_status, "INIT_FAILED")
+
+
+class ReconcilePaymentsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        _session_intent(self)
+        self.stub = TBankStub().start()
+        self.addCleanup(self.stub.stop)
+
+    def _pending_at_bank(self, obj, order_id: str, status: str, *, age_min: int = 30):
+        payment_id = self.stub.init({"OrderId": order_id, "Amount": 90000})["PaymentId"]
+        self.stub.set_status(payment_id, status)
+        type(obj).objects.filter(id=obj.id).update(
+            tb_payment_id=payment_id,
+            created_at=timezone.now() - timedelta(minutes=age_min),
+        )
+
+    def _reconcile(self):
+        out = io.StringIO()
+        with override_settings(TBANK_BASE_URL=self.stub.base_url):
+            call_command("reconcile_payments", "--workers", "4", stdout=out)
+        return out.getvalue()
+
+    def test_stuck_payments_are_finalised_from_gateway_state(self):
+        self.intent.status = PaymentIntent.Status.PENDING
+        self.intent.save(update_fields=["status"])
+        self._pending_at_bank(self.intent, f"S-{self.intent.id}", "CONFIRMED")
+        order = Order.objects.create(user=self.user, status="payment_pending", total_rub=500)
+        self._pending_at_bank(order, str(order.id), "REJECTED")
+        waiting = Order.objects.create(user=self.user, status="payment_pending", total_rub=500)
+        self._pending_at_bank(waiting, str(waiting.id), "FORM_SHOWED")
+        fresh = Order.objects.create(user=self.user, status="payment_pending", total_rub=500)
+        self._pending_at_bank(fresh, str(fresh.id), "CONFIRMED", age_min=1)
+
+        output = self._reconcile()
+
+        self.assertIn("Checked 3", output)
+        self.assertIn("fixed 2 (paid 1, canceled 1), still pending 1", output)
+        self.intent.refresh_from_db()
+        self.assertEqual(self.intent.status, PaymentIntent.Status.PAID)
+        self.assertEqual(Membership.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(Order.objects.get(id=order.id).status, "canceled")
+        self.assertEqual(Order.objects.get(id=waiting.id).status, "payment_pending")
+        # свежие платежи не трогаем: вебхук ещё может прийти
+        self.assertEqual(Order.objects.get(id=fresh.id).status, "payment_pending")
+        self.assertEqual(self.stub.calls.count("GetState"), 3)
+
+    def test_gateway_errors_are_counted_and_rows_left_pending(self):
+        order = Order.objects.create(user=self.user, status="payment_pending", total_rub=500)
+        self._pending_at_bank(order, str(order.id), "CONFIRMED")
+        self.stub.fail_next = [500] * 3
+
+        with self.assertLogs("payments.reconcile", "WARNING"):
+            output = self._reconcile()
+
+        self.assertIn("errors 1", output)
+        self.assertEqual(Order.objects.get(id=order.id).status, "payment_pending")
+
+
+class ArchiveWebhookLogsTests(TestCase):
+    def test_old_rows_move_to_compressed_chunks(self):
+        old = timezone.now() - timedelta(days=120)
+        for n in range(3):
+            log = PaymentWebhookLog.record({"OrderId": str(n), "Status": "CONFIRMED"}, PaymentWebhookLog.Result.QUEUED)
+            PaymentWebhookLog.objects.filter(id=log.id).update(created_at=old)
+        fresh = PaymentWebhookLog.record({"OrderId": "9", "Status": "NEW"}, PaymentWebhookLog.Result.QUEUED)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            call_command("archive_webhook_logs", "--days", "90", "--chunk", "2", "--dir", tmp, stdout=io.StringIO())
+            files = sorted(Path(tmp).glob("*.jsonl.gz"))
+            lines = [json.loads(line) for f in files for line in gzip.open(f)]
+
+        self.assertEqual(len(files), 2)
+        self.assertEqual([row["order_id"] for row in lines], ["0", "1", "2"])
+        self.assertEqual(lines[0]["payload"]["Status"], "CONFIRMED")
+        self.assertEqual(list(PaymentWebhookLog.objects.values_list("id", flat=True)), [fresh.id])
@@ -1,13 +1,52 @@
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import transaction
+from django.http import HttpResponseRedirect
 
-from .models import Trainer, Session, Booking, Workout, RentRequest, RentPaymentIntent
+from . import reservations
+from .models import Location, RecurringSession, RecurringSessionException, Trainer, Session, SessionFull, Booking, Workout, RentRequest, RentPaymentIntent
+
+
+SESSION_FULL_MESSAGE = "Свободных мест нет: занятие рассчитано на {capacity} чел."
+
+
+class RefusedSaveAdminMixin:
+    """Отказ при сохранении (SessionFull — места заняли после проверки формы,
+    SlotTaken — новые часы аренды держит чужой резерв): откатываем всё
+    сохранённое и возвращаем на форму с ошибкой вместо 500."""
+
+    def _refuse_save(self, request, message: str):
+        request._save_refused = True
+        self.message_user(request, message, messages.ERROR)
+
+    def changeform_view(self, request, object_id=None, form_url="", extra_context=None):
+        with transaction.atomic():
+            response = super().changeform_view(request, object_id, form_url, extra_context)
+            if getattr(request, "_save_refused", False):
+                transaction.set_rollback(True)
+        return response
+
+    def response_add(self, request, obj, post_url_continue=None):
+        if getattr(request, "_save_refused", False):
+            return HttpResponseRedirect(request.path)
+        return super().response_add(request, obj, post_url_continue)
+
+    def response_change(self, request, obj):
+        if getattr(request, "_save_refused", False):
+            return HttpResponseRedirect(request.path)
+        return super().response_change(request, obj)
 
 
 class SessionAdminForm(forms.ModelForm):
     class Meta:
         model = Session
-        fields = "__all__"
+        # адрес — копия имени зала, заполняется в Session.save()
+        exclude = ("location",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["hall"].required = True
+        self.fields["hall"].queryset = Location.objects.order_by("-is_active", "sort", "id")
 
     def clean(self):
         cleaned = super().clean()
@@ -23,6 +62,29 @@ class SessionAdminForm(forms.ModelForm):
         return cleaned
 
 
+@admin.register(Location)
+class LocationAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "sort", "is_active", "capacity", "open_hour", "close_hour", "rent_enabled", "rent_price_rub")
+    list_editable = ("sort", "is_active")
+    list_filter = ("is_active", "rent_enabled")
+    search_fields = ("name",)
+
+
+class RecurringSessionExceptionInline(admin.TabularInline):
+    model = RecurringSessionException
+    extra = 0
+    fields = ("occurrence_date", "action", "new_start_at", "new_hall", "comment")
+
+
+@admin.register(RecurringSession)
+class RecurringSessionAdmin(admin.ModelAdmin):
+    list_display = ("id", "title", "weekday", "start_time", "duration_min", "hall", "trainer", "valid_from", "valid_until", "is_active")
+    list_filter = ("is_active", "weekday", "hall", "trainer")
+    search_fields = ("title", "trainer__name")
+    autocomplete_fields = ("trainer", "workout")
+    inlines = (RecurringSessionExceptionInline,)
+
+
 @admin.register(Workout)
 class WorkoutAdmin(admin.ModelAdmin):
     list_display = ("id", "name", "level", "default_duration_min", "default_capacity")
@@ -37,8 +99,28 @@ class TrainerAdmin(admin.ModelAdmin):
     ordering = ("name", "id")
 
 
+class BookingInlineFormSet(forms.BaseInlineFormSet):
+    def clean(self):
+        super().clean()
+        session = self.instance
+        # сколько мест займут записи формы сверх уже учтённых в booked_count
+        taken = 0
+        for form in self.forms:
+            if not getattr(form, "cleaned_data", None):
+                continue
+            had_seat = getattr(form.instance, "_seat_session_id", None) is not None
+            wants_seat = (
+                not self._should_delete_form(form)
+                and form.cleaned_data.get("booking_status") == Booking.Status.BOOKED
+            )
+            taken += int(wants_seat) - int(had_seat)
+        if taken > 0 and int(session.booked_count or 0) + taken > int(session.capacity):
+            raise forms.ValidationError(SESSION_FULL_MESSAGE.format(capacity=session.capacity))
+
+
 class BookingInline(admin.TabularInline):
     model = Booking
+    formset = BookingInlineFormSet
     extra = 0
     autocomplete_fields = ("user", "membership")
     readonly_fields = ("created_at", "marked_at", "canceled_at")
@@ -54,7 +136,7 @@ class RentRequestInline(admin.StackedInline):
 
 
 @admin.register(Session)
-class SessionAdmin(admin.ModelAdmin):
+class SessionAdmin(RefusedSaveAdminMixin, admin.ModelAdmin):
     form = SessionAdminForm
     list_display = (
         "id",
@@ -65,11 +147,11 @@ class SessionAdmin(admin.ModelAdmin):
         "workout",
         "client",
         "trainer",
-        "location",
+        "hall",
         "capacity",
         "duration_min",
     )
-    list_filter = ("location", "trainer", "kind")
+    list_filter = ("hall", "trainer", "kind")
     search_fields = ("title", "location", "trainer__name", "workout__name")
     autocomplete_fields = ("trainer", "client", "workout")
     ordering = ("start_at",)
@@ -94,7 +176,9 @@ class SessionAdmin(admin.ModelAdmin):
                 pass
 
         if loc:
-            initial["location"] = loc
+            hall = Location.objects.resolve(loc)
+            if hall is not None:
+                initial["hall"] = hall.pk
 
         if kind == "rent":
             initial.setdefault("kind", "rent")
@@ -134,6 +218,21 @@ class SessionAdmin(admin.ModelAdmin):
             if not obj.capacity:
                 obj.capacity = obj.workout.default_capacity
         super().save_model(request, obj, form, change)
+        if change:
+            # резервы оплаченной аренды едут вместе с занятием (новое время/длительность/зал)
+            try:
+                reservations.move([obj])
+            except reservations.SlotTaken:
+                self._refuse_save(request, reservations.MOVE_TAKEN_MESSAGE)
+
+    def save_formset(self, request, form, formset, change):
+        try:
+            super().save_formset(request, form, formset, change)
+        except SessionFull:
+            # formset.save() оборвался на полпути; сохранённое всё равно откатится,
+            # а журналу изменений нужны эти списки
+            formset.new_objects, formset.changed_objects, formset.deleted_objects = [], [], []
+            self._refuse_save(request, SESSION_FULL_MESSAGE.format(capacity=form.instance.capacity))
 
     def delete_model(self, request, obj):
         Booking.objects.filter(session=obj).delete()
@@ -144,14 +243,37 @@ class SessionAdmin(admin.ModelAdmin):
         super().delete_queryset(request, queryset)
 
 
+class BookingAdminForm(forms.ModelForm):
+    class Meta:
+        model = Booking
+        fields = "__all__"
+
+    def clean(self):
+        cleaned = super().clean()
+        session = cleaned.get("session")
+        if session is None or cleaned.get("booking_status") != Booking.Status.BOOKED:
+            return cleaned
+        # место уже учтено, если запись и раньше была BOOKED на это занятие
+        if getattr(self.instance, "_seat_session_id", None) != session.pk and session.seats_left < 1:
+            self.add_error("session", SESSION_FULL_MESSAGE.format(capacity=session.capacity))
+        return cleaned
+
+
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(RefusedSaveAdminMixin, admin.ModelAdmin):
+    form = BookingAdminForm
     list_display = ("id", "user", "membership", "session", "booking_status", "attendance_status", "created_at")
-    list_filter = ("booking_status", "attendance_status", "session__location")
+    list_filter = ("booking_status", "attendance_status", "session__hall")
     search_fields = ("user__full_name", "user__phone", "session__title", "session__location")
     autocomplete_fields = ("user", "session", "membership")
     readonly_fields = ("created_at", "marked_at", "canceled_at")
 
+    def save_model(self, request, obj, form, change):
+        try:
+            super().save_model(request, obj, form, change)
+        except SessionFull:
+            self._refuse_save(request, SESSION_FULL_MESSAGE.format(capacity=obj.session.capacity))
+
 
 @admin.register(RentRequest)
 class RentRequestAdmin(admin.ModelAdmin):
@@ -1,4 +1,9 @@
 from django.apps import AppConfig
+
+
 class ScheduleConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "schedule"
+
+    def ready(self):
+        from . import signals  # noqa
@@ -0,0 +1,135 @@
+"""Занятость зала по часам для сетки аренды.
+
+На каждый (зал, день) храним 24 байта — код состояния каждого часа, — плюс
+два маленьких словаря: чья аренда стоит в часе (чтобы показать «ваша бронь»)
+и до какого момента держится неоплаченное намерение. Структура лежит в общем
+кэше и сбрасывается точечно по дням, которых коснулось изменение; сетка
+7×14 строится из неё поиском по индексу, без обхода интервалов.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import Iterable
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Session, SlotReservation
+
+FREE = 0
+PENDING = 1
+TRAINING = 2
+RENT = 3
+
+# Страховка от гонки «прочитали старое → записали в кэш после сброса»:
+# ошибочная занятость живёт не дольше TTL. Бронирование на неё не опирается.
+DAY_TTL = 10 * 60
+
+
+@dataclass
+class DayOccupancy:
+    codes: bytearray = field(default_factory=lambda: bytearray(24))
+    rent_clients: dict[int, int] = field(default_factory=dict)
+    pending_until: dict[int, float] = field(default_factory=dict)
+
+    def mark(self, hour: int, code: int) -> None:
+        if code > self.codes[hour]:
+            self.codes[hour] = code
+
+    def state(self, hour: int, *, viewer_id: int | None, now_ts: float) -> str:
+        """Состояние часа: "" — свободно, иначе pending/training/busy/rent_paid (аренда зрителя)."""
+        code = self.codes[hour]
+        if code == RENT:
+            return "rent_paid" if viewer_id and self.rent_clients.get(hour) == viewer_id else "busy"
+        if code == TRAINING:
+            return "training"
+        if code == PENDING and self.pending_until.get(hour, 0) > now_ts:
+            return "pending"
+        return ""
+
+
+def _key(hall_id: int, day: date) -> str:
+    return f"rentgrid:{hall_id}:{day.isoformat()}"
+
+
+def _day_start(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def _hours(start: datetime, end: datetime):
+    """(локальная дата, час) всех часовых слотов, которые пересекает [start, end)."""
+    cur = timezone.localtime(start).replace(minute=0, second=0, microsecond=0)
+    end_local = timezone.localtime(end)
+    while cur < end_local:
+        yield cur.date(), cur.hour
+        cur += timedelta(hours=1)
+
+
+def _build(hall_id: int, days: list[date]) -> dict[date, DayOccupancy]:
+    result = {d: DayOccupancy() for d in days}
+    range_start = _day_start(min(days))
+    range_end = _day_start(max(days) + timedelta(days=1))
+
+    sessions = (
+        Session.objects
+        .filter(hall_id=hall_id)
+        .overlapping(range_start, range_end)
+        .values_list("start_at", "end_at", "kind", "client_id")
+    )
+    for start, end, kind, client_id in sessions:
+        code = RENT if kind == Session.Kind.RENT else TRAINING
+        for day, hour in _hours(start, end):
+            occ = result.get(day)
+            if occ is None:
+                continue
+            occ.mark(hour, code)
+            if code == RENT and client_id:
+                occ.rent_clients[hour] = client_id
+
+    # удержание до оплаты — по резервам: у намерения на несколько слотов
+    # его интервал захватывает и промежутки между ними
+    held = (
+        SlotReservation.objects
+        .filter(hall_id=hall_id, slot_start__gte=range_start, slot_start__lt=range_end, expires_at__gt=timezone.now())
+        .values_list("slot_start", "expires_at")
+    )
+    for start, expires_at in held:
+        local = timezone.localtime(start)
+        occ = result.get(local.date())
+        if occ is None:
+            continue
+        occ.mark(local.hour, PENDING)
+        # истёкшее удержание читается как свободное без сброса кэша
+        occ.pending_until[local.hour] = max(occ.pending_until.get(local.hour, 0), expires_at.timestamp())
+    return result
+
+
+def occupancy_for_days(hall_id: int, days: list[date]) -> dict[date, DayOccupancy]:
+    """Занятость зала по дням: из кэша, недостающие дни — двумя запросами на всех."""
+    keys = {_key(hall_id, d): d for d in days}
+    cached = cache.get_many(list(keys))
+    result = {keys[k]: v for k, v in cached.items()}
+    missing = [d for d in days if d not in result]
+    if missing:
+        built = _build(hall_id, missing)
+        cache.set_many({_key(hall_id, d): occ for d, occ in built.items()}, DAY_TTL)
+        result.update(built)
+    return result
+
+
+def invalidate(spans: Iterable[tuple[int | None, datetime | None, datetime | None]]) -> None:
+    """Сбрасывает дни, которых касаются интервалы (hall_id, start, end), после коммита."""
+    keys = set()
+    for hall_id, start, end in spans:
+        if not hall_id or not start:
+            continue
+        first = timezone.localdate(start)
+        last = timezone.localdate(end or start)
+        day = first
+        while day <= last:
+            keys.add(_key(hall_id, day))
+            day += timedelta(days=1)
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(list(keys)))
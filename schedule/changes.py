@@ -0,0 +1,103 @@
+"""Запись и чтение журнала изменений расписания (ScheduleChange).
+
+Строки пишутся после коммита (transaction.on_commit) отдельными короткими
+вставками — откаченные изменения в журнал не попадают. После вставки
+сдвигается поколение "changes" в общем кэше: ожидающие long-poll запросы
+смотрят только на него и идут в БД, лишь когда что-то появилось.
+"""
+from __future__ import annotations
+
+from typing import Iterable
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.cache import bump
+
+from .models import ScheduleChange, Session
+
+
+def _local_day(dt) -> str:
+    return timezone.localdate(dt).isoformat()
+
+
+def _append(rows: list[ScheduleChange]) -> None:
+    if not rows:
+        return
+    ScheduleChange.objects.bulk_create(rows)
+    bump("changes")
+
+
+def _session_row(session: Session, kind: str, *, days: Iterable[str] = ()) -> ScheduleChange:
+    return ScheduleChange(
+        kind=kind,
+        session_id=session.pk,
+        hall_id=session.hall_id,
+        days=sorted({_local_day(session.start_at), *days}),
+        is_public=session.kind == Session.Kind.GROUP,
+        seats_left=session.seats_left,
+    )
+
+
+def record_session(session: Session, kind: str, *, previous_start=None) -> None:
+    """Создание/изменение/удаление одного занятия."""
+    days = [_local_day(previous_start)] if previous_start else []
+    row = _session_row(session, kind, days=days)
+    transaction.on_commit(lambda: _append([row]))
+
+
+def record_sessions(sessions: Iterable[Session], kind: str, *, previous_starts: dict | None = None) -> None:
+    """То же для пакетных путей (bulk_create/bulk_update), которые не шлют сигналов."""
+    previous_starts = previous_starts or {}
+    rows = []
+    for s in sessions:
+        prev = previous_starts.get(s.pk)
+        rows.append(_session_row(s, kind, days=[_local_day(prev)] if prev else []))
+    transaction.on_commit(lambda: _append(rows))
+
+
+def record_booking(session_id: int) -> None:
+    """Изменились записи на занятие: в журнал — актуальные места после коммита."""
+    def write():
+        row = (
+            Session.objects
+            .filter(pk=session_id)
+            .with_occupancy()
+            .values("start_at", "hall_id", "kind", "capacity", "booked_count", "waitlist_count")
+            .first()
+        )
+        if row is None:
+            return  # занятие удалено — об этом уже есть запись DELETED
+        _append([ScheduleChange(
+            kind=ScheduleChange.Kind.BOOKING,
+            session_id=session_id,
+            hall_id=row["hall_id"],
+            days=[_local_day(row["start_at"])],
+            is_public=row["kind"] == Session.Kind.GROUP,
+            seats_left=max(0, row["capacity"] - row["booked_count"]),
+            waitlist_count=row["waitlist_count"],
+        )])
+
+    transaction.on_commit(write)
+
+
+def latest_id() -> int:
+    return ScheduleChange.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def changes_since(since: int, *, include_private: bool, limit: int) -> tuple[list[dict], bool]:
+    """(изменения после since, нужна ли клиенту полная перезагрузка).
+
+    Перезагрузка нужна, если since уже вычищен из журнала или изменений
+    накопилось больше limit — дешевле перечитать страницу, чем догонять.
+    """
+    if not ScheduleChange.objects.filter(id=since).exists():
+        return [], True
+
+    qs = ScheduleChange.objects.filter(id__gt=since).order_by("id")
+    if not include_private:
+        qs = qs.filter(is_public=True)
+    rows = list(qs.values("id", "kind", "session_id", "hall_id", "days", "seats_left", "waitlist_count")[: limit + 1])
+    if len(rows) > limit:
+        return [], True
+    return rows, False
@@ -12,7 +12,10 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
 from django.utils import timezone
 from django.views.decorators.http import require_POST
-from .models import Session
+from . import availability, reservations
+from .changes import record_sessions
+from .models import Location, ScheduleChange, Session, location_aliases
+from .recurrence import ensure_materialized
 
 
 @dataclass
@@ -61,70 +64,148 @@ def _fmt_hhmm(dt: datetime, tz) -> str:
     return timezone.localtime(dt, tz).strftime("%H:%M")
 
 
-def _normalize_loc(s: str) -> str:
-    return (s or "").strip().lower().replace("ё", "е").replace(" ", "")
+PLANNING_MAX_DAYS = 14
+PX_PER_MIN = 72 / 60  # 60 минут = 72px
+SLOT_STEP_MIN = 10
 
 
-def _compact_ws(s: str | None) -> str:
-    return " ".join((s or "").split()).strip()
+def _planning_days(request: HttpRequest, tz) -> list:
+    """День (по умолчанию), неделя (mode=week) или диапазон day..end (до PLANNING_MAX_DAYS)."""
+    day = _parse_day(request.GET.get("day"), tz)
+    if request.GET.get("mode") == "week":
+        monday = _week_start(day)
+        return [monday + timedelta(days=i) for i in range(7)]
+
+    end_raw = request.GET.get("end")
+    if end_raw:
+        end = _parse_day(end_raw, tz)
+        n = max(1, min(PLANNING_MAX_DAYS, (end - day).days + 1))
+        return [day + timedelta(days=i) for i in range(n)]
+    return [day]
+
+
+def _planning_grid(*, days: list, grid_start_h: int, grid_end_h: int, tz) -> dict[str, Any]:
+    """Сетка планирования на несколько дней: один запрос, геометрия слотов — один раз."""
+    grid_minutes = (grid_end_h - grid_start_h) * 60
+    grid_height_px = int(grid_minutes * PX_PER_MIN)
+
+    # ✅ 10-минутные слоты для кликов (без вычислений по пикселям на фронте); общие для всех дней
+    slots = [
+        {
+            "start": f"{(grid_start_h * 60 + m) // 60:02d}:{(grid_start_h * 60 + m) % 60:02d}",
+            "top_px": int(m * PX_PER_MIN),
+        }
+        for m in range(0, grid_minutes, SLOT_STEP_MIN)
+    ]
+
+    windows = []
+    for d in days:
+        grid_start = _combine_local(d, f"{grid_start_h:02d}:00", tz)
+        windows.append((grid_start, grid_start + timedelta(minutes=grid_minutes)))
+
+    ensure_materialized(days[0], days[-1])
+
+    # одним запросом — всё, что пересекает хотя бы одно окно
+    sessions = list(
+        Session.objects
+        .select_related("trainer", "hall")
+        .overlapping(windows[0][0], windows[-1][1])
+        .order_by("start_at")
+    )
 
+    # колонки — активные залы; скрытые залы появляются, только если в них есть занятия
+    locations = list(Location.objects.active().values_list("name", flat=True))
 
-def _location_norm_aliases(raw_loc: str) -> set[str]:
-    """
-    Допускаем частую опечатку 8б/86, чтобы не плодить "ложные" адреса.
-    """
-    norm = _normalize_loc(raw_loc)
-    if not norm:
-        return set()
-
-    aliases = {norm}
-    if norm.endswith("8б"):
-        aliases.add(norm[:-2] + "86")
-    if norm.endswith("86"):
-        aliases.add(norm[:-2] + "8б")
-    return aliases
-
-
-def _dedupe_locations(raw_locations) -> list[str]:
-    seen: set[str] = set()
-    cleaned: list[str] = []
-    for loc in raw_locations or []:
-        c = _compact_ws(str(loc))
-        if not c:
-            continue
-        n = _normalize_loc(c)
-        if n in seen:
-            continue
-        seen.add(n)
-        cleaned.append(c)
-    return cleaned
-
-
-def _canonical_location(raw_loc: str | None, known_locations: list[str]) -> str:
-    raw_clean = _compact_ws(raw_loc)
-    if not raw_clean:
-        return ""
-
-    by_norm: dict[str, str] = {}
-    for loc in known_locations:
-        c = _compact_ws(loc)
-        if not c:
-            continue
-        by_norm.setdefault(_normalize_loc(c), c)
-
-    for alias in _location_norm_aliases(raw_clean):
-        canonical = by_norm.get(alias)
-        if canonical:
-            return canonical
-    return raw_clean
+    col_maps: list[dict[str, list[Block]]] = [{loc: [] for loc in locations} for _ in days]
+    for s in sessions:
+        start_local = timezone.localtime(s.start_at, tz)
+        end_local = timezone.localtime(s.end_at, tz)
+        column = s.hall.name if s.hall_id else "Без адреса"
+        # обычно занятие попадает ровно в один день; длинные — в несколько подряд
+        first = max(0, (start_local.date() - days[0]).days)
+        last = min(len(days) - 1, (end_local.date() - days[0]).days)
+        for i in range(first, last + 1):
+            grid_start, grid_end = windows[i]
+            if not (s.start_at < grid_end and s.end_at > grid_start):
+                continue
+            # занятие может выходить за края сетки — рисуем только видимую часть
+            visible_start = max(s.start_at, grid_start)
+            visible_end = min(s.end_at, grid_end)
+            mins_from_start = int((visible_start - grid_start).total_seconds() // 60)
+            height_px = int(((visible_end - visible_start).total_seconds() // 60) * PX_PER_MIN)
+
+            col_maps[i].setdefault(column, []).append(Block(
+                id=s.id,
+                kind=s.kind,
+                title=s.title,
+                trainer=getattr(s.trainer, "name", "") if s.trainer_id else "",
+                location=column,
+                start_at=start_local,
+                end_at=end_local,
+                duration_min=s.duration_min or 0,
+                top_px=int(mins_from_start * PX_PER_MIN),
+                height_px=max(18, height_px),
+                hhmm=start_local.strftime("%H:%M"),
+                end_hhmm=end_local.strftime("%H:%M"),
+                edit_url=reverse("admin:schedule_session_change", args=[s.id]),
+            ))
+
+    return {
+        "days": days,
+        "day_columns": [{"day": d, "columns": col_map} for d, col_map in zip(days, col_maps)],
+        "grid_height_px": grid_height_px,
+        "hours": [
+            _combine_local(days[0], f"{h:02d}:00", tz) for h in range(grid_start_h, grid_end_h)
+        ],
+        "slots": slots,
+    }
+
+
+def _planning_json(grid: dict[str, Any], *, grid_start_h: int, grid_end_h: int) -> dict[str, Any]:
+    return {
+        "grid": {
+            "from": grid_start_h,
+            "to": grid_end_h,
+            "px_per_min": PX_PER_MIN,
+            "height_px": grid["grid_height_px"],
+            "slot_step_min": SLOT_STEP_MIN,
+        },
+        "days": [
+            {
+                "date": dc["day"].isoformat(),
+                "columns": [
+                    {
+                        "location": loc,
+                        "blocks": [
+                            {
+                                "id": b.id,
+                                "kind": b.kind,
+                                "title": b.title,
+                                "trainer": b.trainer,
+                                "start": b.hhmm,
+                                "end": b.end_hhmm,
+                                "duration_min": b.duration_min,
+                                "top_px": b.top_px,
+                                "height_px": b.height_px,
+                                "edit_url": b.edit_url,
+                            }
+                            for b in blocks
+                        ],
+                    }
+                    for loc, blocks in dc["columns"].items()
+                ],
+            }
+            for dc in grid["day_columns"]
+        ],
+    }
 
 
 @staff_member_required
 def planning(request: HttpRequest):
     tz = timezone.get_current_timezone()
 
-    # day / range
-    day = _parse_day(request.GET.get("day"), tz)
+    # day / week / range
+    days = _planning_days(request, tz)
     grid_start_h = _safe_int(request.GET.get("from"), 8)
     grid_end_h = _safe_int(request.GET.get("to"), 22)
     grid_start_h = max(0, min(23, grid_start_h))
@@ -132,115 +213,31 @@ def planning(request: HttpRequest):
     if grid_end_h <= grid_start_h:
         grid_end_h = min(24, grid_start_h + 1)
 
-    grid_start = _combine_local(day, f"{grid_start_h:02d}:00", tz)
-    grid_end = _combine_local(day, f"{grid_end_h:02d}:00", tz)
-
-    # constants: 60 minutes = 72px
-    px_per_min = 72 / 60
-    grid_height_px = int(((grid_end - grid_start).total_seconds() // 60) * px_per_min)
+    grid = _planning_grid(days=days, grid_start_h=grid_start_h, grid_end_h=grid_end_h, tz=tz)
 
-    # ✅ 10-минутные слоты для кликов (без вычислений по пикселям на фронте)
-    slot_step_min = 10
-    slot_height_px = int(slot_step_min * px_per_min)
-
-    slots = []
-    total_minutes = int((grid_end - grid_start).total_seconds() // 60)
-    for m in range(0, total_minutes, slot_step_min):
-        t = grid_start + timedelta(minutes=m)
-        slots.append({
-            "start": timezone.localtime(t, tz).strftime("%H:%M"),
-            "top_px": int(m * px_per_min),
-        })
-
-    # locations list: from settings, fallback from existing sessions for that day
-    from django.conf import settings
-
-    raw_locations = getattr(settings, "WOOMFIT_LOCATIONS", None) or []
-    locations = _dedupe_locations(raw_locations)
-
-    # if settings empty, derive from db
-    if not locations:
-        qs_loc = (
-            Session.objects
-            .filter(start_at__gte=grid_start, start_at__lt=grid_end)
-            .values_list("location", flat=True)
-            .distinct()
-        )
-        locations = _dedupe_locations(qs_loc)
-
-    # query sessions for that window
-    qs = (
-        Session.objects
-        .select_related("trainer")
-        .filter(start_at__gte=grid_start, start_at__lt=grid_end)
-        .order_by("start_at")
-    )
-
-    # group by normalized location
-    col_map: dict[str, list[Block]] = {loc: [] for loc in locations}
-    # also accept sessions whose loc not in configured list
-    extra_locs: dict[str, list[Block]] = {}
-
-    for s in qs:
-        start_local = timezone.localtime(s.start_at, tz)
-        end_local = start_local + timedelta(minutes=s.duration_min or 0)
-        mins_from_start = int((start_local - timezone.localtime(grid_start, tz)).total_seconds() // 60)
-
-        top_px = int(mins_from_start * px_per_min)
-        height_px = int((s.duration_min or 0) * px_per_min)
-
-        canonical_loc = _canonical_location(s.location, locations)
-        b = Block(
-            id=s.id,
-            kind=s.kind,
-            title=s.title,
-            trainer=getattr(s.trainer, "name", "") if s.trainer_id else "",
-            location=canonical_loc or "",
-            start_at=start_local,
-            end_at=end_local,
-            duration_min=s.duration_min or 0,
-            top_px=top_px,
-            height_px=max(18, height_px),
-            hhmm=start_local.strftime("%H:%M"),
-            end_hhmm=end_local.strftime("%H:%M"),
-            edit_url=reverse("admin:schedule_session_change", args=[s.id]),
-        )
-
-        placed = False
-        for loc in locations:
-            if _normalize_loc(loc) == _normalize_loc(b.location):
-                col_map[loc].append(b)
-                placed = True
-                break
-        if not placed:
-            extra_locs.setdefault(b.location or "Без адреса", []).append(b)
-
-    # merge extra columns at the end
-    for loc, blocks in extra_locs.items():
-        col_map[loc] = blocks
-
-    # hours labels
-    hours = []
-    cur = grid_start
-    while cur < grid_end:
-        hours.append(cur)
-        cur += timedelta(hours=1)
+    # JSON для листания дней на клиенте без полного рендера страницы
+    if request.GET.get("format") == "json":
+        return JsonResponse(_planning_json(grid, grid_start_h=grid_start_h, grid_end_h=grid_end_h))
 
     ctx: dict[str, Any] = {
-        "day": day,
+        "day": days[0],
+        "mode": "week" if request.GET.get("mode") == "week" else ("range" if len(days) > 1 else "day"),
         "grid_start_h": grid_start_h,
         "grid_end_h": grid_end_h,
-        "grid_height_px": grid_height_px,
-        "px_per_min": px_per_min,
-        "hours": hours,
-        "columns": col_map,
+        "grid_height_px": grid["grid_height_px"],
+        "px_per_min": PX_PER_MIN,
+        "hours": grid["hours"],
+        "day_columns": grid["day_columns"],
+        "column_count": sum(len(dc["columns"]) for dc in grid["day_columns"]),
         "admin_add_url": reverse("admin:schedule_session_add"),
         "move_url": reverse("crm_planning_move"),
+        "move_batch_url": reverse("crm_planning_move_batch"),
+        "changes_url": reverse("schedule:changes"),
+        "data_url": reverse("crm_planning"),
 
-
-        "slots": slots,
-        "slot_height_px": slot_height_px,
-        "slot_step_min": slot_step_min,
+        "slots": grid["slots"],
+        "slot_height_px": int(SLOT_STEP_MIN * PX_PER_MIN),
+        "slot_step_min": SLOT_STEP_MIN,
     }
     return render(request, "crm/planning.html", ctx)
 
@@ -273,59 +270,220 @@ def session_move(request: HttpRequest):
     except Exception:
         return JsonResponse({"ok": False, "error": "bad_datetime"}, status=400)
 
-    from django.conf import settings
-
-    known_locations = _dedupe_locations(getattr(settings, "WOOMFIT_LOCATIONS", None) or [])
-    canonical_loc = _canonical_location(loc, known_locations) or _compact_ws(loc)
+    hall = Location.objects.resolve(loc)
+    if hall is None:
+        return JsonResponse({"ok": False, "error": "unknown_location"}, status=400)
 
     s = get_object_or_404(Session, pk=session_id)
     s.start_at = new_dt
-    s.location = canonical_loc
+    s.hall = hall
+    s.location = hall.name
     try:
         s.full_clean()
     except ValidationError as exc:
         return JsonResponse({"ok": False, "error": "validation", "messages": exc.messages}, status=400)
-    s.save(update_fields=["start_at", "location"])
+    with transaction.atomic():
+        s.save(update_fields=["start_at", "hall", "location"])
+        try:
+            reservations.move([s])
+        except reservations.SlotTaken:
+            transaction.set_rollback(True)
+            return JsonResponse({"ok": False, "error": "validation", "messages": [reservations.MOVE_TAKEN_MESSAGE]}, status=409)
 
     return JsonResponse({"ok": True})
 move_session = session_move
 
 
+MOVE_BATCH_MAX = 200
+MOVE_MAX_DURATION_MIN = 12 * 60
+
+
+def _parse_move_item(item, tz, halls_by_key: dict[str, Location]) -> tuple[dict, str | None]:
+    """Разбирает один элемент пачки: (изменения, код ошибки или None)."""
+    if not isinstance(item, dict):
+        return {}, "bad_item"
+    try:
+        session_id = int(item.get("session_id"))
+    except (TypeError, ValueError):
+        return {}, "missing_fields"
+
+    change: dict[str, Any] = {"session_id": session_id}
+    day, start = item.get("day"), item.get("start")
+    if day or start:
+        try:
+            d = datetime.strptime(day, "%Y-%m-%d").date()
+            hh, mm = start.split(":")
+            change["start_at"] = timezone.make_aware(datetime.combine(d, time(int(hh), int(mm))), tz)
+        except Exception:
+            return change, "bad_datetime"
+
+    if item.get("duration_min") is not None:
+        try:
+            duration = int(item.get("duration_min"))
+        except (TypeError, ValueError):
+            return change, "bad_duration"
+        if not 1 <= duration <= MOVE_MAX_DURATION_MIN:
+            return change, "bad_duration"
+        change["duration_min"] = duration
+
+    loc = item.get("loc")
+    if loc:
+        hall = next((halls_by_key[k] for k in sorted(location_aliases(loc)) if k in halls_by_key), None)
+        if hall is None:
+            return change, "unknown_location"
+        change["hall"] = hall
+
+    if len(change) == 1:
+        return change, "missing_fields"
+    return change, None
+
+
+@staff_member_required
+@require_POST
+def session_move_batch(request: HttpRequest):
+    """Пакетный перенос/изменение длительности занятий.
+
+    JSON: {"items": [{session_id, day?, start?, loc?, duration_min?}, ...], "dry_run": bool}.
+    Все элементы проверяются вместе (друг с другом и с расписанием) и
+    применяются одной транзакцией: либо все, либо ни одного. В ответе —
+    результат по каждому элементу в том же порядке.
+    """
+    import json
+
+    from core.cache import bump
+    from .planner import MoveTarget, find_move_conflicts
+
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+    except Exception:
+        return JsonResponse({"ok": False, "error": "bad_json"}, status=400)
+
+    items = payload.get("items") if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        return JsonResponse({"ok": False, "error": "missing_fields"}, status=400)
+    if len(items) > MOVE_BATCH_MAX:
+        return JsonResponse({"ok": False, "error": "too_many_items", "max": MOVE_BATCH_MAX}, status=400)
+    dry_run = bool(payload.get("dry_run"))
+
+    tz = timezone.get_current_timezone()
+    halls_by_key = {hall.key: hall for hall in Location.objects.all()}
+
+    changes: list[dict] = []
+    results: list[dict[str, Any]] = []
+    seen: set[int] = set()
+    for item in items:
+        change, error = _parse_move_item(item, tz, halls_by_key)
+        sid = change.get("session_id")
+        if error is None and sid in seen:
+            error = "duplicate_session"
+        seen.add(sid)
+        changes.append(change)
+        results.append({"session_id": sid, "ok": error is None, "error": error, "messages": []})
+
+    with transaction.atomic():
+        sessions = (
+            Session.objects
+            .select_for_update()
+            .select_related("hall")
+            .in_bulk([c["session_id"] for c in changes if "session_id" in c])
+        )
+
+        targets = []
+        for change, result in zip(changes, results):
+            if not result["ok"]:
+                continue
+            s = sessions.get(change["session_id"])
+            if s is None:
+                result.update(ok=False, error="not_found")
+                continue
+            hall = change.get("hall", s.hall)
+            targets.append(MoveTarget(
+                session=s,
+                start_at=change.get("start_at", s.start_at),
+                duration_min=change.get("duration_min", s.duration_min),
+                hall_id=hall.id if hall else None,
+            ))
+
+        conflicts = find_move_conflicts(targets)
+        by_id = {t.session.id: t for t in targets}
+        for result in results:
+            msgs = conflicts.get(result["session_id"])
+            if result["ok"] and msgs:
+                result.update(ok=False, error="validation", messages=msgs)
+            target = by_id.get(result["session_id"])
+            if target is not None:
+                start_local = timezone.localtime(target.start_at, tz)
+                result.update(
+                    day=start_local.date().isoformat(),
+                    start=start_local.strftime("%H:%M"),
+                    end=_fmt_hhmm(target.end_at, tz),
+                )
+
+        ok = all(r["ok"] for r in results)
+        if not ok or dry_run:
+            return JsonResponse({"ok": ok, "applied": 0, "results": results}, status=200 if ok else 409)
+
+        # bulk_update не вызывает save(): производные поля считаем сами
+        halls_by_id = {hall.id: hall for hall in halls_by_key.values()}
+        previous_starts = {t.session.id: t.session.start_at for t in targets}
+        old_spans = [(t.session.hall_id, t.session.start_at, t.session.end_at) for t in targets]
+        for t in targets:
+            s = t.session
+            s.start_at = t.start_at
+            s.duration_min = t.duration_min
+            s.end_at = t.end_at
+            if t.hall_id:
+                s.hall = halls_by_id[t.hall_id]
+                s.location = s.hall.name
+        Session.objects.bulk_update(
+            [t.session for t in targets],
+            ["start_at", "duration_min", "end_at", "hall", "location"],
+            batch_size=200,
+        )
+        try:
+            # post_save не срабатывает — резервы аренды переносим сами
+            reservations.move([t.session for t in targets])
+        except reservations.SlotTaken as exc:
+            transaction.set_rollback(True)
+            for result in results:
+                if result["session_id"] in exc.session_ids:
+                    result.update(ok=False, error="validation", messages=[reservations.MOVE_TAKEN_MESSAGE])
+            return JsonResponse({"ok": False, "applied": 0, "results": results}, status=409)
+        record_sessions([t.session for t in targets], ScheduleChange.Kind.MOVED, previous_starts=previous_starts)
+        availability.invalidate(old_spans + [(t.hall_id, t.start_at, t.end_at) for t in targets])
+        transaction.on_commit(lambda: bump("schedule"))
+
+    return JsonResponse({"ok": True, "applied": len(targets), "results": results})
+
+
 def _week_start(d):
     """Понедельник 00:00 выбранной даты (локальная зона)."""
     return d - timedelta(days=d.weekday())
 
 
-def _overlaps(start_a, dur_a_min, start_b, dur_b_min):
-    end_a = start_a + timedelta(minutes=dur_a_min)
-    end_b = start_b + timedelta(minutes=dur_b_min)
-    return start_a < end_b and start_b < end_a
+REPEAT_MAX_WEEKS = 8
 
 
 @staff_member_required
 @require_POST
 def repeat_week(request):
     """
-    Копирует все Session из недели source -> week target.
+    Копирует все Session из недели source -> week target (и ещё weeks-1 следующих недель).
     - сохраняет время, длительность, зал, тренера, title, capacity
     - опционально сдвигает время на shift_min минут
-    - пропускает конфликты по location и trainer (чтобы не было пересечений)
+    - пропускает конфликты по залу и trainer (чтобы не было пересечений)
+    - dry_run=1: ничего не создаёт, показывает, что будет создано и что пропущено и почему
     """
     src_day = request.POST.get("src_day")
     dst_day = request.POST.get("dst_day")
-    shift_min = request.POST.get("shift_min", "0")
-
-    try:
-        shift_min = int(shift_min)
-    except ValueError:
-        shift_min = 0
+    shift_min = _safe_int(request.POST.get("shift_min"), 0)
+    weeks = max(1, min(REPEAT_MAX_WEEKS, _safe_int(request.POST.get("weeks"), 1)))
+    dry_run = request.POST.get("dry_run") == "1"
 
     if not src_day or not dst_day:
         messages.error(request, "Нужно выбрать неделю-источник и неделю-назначение")
         return redirect("crm_planning")
 
-    tz = timezone.get_current_timezone()
-
     try:
         src_date = datetime.strptime(src_day, "%Y-%m-%d").date()
         dst_date = datetime.strptime(dst_day, "%Y-%m-%d").date()
@@ -336,102 +494,37 @@ def repeat_week(request):
     src_monday = _week_start(src_date)
     dst_monday = _week_start(dst_date)
 
-    src_start = timezone.make_aware(datetime.combine(src_monday, datetime.min.time()), tz)
-    src_end = src_start + timedelta(days=7)
-
-    dst_start = timezone.make_aware(datetime.combine(dst_monday, datetime.min.time()), tz)
-    dst_end = dst_start + timedelta(days=7)
-
-    from .models import Session
-    from django.conf import settings
-
-    known_locations = _dedupe_locations(getattr(settings, "WOOMFIT_LOCATIONS", None) or [])
+    from core.cache import bump
+    from .planner import plan_week_copy
 
-    src_sessions = (
-        Session.objects
-        .select_related("trainer")
-        .filter(start_at__gte=src_start, start_at__lt=src_end)
-        .order_by("start_at")
-    )
-
-    # заранее загрузим всё что уже есть в целевой неделе — чтобы проверять конфликты
-    existing_dst = list(
-        Session.objects
-        .filter(start_at__gte=dst_start, start_at__lt=dst_end)
-        .values("start_at", "duration_min", "location", "trainer_id")
-    )
-
-    created = 0
-    skipped = 0
-
-    # также учитываем конфликты между тем, что мы создаём в ходе копирования
-    newly_planned = []
-
-    def has_conflict(new_start, new_dur, new_loc, new_trainer_id):
-        # конфликт по залу или по тренеру
-        for s in existing_dst:
-            if (s["location"] == new_loc) or (s["trainer_id"] and s["trainer_id"] == new_trainer_id):
-                if _overlaps(new_start, new_dur, s["start_at"], s["duration_min"] or 0):
-                    return True
-        for s in newly_planned:
-            if (s["location"] == new_loc) or (s["trainer_id"] and s["trainer_id"] == new_trainer_id):
-                if _overlaps(new_start, new_dur, s["start_at"], s["duration_min"] or 0):
-                    return True
-        return False
+    # занятия по правилам в неделе назначения должны быть видны как занятость
+    ensure_materialized(dst_monday, dst_monday + timedelta(days=7 * weeks - 1))
 
     with transaction.atomic():
-        for s in src_sessions:
-            # сдвиг по дням недели + shift_min по времени
-            delta_days = (timezone.localtime(s.start_at, tz).date() - src_monday).days
-            base = dst_start + timedelta(days=delta_days)
-
-            src_local = timezone.localtime(s.start_at, tz)
-            # переносим время из src_local в base-день
-            new_naive = datetime.combine(base.date(), src_local.time()) + timedelta(minutes=shift_min)
-            new_start = timezone.make_aware(new_naive, tz)
-
-            new_dur = int(s.duration_min or 0)
-            new_loc = _canonical_location(s.location, known_locations) or ""
-            new_trainer_id = s.trainer_id
-
-            # защита: кратность 10 минутам (если хочешь строго)
-            # если не кратно — округлим вниз к ближайшим 10
-            mins_total = new_start.hour * 60 + new_start.minute
-            mins_rounded = (mins_total // 10) * 10
-            if mins_rounded != mins_total:
-                hh = mins_rounded // 60
-                mm = mins_rounded % 60
-                new_start = new_start.replace(hour=hh, minute=mm, second=0, microsecond=0)
-
-            # пропускаем всё, что выпало за неделю назначения (из-за shift)
-            if not (dst_start <= new_start < dst_end):
-                skipped += 1
-                continue
-
-            if has_conflict(new_start, new_dur, new_loc, new_trainer_id):
-                skipped += 1
-                continue
-
-            # создаём копию
-            Session.objects.create(
-                title=s.title,
-                kind=s.kind,
-                workout=s.workout,
-                client=s.client,
-                start_at=new_start,
-                duration_min=s.duration_min,
-                location=new_loc,
-                trainer_id=s.trainer_id,
-                capacity=s.capacity,
-            )
-            newly_planned.append({
-                "start_at": new_start,
-                "duration_min": new_dur,
-                "location": new_loc,
-                "trainer_id": new_trainer_id,
+        plan = plan_week_copy(
+            src_monday=src_monday,
+            dst_monday=dst_monday,
+            weeks=weeks,
+            shift_min=shift_min,
+        )
+        if dry_run:
+            return render(request, "crm/repeat_week_preview.html", {
+                "plan": plan,
+                "src_monday": src_monday,
+                "dst_monday": dst_monday,
+                "weeks": weeks,
+                "shift_min": shift_min,
             })
-            created += 1
 
+        # одним INSERT; save()/сигналы не вызываются — кэш расписания сбрасываем сами
+        Session.objects.bulk_create(plan.to_create, batch_size=500)
+        if plan.to_create:
+            record_sessions(plan.to_create, ScheduleChange.Kind.CREATED)
+            availability.invalidate((s.hall_id, s.start_at, s.end_at) for s in plan.to_create)
+            transaction.on_commit(lambda: bump("schedule"))
+
+    created = len(plan.to_create)
+    skipped = len(plan.skipped)
     if created:
         messages.success(request, f"Готово: создано {created} занятий. Пропущено из-за конфликтов/границ недели: {skipped}.")
     else:
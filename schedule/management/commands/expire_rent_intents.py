@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.cache import exclusive
+from schedule import reservations
+from schedule.models import RentPaymentIntent
+
+LOCK_NAME = "expire_rent_intents"
+BATCH = 500
+
+
+class Command(BaseCommand):
+    help = "Cancel unpaid rent payment intents past their deadline (single instance, optionally in a loop)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep sweeping until stopped")
+        parser.add_argument("--interval", type=int, default=30, help="Seconds between sweeps in --loop mode")
+
+    def handle(self, *args, **opts):
+        interval = max(1, int(opts["interval"]))
+        # блокировка живёт дольше одного прохода; в цикле продлеваем её каждый раз
+        with exclusive(LOCK_NAME, timeout=interval * 4 + 60) as lock:
+            if lock is None:
+                self.stdout.write("Another sweeper is running, exiting")
+                return
+            while True:
+                expired = self.sweep()
+                if expired:
+                    self.stdout.write(self.style.SUCCESS(f"Expired {expired} rent payment intents"))
+                if not opts["loop"]:
+                    if not expired:
+                        self.stdout.write("Nothing to expire")
+                    return
+                time.sleep(interval)
+                if not lock.refresh():
+                    self.stdout.write("Sweeper lock lost, exiting")
+                    return
+
+    def sweep(self) -> int:
+        total = 0
+        while True:
+            # короткие пачки по id: UPDATE не держит блокировки на весь хвост таблицы
+            ids = list(RentPaymentIntent.objects.expired().order_by("id").values_list("id", flat=True)[:BATCH])
+            if not ids:
+                break
+            # повторный фильтр по статусу: вебхук мог успеть оплатить намерение
+            total += RentPaymentIntent.objects.expired().filter(id__in=ids).update(
+                status=RentPaymentIntent.Status.CANCELED,
+                tb_status="DEADLINE_EXPIRED",
+            )
+            if len(ids) < BATCH:
+                break
+        # резервы слотов истекают вместе с намерениями (update() сигналов не шлёт)
+        reservations.release_expired()
+        return total
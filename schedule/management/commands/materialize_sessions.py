@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from schedule.recurrence import materialize
+
+
+class Command(BaseCommand):
+    help = "Create Session rows from recurring rules for the given window (safe to re-run)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="from_day", default="", help="First day, YYYY-MM-DD (default: today)")
+        parser.add_argument("--days", type=int, default=28, help="Window length in days")
+
+    def handle(self, *args, **opts):
+        if opts["from_day"]:
+            try:
+                first_day = datetime.strptime(opts["from_day"], "%Y-%m-%d").date()
+            except ValueError as exc:
+                raise CommandError("--from must be YYYY-MM-DD") from exc
+        else:
+            first_day = timezone.localdate()
+        last_day = first_day + timedelta(days=max(1, int(opts["days"])) - 1)
+
+        with transaction.atomic():
+            result = materialize(first_day, last_day)
+
+        for item in result.skipped:
+            self.stdout.write(f"Skipped {item.rule} on {item.occurrence_date:%d.%m.%Y}: {item.reason}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result.created} sessions for {first_day:%d.%m.%Y}–{last_day:%d.%m.%Y}"
+        ))
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from schedule.models import ScheduleChange
+
+
+class Command(BaseCommand):
+    help = "Delete old rows from the schedule change log (the newest row is always kept)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-hours", type=int, default=48, help="Keep changes newer than this")
+
+    def handle(self, *args, **opts):
+        cutoff = timezone.now() - timedelta(hours=max(1, int(opts["keep_hours"])))
+        newest = ScheduleChange.objects.order_by("-id").values_list("id", flat=True).first()
+        # последняя строка нужна клиентам как курсор: без неё все получили бы reset
+        deleted, _ = ScheduleChange.objects.filter(created_at__lt=cutoff).exclude(id=newest).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} change log rows"))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from core.cache import bump
+from schedule.models import Booking, Session
+
+
+class Command(BaseCommand):
+    help = "Recount Session.booked_count from bookings and repair drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report drifted sessions, do not write")
+        parser.add_argument("--batch-size", type=int, default=500, help="Sessions per UPDATE statement")
+
+    def handle(self, *args, **opts):
+        dry_run = opts["dry_run"]
+        batch_size = max(1, int(opts["batch_size"]))
+
+        drifted = (
+            Session.objects
+            .annotate(actual=Count("bookings", filter=Q(bookings__booking_status=Booking.Status.BOOKED)))
+            .exclude(booked_count=F("actual"))
+            .order_by("id")
+            .values_list("id", "booked_count", "actual")
+        )
+
+        # Пересчитываем в самом UPDATE, а не переносим прочитанное значение:
+        # так параллельная запись между SELECT и UPDATE не даст нового расхождения.
+        actual_sq = Subquery(
+            Booking.objects
+            .filter(session_id=OuterRef("pk"), booking_status=Booking.Status.BOOKED)
+            .order_by()
+            .values("session_id")
+            .annotate(c=Count("id"))
+            .values("c")[:1],
+            output_field=IntegerField(),
+        )
+
+        fixed = 0
+        batch: list[int] = []
+        for session_id, stored, actual in drifted.iterator(chunk_size=batch_size):
+            if dry_run:
+                self.stdout.write(f"Session#{session_id}: booked_count={stored}, actual={actual}")
+            batch.append(session_id)
+            if len(batch) >= batch_size:
+                fixed += self._flush(batch, actual_sq, dry_run)
+                batch = []
+        fixed += self._flush(batch, actual_sq, dry_run)
+
+        # UPDATE по queryset не шлёт сигналов — сбрасываем кэш расписания сами
+        if fixed and not dry_run:
+            bump("schedule")
+
+        verb = "Would fix" if dry_run else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {fixed} sessions"))
+
+    @staticmethod
+    def _flush(batch: list[int], actual_sq, dry_run: bool) -> int:
+        if not batch:
+            return 0
+        if not dry_run:
+            Session.objects.filter(id__in=batch).update(booked_count=Coalesce(actual_sq, Value(0)))
+        return len(batch)
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_booked_count(apps, schema_editor):
+    Session = apps.get_model("schedule", "Session")
+    rows = (
+        Session.objects
+        .annotate(actual=Count("bookings", filter=Q(bookings__booking_status="booked")))
+        .filter(actual__gt=0)
+        .values_list("id", "actual")
+    )
+    for session_id, actual in rows.iterator():
+        Session.objects.filter(id=session_id).update(booked_count=actual)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("schedule", "0012_rentpaymentintent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="session",
+            name="booked_count",
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name="Записано"),
+        ),
+        migrations.RunPython(backfill_booked_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+import re
+
+from django.db import migrations, models
+
+
+def _norm_addr(raw: str) -> str:
+    if not raw:
+        return ""
+    s = raw.strip().lower().replace("ё", "е")
+    return re.sub(r"[^0-9a-zа-я]+", "", s)
+
+
+def backfill_location_key(apps, schema_editor):
+    for model_name in ("Session", "RentPaymentIntent"):
+        model = apps.get_model("schedule", model_name)
+        locations = model.objects.values_list("location", flat=True).distinct()
+        for location in list(locations):
+            model.objects.filter(location=location).update(location_key=_norm_addr(location))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("schedule", "0013_session_booked_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="session",
+            name="location_key",
+            field=models.CharField(blank=True, default="", editable=False, max_length=160, verbose_name="Ключ адреса"),
+        ),
+        migrations.AddField(
+            model_name="rentpaymentintent",
+            name="location_key",
+            field=models.CharField(blank=True, default="", editable=False, max_length=160, verbose_name="Ключ адреса"),
+        ),
+        migrations.RunPython(backfill_location_key, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name="session",
+            name="sess_loc_start_idx",
+        ),
+        migrations.AddIndex(
+            model_name="session",
+            index=models.Index(fields=["location_key", "start_at"], name="sess_lockey_start_idx"),
+        ),
+        migrations.RemoveIndex(
+            model_name="rentpaymentintent",
+            name="rentpi_loc_slot_idx",
+        ),
+        migrations.AddIndex(
+            model_name="rentpaymentintent",
+            index=models.Index(fields=["location_key", "slot_start"], name="rentpi_lockey_slot_idx"),
+        ),
+    ]
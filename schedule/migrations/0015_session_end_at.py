@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_end_at(apps, schema_editor):
+    Session = apps.get_model("schedule", "Session")
+    batch = []
+    for s in Session.objects.only("id", "start_at", "duration_min").iterator(chunk_size=1000):
+        s.end_at = s.start_at + timedelta(minutes=max(1, int(s.duration_min or 0)))
+        batch.append(s)
+        if len(batch) >= 1000:
+            Session.objects.bulk_update(batch, ["end_at"])
+            batch = []
+    if batch:
+        Session.objects.bulk_update(batch, ["end_at"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("schedule", "0014_location_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="session",
+            name="end_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name="Окончание"),
+        ),
+        migrations.RunPython(backfill_end_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="session",
+            name="end_at",
+            field=models.DateTimeField(blank=True, editable=False, verbose_name="Окончание"),
+        ),
+        migrations.AddIndex(
+            model_name="session",
+            index=models.Index(fields=["location_key", "end_at", "start_at"], name="sess_lockey_end_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="session",
+            index=models.Index(fields=["trainer", "end_at", "start_at"], name="sess_trainer_end_idx"),
+        ),
+    ]
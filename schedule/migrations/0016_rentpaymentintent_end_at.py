@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_end_at(apps, schema_editor):
+    RentPaymentIntent = apps.get_model("schedule", "RentPaymentIntent")
+    batch = []
+    for intent in RentPaymentIntent.objects.only("id", "slot_start", "duration_min").iterator(chunk_size=1000):
+        intent.end_at = intent.slot_start + timedelta(minutes=max(1, int(intent.duration_min or 0)))
+        batch.append(intent)
+        if len(batch) >= 1000:
+            RentPaymentIntent.objects.bulk_update(batch, ["end_at"])
+            batch = []
+    if batch:
+        RentPaymentIntent.objects.bulk_update(batch, ["end_at"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("schedule", "0015_session_end_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rentpaymentintent",
+            name="end_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name="Конец слота"),
+        ),
+        migrations.RunPython(backfill_end_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="rentpaymentintent",
+            name="end_at",
+            field=models.DateTimeField(blank=True, editable=False, verbose_name="Конец слота"),
+        ),
+        migrations.AddIndex(
+            model_name="rentpaymentintent",
+            index=models.Index(fields=["location_key", "end_at", "slot_start"], name="rentpi_lockey_end_idx"),
+        ),
+    ]
@@ -0,0 +1,157 @@
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _norm_addr(raw):
+    if not raw:
+        return ""
+    s = raw.strip().lower().replace("ё", "е")
+    return re.sub(r"[^0-9a-zа-я]+", "", s)
+
+
+def _aliases(key):
+    aliases = {key}
+    if key.endswith("8б"):
+        aliases.add(key[:-2] + "86")
+    if key.endswith("86"):
+        aliases.add(key[:-2] + "8б")
+    return aliases
+
+
+def seed_locations(apps, schema_editor):
+    Location = apps.get_model("schedule", "Location")
+    Session = apps.get_model("schedule", "Session")
+    RentPaymentIntent = apps.get_model("schedule", "RentPaymentIntent")
+
+    by_key = {}
+
+    def add(name, **extra):
+        name = " ".join(name.split())
+        key = _norm_addr(name)
+        if not key or any(alias in by_key for alias in _aliases(key)):
+            return
+        by_key[key] = Location.objects.create(name=name, key=key, **extra)
+
+    configured = [str(x) for x in getattr(settings, "WOOMFIT_LOCATIONS", []) if str(x).strip()]
+    for i, name in enumerate(configured):
+        add(name, sort=(i + 1) * 10)
+
+    # аренда раньше была «зашита» на Сакко и Ванцетти
+    rent_hall = next((loc for key, loc in by_key.items() if "саккоиванцетти" in key), None)
+    if rent_hall is None and by_key:
+        rent_hall = next(iter(by_key.values()))
+    if rent_hall is not None:
+        rent_hall.rent_enabled = True
+        rent_hall.save(update_fields=["rent_enabled"])
+
+    def resolve(raw):
+        key = _norm_addr(raw)
+        if not key:
+            return None
+        for alias in _aliases(key):
+            if alias in by_key:
+                return by_key[alias]
+        # адрес не из настроек — заводим скрытый зал, чтобы ничего не потерять
+        add(raw, sort=1000, is_active=False)
+        return by_key[key]
+
+    for model in (Session, RentPaymentIntent):
+        raw_values = model.objects.order_by().values_list("location", flat=True).distinct()
+        for raw in list(raw_values):
+            hall = resolve(raw)
+            if hall is not None:
+                model.objects.filter(location=raw).update(hall=hall, location=hall.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("schedule", "0016_rentpaymentintent_end_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Location",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=160, unique=True, verbose_name="Адрес")),
+                ("key", models.CharField(editable=False, max_length=160, unique=True, verbose_name="Ключ адреса")),
+                ("sort", models.PositiveIntegerField(default=0, verbose_name="Порядок")),
+                ("is_active", models.BooleanField(default=True, verbose_name="Показывать в расписании")),
+                ("capacity", models.PositiveIntegerField(default=0, help_text="0 — не ограничено", verbose_name="Вместимость зала, чел.")),
+                ("open_hour", models.PositiveSmallIntegerField(default=8, verbose_name="Открытие, час")),
+                ("close_hour", models.PositiveSmallIntegerField(default=22, verbose_name="Закрытие, час")),
+                ("rent_enabled", models.BooleanField(default=False, verbose_name="Сдаётся в аренду")),
+                ("rent_price_rub", models.PositiveIntegerField(default=650, verbose_name="Аренда, руб/час")),
+            ],
+            options={
+                "verbose_name": "Зал",
+                "verbose_name_plural": "Залы",
+                "ordering": ["sort", "id"],
+            },
+        ),
+        migrations.AddField(
+            model_name="rentpaymentintent",
+            name="hall",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name="rent_payment_intents", to="schedule.location", verbose_name="Зал"),
+        ),
+        migrations.AddField(
+            model_name="session",
+            name="hall",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name="sessions", to="schedule.location", verbose_name="Зал"),
+        ),
+        migrations.RunPython(seed_locations, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name="rentpaymentintent",
+            name="rentpi_lockey_slot_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="rentpaymentintent",
+            name="rentpi_lockey_end_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="session",
+            name="sess_lockey_start_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="session",
+            name="sess_lockey_end_idx",
+        ),
+        migrations.RemoveField(
+            model_name="rentpaymentintent",
+            name="location_key",
+        ),
+        migrations.RemoveField(
+            model_name="session",
+            name="location_key",
+        ),
+        migrations.AlterField(
+            model_name="rentpaymentintent",
+            name="location",
+            field=models.CharField(blank=True, db_index=True, max_length=160, verbose_name="Адрес"),
+        ),
+        migrations.AlterField(
+            model_name="session",
+            name="location",
+            field=models.CharField(blank=True, db_index=True, max_length=160, verbose_name="Адрес"),
+        ),
+        migrations.AddIndex(
+            model_name="rentpaymentintent",
+            index=models.Index(fields=["hall", "slot_start"], name="rentpi_hall_slot_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="rentpaymentintent",
+            index=models.Index(fields=["hall", "end_at", "slot_start"], name="rentpi_hall_end_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="session",
+            index=models.Index(fields=["hall", "start_at"], name="sess_hall_start_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="session",
+            index=models.Index(fields=["hall", "end_at", "start_at"], name="sess_hall_end_idx"),
+        ),
+    ]
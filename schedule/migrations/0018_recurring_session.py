@@ -0,0 +1,77 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("schedule", "0017_location"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecurringSessionException",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("occurrence_date", models.DateField(verbose_name="Дата по правилу")),
+                ("action", models.CharField(choices=[("cancel", "Отменить"), ("move", "Перенести")], default="cancel", max_length=8, verbose_name="Действие")),
+                ("new_start_at", models.DateTimeField(blank=True, null=True, verbose_name="Новое время")),
+                ("comment", models.CharField(blank=True, default="", max_length=240, verbose_name="Комментарий")),
+            ],
+            options={
+                "verbose_name": "Исключение из правила",
+                "verbose_name_plural": "Исключения из правил",
+                "ordering": ["occurrence_date"],
+            },
+        ),
+        migrations.AddField(
+            model_name="session",
+            name="occurrence_date",
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name="Дата по правилу"),
+        ),
+        migrations.CreateModel(
+            name="RecurringSession",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("title", models.CharField(max_length=160, verbose_name="Название")),
+                ("weekday", models.PositiveSmallIntegerField(choices=[(0, "Понедельник"), (1, "Вторник"), (2, "Среда"), (3, "Четверг"), (4, "Пятница"), (5, "Суббота"), (6, "Воскресенье")], verbose_name="День недели")),
+                ("start_time", models.TimeField(verbose_name="Время начала")),
+                ("duration_min", models.PositiveIntegerField(default=50, verbose_name="Длительность, мин")),
+                ("capacity", models.PositiveIntegerField(default=20, verbose_name="Вместимость")),
+                ("valid_from", models.DateField(verbose_name="Действует с")),
+                ("valid_until", models.DateField(blank=True, null=True, verbose_name="Действует по")),
+                ("is_active", models.BooleanField(default=True, verbose_name="Активно")),
+                ("hall", models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name="recurring_sessions", to="schedule.location", verbose_name="Зал")),
+                ("trainer", models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name="recurring_sessions", to="schedule.trainer", verbose_name="Тренер")),
+                ("workout", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name="recurring_sessions", to="schedule.workout", verbose_name="Шаблон тренировки")),
+            ],
+            options={
+                "verbose_name": "Повторяющееся занятие",
+                "verbose_name_plural": "Повторяющиеся занятия",
+                "ordering": ["weekday", "start_time", "id"],
+            },
+        ),
+        migrations.AddField(
+            model_name="session",
+            name="rule",
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="sessions", to="schedule.recurringsession", verbose_name="Правило"),
+        ),
+        migrations.AddConstraint(
+            model_name="session",
+            constraint=models.UniqueConstraint(fields=("rule", "occurrence_date"), name="uniq_session_occurrence"),
+        ),
+        migrations.AddField(
+            model_name="recurringsessionexception",
+            name="new_hall",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name="+", to="schedule.location", verbose_name="Новый зал"),
+        ),
+        migrations.AddField(
+            model_name="recurringsessionexception",
+            name="rule",
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="exceptions", to="schedule.recurringsession", verbose_name="Правило"),
+        ),
+        migrations.AddConstraint(
+            model_name="recurringsessionexception",
+            constraint=models.UniqueConstraint(fields=("rule", "occurrence_date"), name="uniq_recurring_exception"),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("schedule", "0018_recurring_session"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScheduleChange",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Когда")),
+                ("kind", models.CharField(choices=[("created", "Занятие создано"), ("moved", "Занятие перенесено"), ("updated", "Занятие изменено"), ("deleted", "Занятие удалено"), ("booking", "Изменились записи")], max_length=12, verbose_name="Что произошло")),
+                ("session_id", models.BigIntegerField(blank=True, null=True, verbose_name="Занятие")),
+                ("hall_id", models.BigIntegerField(blank=True, null=True, verbose_name="Зал")),
+                ("days", models.JSONField(default=list, verbose_name="Дни")),
+                ("is_public", models.BooleanField(default=True, verbose_name="Публичное")),
+                ("seats_left", models.IntegerField(blank=True, null=True, verbose_name="Свободно мест")),
+                ("waitlist_count", models.IntegerField(blank=True, null=True, verbose_name="В ожидании")),
+            ],
+            options={
+                "verbose_name": "Изменение расписания",
+                "verbose_name_plural": "Журнал изменений расписания",
+                "ordering": ["id"],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def reserve_open_slots(apps, schema_editor):
+    # будущие оплаченные и ещё не истёкшие намерения сразу получают резервы
+    RentPaymentIntent = apps.get_model("schedule", "RentPaymentIntent")
+    SlotReservation = apps.get_model("schedule", "SlotReservation")
+    now = timezone.now()
+    rows = []
+    intents = RentPaymentIntent.objects.filter(hall__isnull=False, end_at__gt=now).order_by("id")
+    for intent in intents:
+        if intent.status == "paid" and intent.session_id:
+            expires_at = None
+        elif intent.status in ("new", "pending") and intent.expires_at > now:
+            expires_at = intent.expires_at
+        else:
+            continue
+        rows.append(SlotReservation(
+            hall_id=intent.hall_id,
+            slot_start=intent.slot_start,
+            intent_id=intent.id,
+            session_id=intent.session_id,
+            expires_at=expires_at,
+        ))
+    SlotReservation.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("schedule", "0019_schedule_change"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlotReservation",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("slot_start", models.DateTimeField(verbose_name="Начало слота")),
+                ("expires_at", models.DateTimeField(blank=True, db_index=True, null=True, verbose_name="Держится до")),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Создано")),
+                ("hall", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="slot_reservations", to="schedule.location", verbose_name="Зал")),
+                ("intent", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name="reservations", to="schedule.rentpaymentintent", verbose_name="Намерение оплаты")),
+                ("session", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name="slot_reservations", to="schedule.session", verbose_name="Слот аренды")),
+            ],
+            options={
+                "verbose_name": "Резерв слота аренды",
+                "verbose_name_plural": "Резервы слотов аренды",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="slotreservation",
+            constraint=models.UniqueConstraint(fields=("hall", "slot_start"), name="uniq_slot_reservation"),
+        ),
+        migrations.RunPython(reserve_open_slots, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,10 @@
-from datetime import timedelta
+from datetime import date, timedelta
 import re
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
 from django.utils import timezone
 
 
@@ -14,6 +15,26 @@ def _norm_addr(raw: str) -> str:
     return re.sub(r"[^0-9a-zа-я]+", "", s)
 
 
+def location_aliases(raw: str) -> set[str]:
+    """Ключи адреса, под которыми может быть записан зал.
+
+    Допускаем частую опечатку 8б/86, чтобы не плодить «ложные» залы.
+    """
+    key = _norm_addr(raw)
+    if not key:
+        return set()
+    aliases = {key}
+    if key.endswith("8б"):
+        aliases.add(key[:-2] + "86")
+    if key.endswith("86"):
+        aliases.add(key[:-2] + "8б")
+    return aliases
+
+
+def _interval_end(start, duration_min):
+    return start + timedelta(minutes=max(1, int(duration_min or 0)))
+
+
 class Trainer(models.Model):
     name = models.CharField("Имя", max_length=120)
 
@@ -48,6 +69,248 @@ class Workout(models.Model):
         return self.name
 
 
+class LocationQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(is_active=True)
+
+    def rentable(self):
+        return self.filter(is_active=True, rent_enabled=True)
+
+    def resolve(self, raw: str) -> "Location | None":
+        """Зал по свободному тексту адреса (с учётом алиасов) или None."""
+        aliases = location_aliases(raw)
+        if not aliases:
+            return None
+        return self.filter(key__in=aliases).order_by("-is_active", "sort", "id").first()
+
+    def for_address(self, raw: str) -> "Location | None":
+        """Как resolve(), но неизвестный адрес заводит скрытым залом — чтобы FK был у каждой записи."""
+        found = self.resolve(raw)
+        if found is not None or not _norm_addr(raw):
+            return found
+        name = " ".join(raw.split())
+        location, _ = self.get_or_create(key=_norm_addr(name), defaults={"name": name, "is_active": False})
+        return location
+
+
+class Location(models.Model):
+    name = models.CharField("Адрес", max_length=160, unique=True)
+    # _norm_addr(name): по нему зал находится из свободного текста (?loc=, старые записи)
+    key = models.CharField("Ключ адреса", max_length=160, unique=True, editable=False)
+    sort = models.PositiveIntegerField("Порядок", default=0)
+    is_active = models.BooleanField("Показывать в расписании", default=True)
+
+    capacity = models.PositiveIntegerField("Вместимость зала, чел.", default=0, help_text="0 — не ограничено")
+    open_hour = models.PositiveSmallIntegerField("Открытие, час", default=8)
+    close_hour = models.PositiveSmallIntegerField("Закрытие, час", default=22)
+
+    rent_enabled = models.BooleanField("Сдаётся в аренду", default=False)
+    rent_price_rub = models.PositiveIntegerField("Аренда, руб/час", default=650)
+
+    objects = LocationQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Зал"
+        verbose_name_plural = "Залы"
+        ordering = ["sort", "id"]
+
+    def __str__(self) -> str:
+        return self.name
+
+    def clean(self):
+        super().clean()
+        if self.close_hour <= self.open_hour or self.close_hour > 24:
+            raise ValidationError({"close_hour": "Закрытие должно быть позже открытия (не позже 24)."})
+
+    def save(self, *args, **kwargs):
+        self.name = " ".join((self.name or "").split())
+        self.key = _norm_addr(self.name)
+        super().save(*args, **kwargs)
+
+
+def _sync_hall(obj, update_fields):
+    """hall — источник истины, location (текст) — его имя.
+
+    Код, который по-старому задаёт только текст адреса, получает зал по алиасам.
+    Возвращает update_fields, дополненный производными полями.
+    """
+    loaded = getattr(obj, "_loaded_location", None)
+    text_changed = obj.pk is not None and loaded is not None and obj.location != loaded
+    if obj.location and (obj.hall_id is None or text_changed):
+        obj.hall = Location.objects.for_address(obj.location)
+    if obj.hall_id is not None:
+        obj.location = obj.hall.name
+    obj._loaded_location = obj.location
+
+    if update_fields is not None and {"location", "hall"} & set(update_fields):
+        update_fields = {*update_fields, "location", "hall"}
+    return update_fields
+
+
+class RecurringSessionQuerySet(models.QuerySet):
+    def active_between(self, first_day: date, last_day: date):
+        """Активные правила, срок действия которых пересекает [first_day, last_day]."""
+        return self.filter(is_active=True, valid_from__lte=last_day).filter(
+            Q(valid_until__isnull=True) | Q(valid_until__gte=first_day)
+        )
+
+
+class RecurringSession(models.Model):
+    """Правило «каждую неделю в этот день и время».
+
+    Конкретные Session создаются лениво (schedule.recurrence) на просматриваемое
+    окно, поэтому таблица занятий не растёт копиями недель впрок.
+    """
+
+    class Weekday(models.IntegerChoices):
+        MON = 0, "Понедельник"
+        TUE = 1, "Вторник"
+        WED = 2, "Среда"
+        THU = 3, "Четверг"
+        FRI = 4, "Пятница"
+        SAT = 5, "Суббота"
+        SUN = 6, "Воскресенье"
+
+    title = models.CharField("Название", max_length=160)
+    workout = models.ForeignKey(
+        Workout,
+        verbose_name="Шаблон тренировки",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="recurring_sessions",
+    )
+    weekday = models.PositiveSmallIntegerField("День недели", choices=Weekday.choices)
+    start_time = models.TimeField("Время начала")
+    duration_min = models.PositiveIntegerField("Длительность, мин", default=50)
+    hall = models.ForeignKey(Location, verbose_name="Зал", on_delete=models.PROTECT, related_name="recurring_sessions")
+    trainer = models.ForeignKey(Trainer, verbose_name="Тренер", on_delete=models.PROTECT, related_name="recurring_sessions")
+    capacity = models.PositiveIntegerField("Вместимость", default=20)
+
+    valid_from = models.DateField("Действует с")
+    valid_until = models.DateField("Действует по", null=True, blank=True)
+    is_active = models.BooleanField("Активно", default=True)
+
+    objects = RecurringSessionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Повторяющееся занятие"
+        verbose_name_plural = "Повторяющиеся занятия"
+        ordering = ["weekday", "start_time", "id"]
+
+    def __str__(self) -> str:
+        return f"{self.title} — {self.get_weekday_display()} {self.start_time.strftime('%H:%M')}"
+
+    def clean(self):
+        super().clean()
+        if self.valid_until and self.valid_from and self.valid_until < self.valid_from:
+            raise ValidationError({"valid_until": "Дата окончания раньше даты начала."})
+
+    def occurrence_dates(self, first_day: date, last_day: date) -> list[date]:
+        """Даты занятий правила внутри [first_day, last_day]."""
+        first_day = max(first_day, self.valid_from)
+        if self.valid_until:
+            last_day = min(last_day, self.valid_until)
+        if first_day > last_day:
+            return []
+        cur = first_day + timedelta(days=(self.weekday - first_day.weekday()) % 7)
+        dates = []
+        while cur <= last_day:
+            dates.append(cur)
+            cur += timedelta(days=7)
+        return dates
+
+
+class RecurringSessionException(models.Model):
+    """Исключение для одного занятия правила: отмена или перенос."""
+
+    class Action(models.TextChoices):
+        CANCEL = "cancel", "Отменить"
+        MOVE = "move", "Перенести"
+
+    rule = models.ForeignKey(
+        RecurringSession,
+        verbose_name="Правило",
+        on_delete=models.CASCADE,
+        related_name="exceptions",
+    )
+    occurrence_date = models.DateField("Дата по правилу")
+    action = models.CharField("Действие", max_length=8, choices=Action.choices, default=Action.CANCEL)
+    new_start_at = models.DateTimeField("Новое время", null=True, blank=True)
+    new_hall = models.ForeignKey(
+        Location,
+        verbose_name="Новый зал",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    comment = models.CharField("Комментарий", max_length=240, blank=True, default="")
+
+    class Meta:
+        verbose_name = "Исключение из правила"
+        verbose_name_plural = "Исключения из правил"
+        ordering = ["occurrence_date"]
+        constraints = [
+            models.UniqueConstraint(fields=["rule", "occurrence_date"], name="uniq_recurring_exception"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.get_action_display()} {self.occurrence_date:%d.%m.%Y}"
+
+    def clean(self):
+        super().clean()
+        if self.action == self.Action.MOVE and not self.new_start_at:
+            raise ValidationError({"new_start_at": "Для переноса укажите новое время."})
+        if self.rule_id and self.occurrence_date and self.rule.weekday != self.occurrence_date.weekday():
+            raise ValidationError({"occurrence_date": "В этот день недели правило не действует."})
+        if self.action == self.Action.CANCEL and self.rule_id:
+            booked = Booking.objects.filter(
+                session__rule_id=self.rule_id,
+                session__occurrence_date=self.occurrence_date,
+                booking_status=Booking.Status.BOOKED,
+            ).exists()
+            if booked:
+                raise ValidationError("На это занятие уже записаны клиенты — сначала отмените записи.")
+
+
+class IntervalQuerySet(models.QuerySet):
+    """Интервалы [start_field, end_at) с хранимым end_at."""
+
+    start_field = "start_at"
+
+    def overlapping(self, start, end):
+        """Интервалы, пересекающиеся с [start, end)."""
+        return self.filter(**{f"{self.start_field}__lt": end, "end_at__gt": start})
+
+
+class SessionQuerySet(IntervalQuerySet):
+    def with_occupancy(self, user=None):
+        """Занятия с заполненностью и статусом записи зрителя — одним SQL.
+
+        booked берём из хранимого booked_count, waitlist_count/invited_count
+        считаем условными COUNT по одному JOIN на bookings, my_status —
+        подзапросом по записи пользователя (для анонима всегда пусто).
+        """
+        qs = self.annotate(
+            waitlist_count=Count("bookings", filter=Q(bookings__booking_status="waitlist")),
+            invited_count=Count("bookings", filter=Q(bookings__booking_status="invited")),
+        )
+        if getattr(user, "is_authenticated", False):
+            my_status = Subquery(
+                Booking.objects
+                .filter(session_id=OuterRef("pk"), user_id=user.pk)
+                .values("booking_status")[:1]
+            )
+        else:
+            my_status = models.Value("", output_field=models.CharField())
+        return qs.annotate(my_status=my_status)
+
+
+class SessionFull(Exception):
+    """На занятии не осталось мест: booked_count упёрся в capacity."""
+
+
 class Session(models.Model):
     class Kind(models.TextChoices):
         GROUP = "group", "Групповая"
@@ -91,7 +354,18 @@ class Session(models.Model):
 
     start_at = models.DateTimeField("Дата/время", db_index=True)
     duration_min = models.PositiveIntegerField("Длительность, мин", default=50)
-    location = models.CharField("Адрес", max_length=160, db_index=True)
+    # start_at + duration_min (минимум 1 минута), заполняется в save()
+    end_at = models.DateTimeField("Окончание", blank=True, editable=False)
+    hall = models.ForeignKey(
+        Location,
+        verbose_name="Зал",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="sessions",
+    )
+    # Имя зала (дублируется для уведомлений/поиска), заполняется в save() из hall
+    location = models.CharField("Адрес", max_length=160, blank=True, db_index=True)
 
     trainer = models.ForeignKey(
         Trainer,
@@ -102,85 +376,133 @@ class Session(models.Model):
 
     capacity = models.PositiveIntegerField("Вместимость", default=20)
 
+    # Занятие, созданное по правилу (schedule.recurrence); пара уникальна — материализация идемпотентна
+    rule = models.ForeignKey(
+        RecurringSession,
+        verbose_name="Правило",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="sessions",
+    )
+    occurrence_date = models.DateField("Дата по правилу", null=True, blank=True, editable=False)
+
+    # Денормализованный счётчик записей в статусе BOOKED.
+    # Ведётся Booking.save()/post_delete, чинится командой reconcile_seat_counts.
+    booked_count = models.PositiveIntegerField("Записано", default=0, editable=False)
+
+    objects = SessionQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Занятие"
         verbose_name_plural = "Занятия"
         ordering = ["start_at"]
         indexes = [
-            models.Index(fields=["location", "start_at"], name="sess_loc_start_idx"),
+            models.Index(fields=["hall", "start_at"], name="sess_hall_start_idx"),
             models.Index(fields=["start_at"], name="sess_start_idx"),
+            # окна пересечений: end_at > start AND start_at < end
+            models.Index(fields=["hall", "end_at", "start_at"], name="sess_hall_end_idx"),
+            models.Index(fields=["trainer", "end_at", "start_at"], name="sess_trainer_end_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["rule", "occurrence_date"], name="uniq_session_occurrence"),
         ]
 
     def __str__(self) -> str:
         return f"{self.title} — {timezone.localtime(self.start_at).strftime('%d.%m %H:%M')}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_location = instance.__dict__.get("location")
+        # для журнала изменений: откуда занятие перенесли
+        instance._loaded_start_at = instance.__dict__.get("start_at")
+        instance._loaded_end_at = instance.__dict__.get("end_at")
+        instance._loaded_hall_id = instance.__dict__.get("hall_id")
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = _sync_hall(self, kwargs.get("update_fields"))
+        if self.start_at:
+            self.end_at = _interval_end(self.start_at, self.duration_min)
+        if update_fields is not None:
+            if {"start_at", "duration_min"} & set(update_fields):
+                update_fields = {*update_fields, "end_at"}
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
+        self._loaded_start_at = self.start_at
+        self._loaded_end_at = self.end_at
+        self._loaded_hall_id = self.hall_id
+
     def clean(self):
         super().clean()
 
-        if not self.start_at or not self.duration_min or not self.location:
+        if self.hall_id:
+            same_hall = Q(hall_id=self.hall_id)
+        elif self.location:
+            # зал ещё не проставлен (save() сделает это) — ищем по алиасам адреса тем же запросом
+            same_hall = Q(hall__key__in=location_aliases(self.location))
+        else:
+            return
+        if not self.start_at or not self.duration_min:
             return
 
         own_start = self.start_at
-        own_duration = max(1, int(self.duration_min or 0))
-        own_end = own_start + timedelta(minutes=own_duration)
-        own_loc = _norm_addr(self.location)
+        own_end = _interval_end(own_start, self.duration_min)
 
-        # Запрещаем пересечения по залу: это защищает от постановки тренировки
-        # поверх оплаченной аренды и наоборот.
-        location_qs = (
+        def fmt(other) -> str:
+            other_start_local = timezone.localtime(other.start_at)
+            other_end_local = timezone.localtime(other.end_at)
+            return f"{other_start_local.strftime('%d.%m %H:%M')}–{other_end_local.strftime('%H:%M')}."
+
+        # Только пересекающиеся интервалы: end_at > own_start AND start_at < own_end.
+        window = (
             Session.objects
-            .filter(start_at__lt=own_end)
+            .overlapping(own_start, own_end)
             .exclude(pk=self.pk)
+            .only("start_at", "end_at", "kind")
             .order_by("start_at")
         )
-        for other in location_qs:
-            if _norm_addr(other.location) != own_loc:
-                continue
-            other_start = other.start_at
-            other_end = other_start + timedelta(minutes=max(1, int(other.duration_min or 0)))
-            if own_start < other_end and other_start < own_end:
-                other_start_local = timezone.localtime(other_start)
-                other_end_local = timezone.localtime(other_end)
-                if self.kind == self.Kind.RENT or other.kind == self.Kind.RENT:
-                    raise ValidationError({
-                        "start_at": (
-                            "Зал уже забронирован на это время: "
-                            f"{other_start_local.strftime('%d.%m %H:%M')}–{other_end_local.strftime('%H:%M')}."
-                        )
-                    })
-                raise ValidationError({
-                    "start_at": (
-                        "В этом зале уже есть занятие: "
-                        f"{other_start_local.strftime('%d.%m %H:%M')}–{other_end_local.strftime('%H:%M')}."
-                    )
-                })
+        errors: dict[str, list[str]] = {}
 
-        if not self.trainer_id:
-            return
+        # Запрещаем пересечения по залу: это защищает от постановки тренировки
+        # поверх оплаченной аренды и наоборот.
+        for other in window.filter(same_hall):
+            if self.kind == self.Kind.RENT or other.kind == self.Kind.RENT:
+                msg = f"Зал уже забронирован на это время: {fmt(other)}"
+            else:
+                msg = f"В этом зале уже есть занятие: {fmt(other)}"
+            errors.setdefault("start_at", []).append(msg)
 
-        trainer_qs = (
-            Session.objects
-            .filter(trainer_id=self.trainer_id, start_at__lt=own_end)
-            .exclude(pk=self.pk)
-            .order_by("start_at")
-        )
-        for other in trainer_qs:
-            other_start = other.start_at
-            other_end = other_start + timedelta(minutes=max(1, int(other.duration_min or 0)))
-            if own_start < other_end and other_start < own_end:
-                other_start_local = timezone.localtime(other_start)
-                other_end_local = timezone.localtime(other_end)
-                raise ValidationError({
-                    "trainer": (
-                        "У тренера уже есть занятие в это время: "
-                        f"{other_start_local.strftime('%d.%m %H:%M')}–{other_end_local.strftime('%H:%M')}."
-                    )
-                })
+        if self.trainer_id:
+            for other in window.filter(trainer_id=self.trainer_id):
+                errors.setdefault("trainer", []).append(f"У тренера уже есть занятие в это время: {fmt(other)}")
+
+        if errors:
+            raise ValidationError(errors)
 
     @property
     def seats_left(self) -> int:
-        booked = self.bookings.filter(booking_status=Booking.Status.BOOKED).count()
-        return max(0, int(self.capacity) - int(booked))
+        return max(0, int(self.capacity) - int(self.booked_count or 0))
+
+    @classmethod
+    def shift_booked_count(cls, session_id, delta: int, *, instance=None) -> None:
+        """Атомарно сдвигает booked_count на delta: в минус — не ниже нуля,
+        в плюс — не выше capacity, иначе SessionFull."""
+        if not session_id or not delta:
+            return
+        qs = cls.objects.filter(pk=session_id)
+        if delta < 0:
+            qs = qs.filter(booked_count__gte=-delta)
+        else:
+            # проверка мест и увеличение — одним UPDATE: параллельные записи не переполнят занятие
+            qs = qs.filter(booked_count__lte=F("capacity") - delta)
+        updated = qs.update(booked_count=F("booked_count") + delta)
+        if not updated and delta > 0:
+            raise SessionFull(session_id)
+        if updated and instance is not None:
+            instance.booked_count = max(0, int(instance.booked_count or 0) + delta)
 
 
 class Booking(models.Model):
@@ -259,6 +581,46 @@ class Booking(models.Model):
     def __str__(self) -> str:
         return f"{self.user} → {self.session} ({self.booking_status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_seat()
+        return instance
+
+    def _remember_seat(self):
+        # На какое занятие эта запись занимает место в БД (None — не занимает).
+        booked = self.booking_status == self.Status.BOOKED
+        self._seat_session_id = self.session_id if booked else None
+        self._counted_as = self.counted_as()
+
+    def counted_as(self):
+        """(занятие, статус), если запись входит в публичные счётчики
+        (свободные места, лист ожидания), иначе None."""
+        if self.booking_status in (self.Status.BOOKED, self.Status.WAITLIST):
+            return self.session_id, self.booking_status
+        return None
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        old_seat = getattr(self, "_seat_session_id", None)
+        # запись и счётчик мест — вместе: SessionFull откатывает и саму запись
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if update_fields is not None and not {"booking_status", "session", "session_id"} & set(update_fields):
+                return
+
+            new_seat = self.session_id if self.booking_status == self.Status.BOOKED else None
+            if old_seat != new_seat:
+                cached = self.session if Booking.session.is_cached(self) else None
+                if old_seat:
+                    Session.shift_booked_count(
+                        old_seat, -1, instance=cached if cached and cached.pk == old_seat else None,
+                    )
+                if new_seat:
+                    Session.shift_booked_count(new_seat, 1, instance=cached)
+        self._remember_seat()
+
     def cancel(self):
         if self.booking_status != self.Status.CANCELED:
             self.booking_status = self.Status.CANCELED
@@ -317,6 +679,20 @@ class RentRequest(models.Model):
         return f"{self.full_name} — {timezone.localtime(self.session.start_at).strftime('%d.%m %H:%M')}"
 
 
+class RentPaymentIntentQuerySet(IntervalQuerySet):
+    start_field = "slot_start"
+
+    def holding(self, now=None):
+        """Неоплаченные намерения, которые ещё держат слот; истёкшие считаются свободными."""
+        Status = self.model.Status
+        return self.filter(status__in=(Status.NEW, Status.PENDING), expires_at__gt=now or timezone.now())
+
+    def expired(self, now=None):
+        """Неоплаченные намерения с истёкшим сроком — их отменяет expire_rent_intents."""
+        Status = self.model.Status
+        return self.filter(status__in=(Status.NEW, Status.PENDING), expires_at__lte=now or timezone.now())
+
+
 class RentPaymentIntent(models.Model):
     class Status(models.TextChoices):
         NEW = "new", "Новый"
@@ -343,9 +719,18 @@ class RentPaymentIntent(models.Model):
         db_index=True,
     )
 
-    location = models.CharField("Адрес", max_length=160, db_index=True)
+    hall = models.ForeignKey(
+        Location,
+        verbose_name="Зал",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="rent_payment_intents",
+    )
+    location = models.CharField("Адрес", max_length=160, blank=True, db_index=True)
     slot_start = models.DateTimeField("Начало слота", db_index=True)
     duration_min = models.PositiveIntegerField("Длительность, мин", default=60)
+    end_at = models.DateTimeField("Конец слота", blank=True, editable=False)
 
     full_name = models.CharField("ФИО", max_length=255)
     email = models.EmailField("E-mail", blank=True, default="")
@@ -364,18 +749,79 @@ class RentPaymentIntent(models.Model):
     expires_at = models.DateTimeField("Оплатить до", db_index=True)
     paid_at = models.DateTimeField("Оплачено", null=True, blank=True)
 
+    objects = RentPaymentIntentQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Намерение оплаты аренды"
         verbose_name_plural = "Намерения оплаты аренды"
         ordering = ["-created_at"]
         indexes = [
             models.Index(fields=["status", "expires_at"], name="rentpi_status_exp_idx"),
-            models.Index(fields=["location", "slot_start"], name="rentpi_loc_slot_idx"),
+            models.Index(fields=["hall", "slot_start"], name="rentpi_hall_slot_idx"),
+            models.Index(fields=["hall", "end_at", "slot_start"], name="rentpi_hall_end_idx"),
         ]
 
     def __str__(self) -> str:
         return f"RentPaymentIntent#{self.id} {self.full_name} ({self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_location = instance.__dict__.get("location")
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = _sync_hall(self, kwargs.get("update_fields"))
+        if self.slot_start:
+            self.end_at = _interval_end(self.slot_start, self.duration_min)
+        if update_fields is not None:
+            if {"slot_start", "duration_min"} & set(update_fields):
+                update_fields = {*update_fields, "end_at"}
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
+
+
+class SlotReservation(models.Model):
+    """Занятый часовой слот аренды. Уникальность (зал, начало) и есть блокировка:
+    вставка либо проходит, либо падает, и спорят только претенденты на тот же час."""
+
+    hall = models.ForeignKey(
+        Location,
+        verbose_name="Зал",
+        on_delete=models.CASCADE,
+        related_name="slot_reservations",
+    )
+    slot_start = models.DateTimeField("Начало слота")
+    intent = models.ForeignKey(
+        RentPaymentIntent,
+        verbose_name="Намерение оплаты",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="reservations",
+    )
+    session = models.ForeignKey(
+        Session,
+        verbose_name="Слот аренды",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="slot_reservations",
+    )
+    # null — оплачено, резерв держится, пока существует занятие
+    expires_at = models.DateTimeField("Держится до", null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Резерв слота аренды"
+        verbose_name_plural = "Резервы слотов аренды"
+        constraints = [
+            models.UniqueConstraint(fields=["hall", "slot_start"], name="uniq_slot_reservation"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.hall_id}: {timezone.localtime(self.slot_start).strftime('%d.%m %H:%M')}"
+
 
 class PaymentIntent(models.Model):
     """Оплата разового занятия (без абонемента)."""
@@ -422,3 +868,39 @@ class PaymentIntent(models.Model):
 
     def __str__(self) -> str:
         return f"PaymentIntent#{self.id} {self.user_id} → session#{self.session_id} ({self.status})"
+
+
+class ScheduleChange(models.Model):
+    """Журнал изменений расписания: только добавление, id монотонно растёт.
+
+    Клиенты (CRM-сетка, публичное расписание) запоминают последний id и
+    дочитывают «изменения после N», вместо того чтобы перезагружать страницу.
+    """
+
+    class Kind(models.TextChoices):
+        CREATED = "created", "Занятие создано"
+        MOVED = "moved", "Занятие перенесено"
+        UPDATED = "updated", "Занятие изменено"
+        DELETED = "deleted", "Занятие удалено"
+        BOOKING = "booking", "Изменились записи"
+
+    id = models.BigAutoField(primary_key=True)
+    created_at = models.DateTimeField("Когда", auto_now_add=True, db_index=True)
+    kind = models.CharField("Что произошло", max_length=12, choices=Kind.choices)
+    # не FK: удалённые занятия тоже остаются в журнале; None — пакетная вставка без id
+    session_id = models.BigIntegerField("Занятие", null=True, blank=True)
+    hall_id = models.BigIntegerField("Зал", null=True, blank=True)
+    # локальные даты (ISO), которых коснулось изменение: при переносе — старая и новая
+    days = models.JSONField("Дни", default=list)
+    # групповые занятия видны всем; персональные и аренда — только персоналу
+    is_public = models.BooleanField("Публичное", default=True)
+    seats_left = models.IntegerField("Свободно мест", null=True, blank=True)
+    waitlist_count = models.IntegerField("В ожидании", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Изменение расписания"
+        verbose_name_plural = "Журнал изменений расписания"
+        ordering = ["id"]
+
+    def __str__(self) -> str:
+        return f"#{self.id} {self.get_kind_display()}"
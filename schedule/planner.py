@@ -0,0 +1,265 @@
+"""Копирование недели и пакетный перенос занятий с разрешением конфликтов.
+
+Конфликты ищутся не попарным сравнением, а по отсортированным «таймлайнам»
+ресурсов (зал, тренер): существующие занятия сливаются в непересекающиеся
+интервалы одним проходом (sweep line), а каждая копия проверяется и
+вставляется бинарным поиском. Итого O((n + m) · log) вместо O(n · m).
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Iterable
+
+from django.utils import timezone
+
+from .models import Session
+
+
+class _Timeline:
+    """Непересекающиеся интервалы одного ресурса, отсортированные по началу.
+
+    Слитый интервал помнит исходные занятия: в причине пропуска показываем
+    то, что реально мешает копии, а не весь слитый промежуток.
+    """
+
+    def __init__(self, intervals: Iterable[tuple[datetime, datetime]] = ()):
+        self.starts: list[datetime] = []
+        self.ends: list[datetime] = []
+        self.members: list[list[tuple[datetime, datetime]]] = []
+        for start, end in sorted(intervals):
+            if self.ends and start < self.ends[-1]:
+                # пересекается с предыдущим — расширяем его (sweep line)
+                self.ends[-1] = max(self.ends[-1], end)
+                self.members[-1].append((start, end))
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+                self.members.append([(start, end)])
+
+    def conflict(self, start: datetime, end: datetime) -> tuple[datetime, datetime] | None:
+        # среди интервалов, начавшихся до end, достаточно проверить последний:
+        # интервалы не пересекаются, значит и концы отсортированы
+        i = bisect_left(self.starts, end) - 1
+        if i >= 0 and self.ends[i] > start:
+            # занятия покрывают слитый интервал без дыр — одно из них точно пересекается
+            return next(m for m in self.members[i] if m[0] < end and m[1] > start)
+        return None
+
+    def add(self, start: datetime, end: datetime) -> None:
+        i = bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.members.insert(i, [(start, end)])
+
+
+@dataclass
+class SkippedCopy:
+    source: Session
+    start_at: datetime | None
+    reasons: list[str]
+
+
+@dataclass
+class WeekCopyPlan:
+    to_create: list[Session] = field(default_factory=list)
+    skipped: list[SkippedCopy] = field(default_factory=list)
+
+
+def _fmt_interval(interval: tuple[datetime, datetime]) -> str:
+    start, end = interval
+    return f"{timezone.localtime(start).strftime('%d.%m %H:%M')}–{timezone.localtime(end).strftime('%H:%M')}"
+
+
+def _copy_start(src_start: datetime, *, src_monday: date, dst_monday: date, shift_min: int, tz) -> datetime:
+    src_local = timezone.localtime(src_start, tz)
+    delta_days = (src_local.date() - src_monday).days
+    new_naive = datetime.combine(dst_monday + timedelta(days=delta_days), src_local.time()) + timedelta(minutes=shift_min)
+    # сетка планирования — 10 минут: некратное время округляем вниз
+    new_naive = new_naive.replace(minute=(new_naive.minute // 10) * 10, second=0, microsecond=0)
+    return timezone.make_aware(new_naive, tz)
+
+
+def plan_week_copy(
+    *,
+    src_monday: date,
+    dst_monday: date,
+    weeks: int = 1,
+    shift_min: int = 0,
+) -> WeekCopyPlan:
+    """Планирует копии занятий недели src_monday в weeks недель начиная с dst_monday.
+
+    Ничего не пишет в БД: возвращает несохранённые Session (с проставленными
+    hall/location/end_at — для bulk_create) и список пропусков с причинами.
+    Проверки те же, что в Session.clean: пересечение по залу и по тренеру,
+    включая пересечения копий между собой.
+    """
+    tz = timezone.get_current_timezone()
+    src_start = timezone.make_aware(datetime.combine(src_monday, datetime.min.time()), tz)
+    src_end = src_start + timedelta(days=7)
+    dst_start = timezone.make_aware(datetime.combine(dst_monday, datetime.min.time()), tz)
+    dst_end = timezone.make_aware(datetime.combine(dst_monday + timedelta(days=7 * weeks), datetime.min.time()), tz)
+
+    src_sessions = list(
+        Session.objects
+        .select_related("trainer", "hall")
+        .filter(start_at__gte=src_start, start_at__lt=src_end)
+        .order_by("start_at", "id")
+    )
+
+    by_resource: dict[tuple, list[tuple[datetime, datetime]]] = {}
+    for row in Session.objects.overlapping(dst_start, dst_end).values("start_at", "end_at", "hall_id", "trainer_id"):
+        interval = (row["start_at"], row["end_at"])
+        if row["hall_id"]:
+            by_resource.setdefault(("hall", row["hall_id"]), []).append(interval)
+        if row["trainer_id"]:
+            by_resource.setdefault(("trainer", row["trainer_id"]), []).append(interval)
+    timelines = {key: _Timeline(intervals) for key, intervals in by_resource.items()}
+
+    candidates = []
+    for week in range(weeks):
+        week_monday = dst_monday + timedelta(days=7 * week)
+        week_end = dst_start + timedelta(days=7 * (week + 1))
+        week_start = dst_start + timedelta(days=7 * week)
+        for s in src_sessions:
+            new_start = _copy_start(s.start_at, src_monday=src_monday, dst_monday=week_monday, shift_min=shift_min, tz=tz)
+            in_week = week_start <= new_start < week_end
+            candidates.append((new_start, in_week, s))
+    # жадно в хронологическом порядке — как раньше при последовательном создании
+    candidates.sort(key=lambda c: (c[0], c[2].id))
+
+    plan = WeekCopyPlan()
+    for new_start, in_week, s in candidates:
+        if not in_week:
+            plan.skipped.append(SkippedCopy(s, new_start, ["выпадает за пределы недели назначения (сдвиг)"]))
+            continue
+        if s.rule_id:
+            plan.skipped.append(SkippedCopy(s, new_start, ["повторяется по правилу — копия не нужна"]))
+            continue
+
+        new_end = new_start + (s.end_at - s.start_at)
+
+        resources = []
+        if s.hall_id:
+            resources.append((("hall", s.hall_id), "Зал занят"))
+        if s.trainer_id:
+            resources.append((("trainer", s.trainer_id), "Тренер занят"))
+
+        reasons = []
+        for key, label in resources:
+            timeline = timelines.get(key)
+            hit = timeline.conflict(new_start, new_end) if timeline else None
+            if hit:
+                reasons.append(f"{label}: {_fmt_interval(hit)}")
+        if reasons:
+            plan.skipped.append(SkippedCopy(s, new_start, reasons))
+            continue
+
+        for key, _ in resources:
+            timelines.setdefault(key, _Timeline()).add(new_start, new_end)
+
+        # bulk_create не вызывает save(): производные поля считаем здесь
+        plan.to_create.append(Session(
+            title=s.title,
+            kind=s.kind,
+            workout_id=s.workout_id,
+            client_id=s.client_id,
+            start_at=new_start,
+            end_at=new_end,
+            duration_min=s.duration_min,
+            hall=s.hall,
+            location=s.hall.name if s.hall_id else s.location,
+            trainer=s.trainer,
+            capacity=s.capacity,
+        ))
+
+    return plan
+
+
+@dataclass
+class MoveTarget:
+    """Новое положение занятия: время, длительность, зал."""
+    session: Session
+    start_at: datetime
+    duration_min: int
+    hall_id: int | None
+
+    @property
+    def end_at(self) -> datetime:
+        return self.start_at + timedelta(minutes=max(1, int(self.duration_min or 0)))
+
+
+def _overlap_message(resource: str, *, own_kind: str, other_kind: str, start: datetime, end: datetime) -> str:
+    interval = f"{_fmt_interval((start, end))}."
+    if resource == "trainer":
+        return f"У тренера уже есть занятие в это время: {interval}"
+    if Session.Kind.RENT in (own_kind, other_kind):
+        return f"Зал уже забронирован на это время: {interval}"
+    return f"В этом зале уже есть занятие: {interval}"
+
+
+def find_move_conflicts(targets: list[MoveTarget]) -> dict[int, list[str]]:
+    """Проверяет пачку переносов так, будто все они уже применены.
+
+    Старые места переносимых занятий считаются свободными, новые проверяются
+    и с остальным расписанием (один запрос), и друг с другом. Сообщения — как в
+    Session.clean. Возвращает {session_id: [ошибки]} только для конфликтных.
+    """
+    if not targets:
+        return {}
+
+    moved_ids = {t.session.id for t in targets}
+    lo = min(t.start_at for t in targets)
+    hi = max(t.end_at for t in targets)
+
+    # (start, end, kind, session_id) по ресурсам; session_id=None — неподвижные занятия
+    by_resource: dict[tuple, list[tuple]] = {}
+    rows = (
+        Session.objects
+        .overlapping(lo, hi)
+        .exclude(id__in=moved_ids)
+        .values_list("start_at", "end_at", "kind", "hall_id", "trainer_id")
+    )
+    for start, end, kind, hall_id, trainer_id in rows:
+        if hall_id:
+            by_resource.setdefault(("hall", hall_id), []).append((start, end, kind, None))
+        if trainer_id:
+            by_resource.setdefault(("trainer", trainer_id), []).append((start, end, kind, None))
+    for t in targets:
+        entry = (t.start_at, t.end_at, t.session.kind, t.session.id)
+        if t.hall_id:
+            by_resource.setdefault(("hall", t.hall_id), []).append(entry)
+        if t.session.trainer_id:
+            by_resource.setdefault(("trainer", t.session.trainer_id), []).append(entry)
+
+    # сортировка + префиксный максимум концов: поиск пересечений без перебора всех пар
+    index = {}
+    for key, entries in by_resource.items():
+        entries.sort(key=lambda e: e[0])
+        prefix_end, running = [], None
+        for e in entries:
+            running = e[1] if running is None else max(running, e[1])
+            prefix_end.append(running)
+        index[key] = ([e[0] for e in entries], prefix_end, entries)
+
+    errors: dict[int, list[str]] = {}
+    for t in targets:
+        keys = []
+        if t.hall_id:
+            keys.append(("hall", t.hall_id))
+        if t.session.trainer_id:
+            keys.append(("trainer", t.session.trainer_id))
+        for key in keys:
+            starts, prefix_end, entries = index[key]
+            i = bisect_left(starts, t.end_at) - 1
+            hits = []
+            # левее i все интервалы кончаются не позже prefix_end[i] — дальше можно не смотреть
+            while i >= 0 and prefix_end[i] > t.start_at:
+                start, end, kind, owner = entries[i]
+                if owner != t.session.id and end > t.start_at:
+                    hits.append(_overlap_message(key[0], own_kind=t.session.kind, other_kind=kind, start=start, end=end))
+                i -= 1
+            errors.setdefault(t.session.id, []).extend(reversed(hits))
+
+    return {sid: msgs for sid, msgs in errors.items() if msgs}
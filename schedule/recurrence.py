@@ -0,0 +1,188 @@
+"""Ленивая материализация повторяющихся занятий (RecurringSession).
+
+Правило хранит «каждый вторник в 19:00», а строки Session создаются только
+для недель, которые кто-то смотрит (расписание, CRM) или которые заказала
+команда materialize_sessions. Повторный вызов ничего не дублирует: пара
+(rule, occurrence_date) уникальна, вставка идёт с ignore_conflicts.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.cache import bump, get_versioned, set_versioned
+
+from . import availability
+from .changes import record_sessions
+from .models import RecurringSession, RecurringSessionException, ScheduleChange, Session
+from .planner import _fmt_interval, _Timeline
+
+# Сколько помнить, что неделя уже развёрнута: раз в несколько часов
+# перепроверяем — вдруг освободился зал для пропущенного из-за конфликта занятия
+WEEK_MARK_TTL = 6 * 60 * 60
+
+
+@dataclass
+class SkippedOccurrence:
+    rule: RecurringSession
+    occurrence_date: date
+    reason: str
+
+
+@dataclass
+class MaterializeResult:
+    created: int = 0
+    skipped: list[SkippedOccurrence] = field(default_factory=list)
+
+
+def _week_start(d: date) -> date:
+    return d - timedelta(days=d.weekday())
+
+
+def _aware(day: date, t) -> datetime:
+    return timezone.make_aware(datetime.combine(day, t), timezone.get_current_timezone())
+
+
+def materialize(first_day: date, last_day: date) -> MaterializeResult:
+    """Создаёт недостающие Session правил в [first_day, last_day].
+
+    Уже созданные (в том числе отредактированные вручную) занятия не трогает;
+    отменённые исключением — не создаёт, перенесённые — создаёт на новом месте.
+    Занятие, которое упёрлось в чужое по залу или тренеру, пропускается.
+    """
+    result = MaterializeResult()
+    rules = list(RecurringSession.objects.active_between(first_day, last_day).select_related("hall"))
+    if not rules:
+        return result
+
+    rule_ids = [r.id for r in rules]
+    existing = set(
+        Session.objects
+        .filter(rule_id__in=rule_ids, occurrence_date__range=(first_day, last_day))
+        .values_list("rule_id", "occurrence_date")
+    )
+    exceptions = {
+        (e.rule_id, e.occurrence_date): e
+        for e in RecurringSessionException.objects
+        .select_related("new_hall")
+        .filter(rule_id__in=rule_ids, occurrence_date__range=(first_day, last_day))
+    }
+
+    candidates = []
+    for rule in rules:
+        for day in rule.occurrence_dates(first_day, last_day):
+            if (rule.id, day) in existing:
+                continue
+            exc = exceptions.get((rule.id, day))
+            if exc is not None and exc.action == RecurringSessionException.Action.CANCEL:
+                continue
+            start_at = _aware(day, rule.start_time)
+            hall = rule.hall
+            if exc is not None:
+                start_at = exc.new_start_at
+                hall = exc.new_hall or rule.hall
+            end_at = start_at + timedelta(minutes=max(1, int(rule.duration_min or 0)))
+            candidates.append((start_at, end_at, hall, rule, day))
+    if not candidates:
+        return result
+
+    # занятость залов/тренеров в окне — одним запросом, как при копировании недели
+    lo = min(c[0] for c in candidates)
+    hi = max(c[1] for c in candidates)
+    by_resource: dict[tuple, list] = {}
+    for row in Session.objects.overlapping(lo, hi).values("start_at", "end_at", "hall_id", "trainer_id"):
+        interval = (row["start_at"], row["end_at"])
+        if row["hall_id"]:
+            by_resource.setdefault(("hall", row["hall_id"]), []).append(interval)
+        by_resource.setdefault(("trainer", row["trainer_id"]), []).append(interval)
+    timelines = {key: _Timeline(intervals) for key, intervals in by_resource.items()}
+
+    to_create = []
+    candidates.sort(key=lambda c: (c[0], c[3].id))
+    for start_at, end_at, hall, rule, day in candidates:
+        resources = ((("hall", hall.id), "Зал занят"), (("trainer", rule.trainer_id), "Тренер занят"))
+        reason = None
+        for key, label in resources:
+            timeline = timelines.get(key)
+            hit = timeline.conflict(start_at, end_at) if timeline else None
+            if hit:
+                reason = f"{label}: {_fmt_interval(hit)}"
+                break
+        if reason:
+            result.skipped.append(SkippedOccurrence(rule, day, reason))
+            continue
+        for key, _ in resources:
+            timelines.setdefault(key, _Timeline()).add(start_at, end_at)
+
+        # bulk_create не вызывает save(): производные поля считаем здесь
+        to_create.append(Session(
+            title=rule.title,
+            kind=Session.Kind.GROUP,
+            workout_id=rule.workout_id,
+            start_at=start_at,
+            end_at=end_at,
+            duration_min=rule.duration_min,
+            hall=hall,
+            location=hall.name,
+            trainer_id=rule.trainer_id,
+            capacity=rule.capacity,
+            rule=rule,
+            occurrence_date=day,
+        ))
+
+    if to_create:
+        created = _insert_occurrences(to_create)
+        if created:
+            record_sessions(created, ScheduleChange.Kind.CREATED)
+            availability.invalidate((s.hall_id, s.start_at, s.end_at) for s in created)
+            transaction.on_commit(lambda: bump("schedule"))
+        result.created = len(created)
+    return result
+
+
+def _insert_occurrences(sessions: list[Session]) -> list[Session]:
+    """Вставляет занятия и возвращает те, что вставили именно мы, — с id.
+
+    Параллельный воркер мог успеть раньше: дубликаты отсекает уникальный индекс
+    (ignore_conflicts), а после такой вставки у объектов нет pk. Поэтому
+    перечитываем строки по (rule, occurrence_date) и отбрасываем уже бывшие до вставки.
+    """
+    keys = {(s.rule_id, s.occurrence_date) for s in sessions}
+    same_keys = Session.objects.filter(
+        rule_id__in={rule_id for rule_id, _ in keys},
+        occurrence_date__in={day for _, day in keys},
+    )
+    before = set(same_keys.values_list("id", flat=True))
+    Session.objects.bulk_create(sessions, batch_size=500, ignore_conflicts=True)
+    return [
+        s for s in same_keys.exclude(id__in=before)
+        if (s.rule_id, s.occurrence_date) in keys
+    ]
+
+
+def ensure_materialized(first_day: date, last_day: date) -> None:
+    """Дешёвая проверка для view: разворачивает только ещё не отмеченные недели."""
+    monday = _week_start(first_day)
+    missing = []
+    while monday <= last_day:
+        if not get_versioned("recurring", f"week:{monday.isoformat()}"):
+            missing.append(monday)
+        monday += timedelta(days=7)
+    if not missing:
+        return
+
+    materialize(missing[0], missing[-1] + timedelta(days=6))
+    for week in missing:
+        set_versioned("recurring", f"week:{week.isoformat()}", True, WEEK_MARK_TTL)
+
+
+def untouched_occurrences(rule_id: int, *, from_day: date):
+    """Будущие занятия правила без записей и оплат — их можно пересоздать по новому правилу."""
+    return (
+        Session.objects
+        .filter(rule_id=rule_id, occurrence_date__gte=from_day)
+        .filter(bookings__isnull=True, payment_intents__isnull=True)
+    )
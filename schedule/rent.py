@@ -0,0 +1,98 @@
+"""Оформление аренды зала: слоты намерения оплаты → занятия аренды.
+
+Одно намерение может держать несколько часовых слотов, подряд или вразнобой;
+его список слотов — резервы SlotReservation. При оплате соседние слоты
+склеиваются в одно занятие, и всё создаётся в одной транзакции вызывающего.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from . import reservations
+from .models import RentPaymentIntent, RentRequest, Session, Trainer
+
+SLOT_MIN = 60
+TRAINER_NAME = "Аренда зала"
+
+
+@dataclass
+class SlotRun:
+    """Подряд идущие слоты: [start, end), count часов."""
+    start: datetime
+    end: datetime
+    count: int
+
+
+def slot_runs(slot_starts: Iterable[datetime]) -> list[SlotRun]:
+    step = timedelta(minutes=SLOT_MIN)
+    runs: list[SlotRun] = []
+    for start in sorted(set(slot_starts)):
+        if runs and runs[-1].end == start:
+            runs[-1].end = start + step
+            runs[-1].count += 1
+        else:
+            runs.append(SlotRun(start, start + step, 1))
+    return runs
+
+
+def intent_slots(intent: RentPaymentIntent) -> list[datetime]:
+    slots = list(intent.reservations.order_by("slot_start").values_list("slot_start", flat=True))
+    # намерения без резервов (до их появления) держали ровно один слот
+    return slots or [intent.slot_start]
+
+
+def busy_runs(hall_id: int | None, runs: list[SlotRun], *, lock: bool = False) -> list[SlotRun]:
+    """Отрезки, пересекающиеся с занятиями зала, — один запрос на весь диапазон."""
+    if not runs:
+        return []
+    qs = Session.objects.filter(hall_id=hall_id).overlapping(runs[0].start, runs[-1].end)
+    if lock:
+        qs = qs.select_for_update()
+    intervals = list(qs.values_list("start_at", "end_at"))
+    return [run for run in runs if any(start < run.end and run.start < end for start, end in intervals)]
+
+
+def book(intent: RentPaymentIntent, *, paid_at: datetime, tb_status: str) -> list[tuple[Session, RentRequest]]:
+    """Создаёт занятия и заявки по слотам оплаченного намерения и помечает его оплаченным.
+
+    Вызывать внутри transaction.atomic() — вместе с проверкой busy_runs.
+    """
+    runs = slot_runs(intent_slots(intent))
+    total = sum(run.count for run in runs)
+    trainer, _ = Trainer.objects.get_or_create(name=TRAINER_NAME)
+    title = f"Аренда зала — {intent.full_name}".strip()[:160] or "Аренда зала"
+
+    booked = []
+    for run in runs:
+        session = Session.objects.create(
+            title=title,
+            kind=Session.Kind.RENT,
+            client=intent.user,
+            start_at=run.start,
+            duration_min=run.count * SLOT_MIN,
+            hall_id=intent.hall_id,
+            trainer=trainer,
+            capacity=1,
+        )
+        rent_request = RentRequest.objects.create(
+            session=session,
+            user=intent.user,
+            full_name=intent.full_name,
+            email=intent.email,
+            phone=intent.phone,
+            social_handle=intent.social_handle,
+            comment=intent.comment,
+            promo_code=intent.promo_code,
+            price_rub=intent.amount_rub * run.count // total,
+        )
+        booked.append((session, rent_request))
+
+    reservations.confirm(intent, [session for session, _ in booked])
+    intent.session = booked[0][0]
+    intent.status = RentPaymentIntent.Status.PAID
+    intent.tb_status = tb_status
+    intent.paid_at = paid_at
+    intent.save(update_fields=["session", "status", "tb_status", "paid_at"])
+    return booked
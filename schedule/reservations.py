@@ -0,0 +1,111 @@
+"""Резервирование часовых слотов аренды через уникальный ключ (зал, начало).
+
+Вместо блокировки всех занятий и намерений вокруг слота вставляем строку
+SlotReservation: вставка либо проходит, либо падает на уникальном ключе.
+Ждут друг друга только те, кто претендует на тот же час того же зала.
+Резерв снимается при отмене или истечении намерения, после оплаты держится
+до удаления или переноса занятия аренды.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Location, RentPaymentIntent, Session, SlotReservation
+
+
+class SlotTaken(Exception):
+    """Хотя бы один из слотов уже зарезервирован."""
+
+    def __init__(self, session_ids: Iterable[int] = ()):
+        super().__init__()
+        # для переноса занятий: какие из них упёрлись в чужой резерв
+        self.session_ids = set(session_ids)
+
+
+def reserve(hall: Location, slot_starts: Iterable[datetime], *, intent: RentPaymentIntent) -> None:
+    """Резервирует слоты под намерение; SlotTaken — если кто-то успел раньше."""
+    slot_starts = list(slot_starts)
+    # истёкшие резервы этих слотов освобождаем сразу, не дожидаясь sweeper
+    SlotReservation.objects.filter(
+        hall=hall,
+        slot_start__in=slot_starts,
+        expires_at__lte=timezone.now(),
+    ).delete()
+    try:
+        with transaction.atomic():
+            SlotReservation.objects.bulk_create([
+                SlotReservation(hall=hall, slot_start=start, intent=intent, expires_at=intent.expires_at)
+                for start in slot_starts
+            ])
+    except IntegrityError as exc:
+        raise SlotTaken from exc
+
+
+def confirm(intent: RentPaymentIntent, sessions: Iterable[Session]) -> None:
+    """Оплачено: резервы больше не истекают и живут вместе со своими занятиями."""
+    for session in sessions:
+        SlotReservation.objects.filter(
+            intent=intent,
+            slot_start__gte=session.start_at,
+            slot_start__lt=session.end_at,
+        ).update(session=session, expires_at=None)
+
+
+def release(intent_ids: Iterable[int]) -> int:
+    deleted, _ = SlotReservation.objects.filter(intent_id__in=list(intent_ids)).delete()
+    return deleted
+
+
+def release_expired(now=None) -> int:
+    deleted, _ = SlotReservation.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
+
+
+def _slot_starts(start: datetime, end: datetime):
+    cur = start.replace(minute=0, second=0, microsecond=0)
+    while cur < end:
+        yield cur
+        cur += timedelta(hours=1)
+
+
+MOVE_TAKEN_MESSAGE = "Новое время держит неоплаченная бронь аренды"
+
+
+def move(sessions: Iterable[Session]) -> None:
+    """Перенесённые занятия аренды: их резервы переезжают на новые часы.
+
+    Общий путь всех переносов (одиночный, пакетный, админка). Вызывать
+    внутри transaction.atomic() вызывающего, после сохранения занятий;
+    SlotTaken.session_ids — занятия, чьи новые часы держит чужой резерв.
+    """
+    by_id = {s.id: s for s in sessions if s.kind == Session.Kind.RENT}
+    intents = dict(
+        SlotReservation.objects.filter(session_id__in=list(by_id)).values_list("session_id", "intent_id").distinct()
+    )
+    if not intents:
+        return
+    SlotReservation.objects.filter(session_id__in=list(intents)).delete()
+
+    wanted = [
+        SlotReservation(hall_id=by_id[sid].hall_id, slot_start=start, session_id=sid, intent_id=intent_id, expires_at=None)
+        for sid, intent_id in intents.items()
+        for start in _slot_starts(by_id[sid].start_at, by_id[sid].end_at)
+    ]
+    keys = {(r.hall_id, r.slot_start): r.session_id for r in wanted}
+    held = SlotReservation.objects.filter(
+        hall_id__in={r.hall_id for r in wanted},
+        slot_start__in={r.slot_start for r in wanted},
+    )
+    held.filter(expires_at__lte=timezone.now()).delete()
+    taken = {keys[k] for k in held.values_list("hall_id", "slot_start") if k in keys}
+    if taken:
+        raise SlotTaken(taken)
+    try:
+        with transaction.atomic():
+            SlotReservation.objects.bulk_create(wanted)
+    except IntegrityError as exc:
+        raise SlotTaken(intents) from exc
@@ -0,0 +1,162 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.cache import bump
+
+from .models import (
+    Booking,
+    Location,
+    RecurringSession,
+    RecurringSessionException,
+    RentPaymentIntent,
+    ScheduleChange,
+    Session,
+    Trainer,
+)
+from . import availability, reservations
+from .changes import record_booking, record_session
+from .recurrence import untouched_occurrences
+
+
+@receiver(post_delete, sender=Booking)
+def release_seat_on_booking_delete(sender, instance: Booking, **kwargs):
+    seat_session_id = getattr(instance, "_seat_session_id", None)
+    if seat_session_id:
+        Session.shift_booked_count(seat_session_id, -1)
+
+
+@receiver(post_save, sender=Location)
+def sync_location_name(sender, instance: Location, created: bool, **kwargs):
+    # текст адреса в занятиях/бронях — копия имени зала
+    if created:
+        return
+    Session.objects.filter(hall=instance).exclude(location=instance.name).update(location=instance.name)
+    RentPaymentIntent.objects.filter(hall=instance).exclude(location=instance.name).update(location=instance.name)
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+@receiver(post_save, sender=Session)
+@receiver(post_delete, sender=Session)
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_schedule_cache(sender, **kwargs):
+    # после коммита: иначе параллельный запрос закэширует старые данные под новым поколением
+    transaction.on_commit(lambda: bump("schedule"))
+
+
+@receiver(post_save, sender=Trainer)
+@receiver(post_delete, sender=Trainer)
+def invalidate_trainers_cache(sender, **kwargs):
+    # имя тренера есть и в карточках расписания
+    transaction.on_commit(lambda: (bump("trainers"), bump("schedule")))
+
+
+@receiver(post_save, sender=Session)
+@receiver(post_delete, sender=Session)
+def invalidate_rent_grid_for_session(sender, instance: Session, **kwargs):
+    spans = [(instance.hall_id, instance.start_at, instance.end_at)]
+    # при переносе освобождается и старое место
+    old_start = getattr(instance, "_loaded_start_at", None)
+    if old_start is not None:
+        spans.append((getattr(instance, "_loaded_hall_id", None), old_start, getattr(instance, "_loaded_end_at", None)))
+    availability.invalidate(spans)
+
+
+@receiver(post_save, sender=RentPaymentIntent)
+@receiver(post_delete, sender=RentPaymentIntent)
+def invalidate_rent_grid_for_intent(sender, instance: RentPaymentIntent, **kwargs):
+    availability.invalidate([(instance.hall_id, instance.slot_start, instance.end_at)])
+
+
+@receiver(post_save, sender=RentPaymentIntent)
+def sync_slot_reservations(sender, instance: RentPaymentIntent, created: bool, raw: bool = False, **kwargs):
+    if raw or created:
+        return
+    # оплату подтверждает schedule.rent.book, здесь — только освобождение
+    if instance.status == RentPaymentIntent.Status.CANCELED:
+        reservations.release([instance.id])
+
+
+@receiver(post_save, sender=Session)
+def log_session_saved(sender, instance: Session, created: bool, raw: bool = False, **kwargs):
+    if raw:
+        return
+    if created:
+        record_session(instance, ScheduleChange.Kind.CREATED)
+        return
+    previous_start = getattr(instance, "_loaded_start_at", None)
+    moved = (
+        (previous_start is not None and previous_start != instance.start_at)
+        or getattr(instance, "_loaded_hall_id", instance.hall_id) != instance.hall_id
+    )
+    if moved:
+        record_session(instance, ScheduleChange.Kind.MOVED, previous_start=previous_start)
+    else:
+        record_session(instance, ScheduleChange.Kind.UPDATED)
+
+
+@receiver(post_delete, sender=Session)
+def log_session_deleted(sender, instance: Session, **kwargs):
+    record_session(instance, ScheduleChange.Kind.DELETED)
+
+
+@receiver(post_save, sender=Booking)
+def log_booking_changed(sender, instance: Booking, raw: bool = False, **kwargs):
+    if raw:
+        return
+    # отметка посещения, приглашение и т.п. не меняют места/лист ожидания — в журнал не пишем
+    before, after = getattr(instance, "_counted_as", None), instance.counted_as()
+    if before == after:
+        return
+    for session_id in {key[0] for key in (before, after) if key}:
+        record_booking(session_id)
+
+
+@receiver(post_delete, sender=Booking)
+def log_booking_deleted(sender, instance: Booking, **kwargs):
+    counted = getattr(instance, "_counted_as", None)
+    if counted:
+        record_booking(counted[0])
+
+
+def _bump_recurring_schedule():
+    # отметки развёрнутых недель и кэш расписания (фрагменты дней, ETag) — вместе
+    def bump_both():
+        bump("recurring")
+        bump("schedule")
+    transaction.on_commit(bump_both)
+
+
+@receiver(post_save, sender=RecurringSession)
+@receiver(pre_delete, sender=RecurringSession)
+def regenerate_rule_occurrences(sender, instance: RecurringSession, **kwargs):
+    # будущие занятия без записей пересоздадутся по новому правилу при следующем просмотре
+    untouched_occurrences(instance.id, from_day=timezone.localdate()).delete()
+    _bump_recurring_schedule()
+
+
+@receiver(post_save, sender=RecurringSessionException)
+def apply_occurrence_exception(sender, instance: RecurringSessionException, **kwargs):
+    session = Session.objects.filter(rule_id=instance.rule_id, occurrence_date=instance.occurrence_date).first()
+    if session is not None:
+        if instance.action == RecurringSessionException.Action.CANCEL:
+            session.delete()
+        else:
+            session.start_at = instance.new_start_at
+            if instance.new_hall_id:
+                session.hall = instance.new_hall
+                session.location = instance.new_hall.name
+            session.save()
+    _bump_recurring_schedule()
+
+
+@receiver(post_delete, sender=RecurringSessionException)
+def revert_occurrence_exception(sender, instance: RecurringSessionException, **kwargs):
+    # без исключения занятие вернётся на место по правилу
+    untouched_occurrences(instance.rule_id, from_day=instance.occurrence_date).filter(
+        occurrence_date=instance.occurrence_date,
+    ).delete()
+    _bump_recurring_schedule()
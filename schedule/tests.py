@@ -0,0 +1,978 @@
+import json
+from datetime import datetime, time, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.cache import generation
+from schedule import availability, rent, reservations
+from schedule.models import Booking, Location, RecurringSession, RecurringSessionException, RentPaymentIntent, ScheduleChange, Session, SessionFull, SlotReservation, Trainer
+from schedule.recurrence import ensure_materialized
+
+
+def _user(username: str, phone: str):
+    # phone/email уникальны в модели, поэтому задаём явно
+    return get_user_model().objects.create_user(
+        username=username,
+        password="pass12345",
+        phone=phone,
+        email=f"{username}@example.com",
+    )
+
+
+def _skip_materialization():
+    # правил нет, но первая проверка недели — отдельный запрос; помечаем недели
+    # развёрнутыми заранее, чтобы тесты считали только запросы самого расписания
+    today = timezone.localdate()
+    ensure_materialized(today - timedelta(days=31), today + timedelta(days=62))
+
+
+def _at(days: int, hour: int):
+    day = timezone.localdate() + timedelta(days=days)
+    return timezone.make_aware(datetime.combine(day, time(hour=hour)), timezone.get_current_timezone())
+
+
+def _intent(hall, slot_start, *, expires_in_min: int = 15, **fields):
+    # неоплаченное намерение аренды; телефон у намерений не уникален
+    fields.setdefault("full_name", "Renter")
+    fields.setdefault("phone", "79000000099")
+    fields.setdefault("expires_at", timezone.now() + timedelta(minutes=expires_in_min))
+    return RentPaymentIntent.objects.create(hall=hall, slot_start=slot_start, **fields)
+
+
+class BookedCountTests(TestCase):
+    def setUp(self):
+        self.trainer = Trainer.objects.create(name="Coach")
+        self.session = Session.objects.create(
+            title="Stretch",
+            start_at=_at(1, 10),
+            duration_min=50,
+            location="Сакко и Ванцетти, 93а",
+            trainer=self.trainer,
+            capacity=2,
+        )
+        self.u1 = _user("u1", "79000000001")
+        self.u2 = _user("u2", "79000000002")
+
+    def test_counter_follows_booking_transitions(self):
+        b1 = Booking.objects.create(user=self.u1, session=self.session)
+        Booking.objects.create(user=self.u2, session=self.session, booking_status=Booking.Status.WAITLIST)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.booked_count, 1)
+        self.assertEqual(self.session.seats_left, 1)
+
+        b1 = Booking.objects.get(pk=b1.pk)
+        b1.cancel()
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.booked_count, 0)
+
+        b1.booking_status = Booking.Status.BOOKED
+        b1.save(update_fields=["booking_status"])
+        b1.delete()
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.booked_count, 0)
+
+    def test_booking_past_capacity_is_refused(self):
+        Booking.objects.create(user=self.u1, session=self.session)
+        Booking.objects.create(user=self.u2, session=self.session)
+        late = Booking.objects.create(user=_user("u3", "79000000003"), session=self.session, booking_status=Booking.Status.WAITLIST)
+
+        # проверка seats_left в памяти устарела — решает условный UPDATE
+        late.booking_status = Booking.Status.BOOKED
+        with self.assertRaises(SessionFull):
+            late.save(update_fields=["booking_status"])
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.booked_count, 2)
+        self.assertEqual(Booking.objects.get(pk=late.pk).booking_status, Booking.Status.WAITLIST)
+
+    def test_seats_left_needs_no_queries(self):
+        Booking.objects.create(user=self.u1, session=self.session)
+        s = Session.objects.get(pk=self.session.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(s.seats_left, 1)
+
+    def test_reconcile_repairs_drift(self):
+        Booking.objects.create(user=self.u1, session=self.session)
+        Session.objects.filter(pk=self.session.pk).update(booked_count=5)
+
+        call_command("reconcile_seat_counts", stdout=StringIO())
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.booked_count, 1)
+
+
+class LocationKeyTests(TestCase):
+    def setUp(self):
+        self.trainer = Trainer.objects.create(name="Coach")
+        self.session = Session.objects.create(
+            title="Stretch", start_at=_at(1, 10), location="Сакко и Ванцетти, 93а", trainer=self.trainer,
+        )
+
+    def test_hall_follows_location_text(self):
+        sakko = Location.objects.get(key="саккоиванцетти93а")
+        self.assertEqual(self.session.hall, sakko)
+
+        # опечатка 8б/86 и другой регистр попадают в тот же зал, текст — каноничный
+        session = Session.objects.get(pk=self.session.pk)
+        session.location = "а. гайдара, 86"
+        session.save(update_fields=["location"])
+        session.refresh_from_db()
+        self.assertEqual(session.hall.key, "агайдара8б")
+        self.assertEqual(session.location, session.hall.name)
+
+        # неизвестный адрес заводит скрытый зал, а не теряется
+        other = Session.objects.create(title="Другое", start_at=self.session.start_at, location="Ленина, 1", trainer=self.trainer)
+        self.assertFalse(other.hall.is_active)
+        self.assertNotIn("Ленина, 1", Location.objects.active().values_list("name", flat=True))
+
+    def test_renaming_hall_updates_session_address(self):
+        hall = self.session.hall
+        hall.name = "Сакко и Ванцетти, 93А (2 этаж)"
+        hall.save()
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.location, hall.name)
+
+
+class AdminSeatLimitTests(TestCase):
+    def setUp(self):
+        self.admin = _user("boss", "79000000009")
+        self.admin.is_staff = True
+        self.admin.is_superuser = True
+        self.admin.save(update_fields=["is_staff", "is_superuser"])
+        self.client.force_login(self.admin)
+        self.session = Session.objects.create(
+            title="Stretch", start_at=_at(1, 10), duration_min=50,
+            location="Сакко и Ванцетти, 93а", trainer=Trainer.objects.create(name="Coach"), capacity=1,
+        )
+        Booking.objects.create(user=_user("u1", "79000000001"), session=self.session)
+        self.u2 = _user("u2", "79000000002")
+
+    def _booking_data(self):
+        return {
+            "user": self.u2.pk, "session": self.session.pk, "membership": "",
+            "booking_status": Booking.Status.BOOKED, "attendance_status": Booking.Attendance.NOT_MARKED,
+            "invite_sent_at_0": "", "invite_sent_at_1": "", "invite_expires_at_0": "", "invite_expires_at_1": "",
+        }
+
+    def test_booking_admin_refuses_full_session(self):
+        resp = self.client.post(reverse("admin:schedule_booking_add"), self._booking_data())
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("Свободных мест нет", str(resp.context["adminform"].form.errors["session"]))
+        self.assertFalse(Booking.objects.filter(user=self.u2).exists())
+
+    def test_booking_admin_save_race_is_not_500(self):
+        # форма пропустила (места заняли после проверки) — SessionFull ловится при сохранении
+        with mock.patch("schedule.admin.BookingAdminForm.clean", lambda form: form.cleaned_data):
+            resp = self.client.post(reverse("admin:schedule_booking_add"), self._booking_data())
+        self.assertRedirects(resp, reverse("admin:schedule_booking_add"), fetch_redirect_response=False)
+        self.assertFalse(Booking.objects.filter(user=self.u2).exists())
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.booked_count, 1)
+
+    def test_session_inline_refuses_full_session(self):
+        local = timezone.localtime(self.session.start_at)
+        existing = self.session.bookings.get()
+        data = {
+            "workout": "", "title": "Stretch", "kind": "group", "client": "",
+            "start_at_0": local.strftime("%Y-%m-%d"), "start_at_1": local.strftime("%H:%M"),
+            "duration_min": 50, "hall": self.session.hall_id, "trainer": self.session.trainer_id, "capacity": 1,
+            "bookings-TOTAL_FORMS": 2, "bookings-INITIAL_FORMS": 1, "bookings-MIN_NUM_FORMS": 0, "bookings-MAX_NUM_FORMS": 1000,
+            "bookings-0-id": existing.pk, "bookings-0-session": self.session.pk, "bookings-0-user": existing.user_id,
+            "bookings-0-membership": "", "bookings-0-booking_status": "booked", "bookings-0-attendance_status": "not_marked",
+            "bookings-1-id": "", "bookings-1-session": self.session.pk, "bookings-1-user": self.u2.pk,
+            "bookings-1-membership": "", "bookings-1-booking_status": "booked", "bookings-1-attendance_status": "not_marked",
+            "rent_request-TOTAL_FORMS": 0, "rent_request-INITIAL_FORMS": 0, "rent_request-MIN_NUM_FORMS": 0, "rent_request-MAX_NUM_FORMS": 1,
+        }
+        resp = self.client.post(reverse("admin:schedule_session_change", args=[self.session.pk]), data)
+        self.assertEqual(resp.status_code, 200)
+        formset = resp.context["inline_admin_formsets"][0].formset
+        self.assertIn("Свободных мест нет", str(formset.non_form_errors()))
+        self.assertFalse(Booking.objects.filter(user=self.u2).exists())
+
+        # отмена существующей записи освобождает место под новую в той же форме
+        data["bookings-0-booking_status"] = "canceled"
+        resp = self.client.post(reverse("admin:schedule_session_change", args=[self.session.pk]), data)
+        self.assertEqual(resp.status_code, 302)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.booked_count, 1)
+        self.assertTrue(Booking.objects.filter(user=self.u2, booking_status="booked").exists())
+
+
+class SessionOverlapTests(TestCase):
+    def setUp(self):
+        self.trainer = Trainer.objects.create(name="Coach")
+        self.location = "Сакко и Ванцетти, 93а"
+        # старая история не должна попадать в окно проверки
+        Session.objects.create(
+            title="Past", start_at=_at(-30, 10), duration_min=50, location=self.location, trainer=self.trainer,
+        )
+        self.existing = Session.objects.create(
+            title="Yoga", start_at=_at(1, 10), duration_min=60, location=self.location, trainer=self.trainer,
+        )
+
+    def test_end_at_is_maintained(self):
+        self.assertEqual(self.existing.end_at, _at(1, 11))
+        self.existing.duration_min = 90
+        self.existing.save(update_fields=["duration_min"])
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.end_at - self.existing.start_at, timedelta(minutes=90))
+
+    def test_reports_hall_and_trainer_conflicts(self):
+        s = Session(title="Pilates", start_at=_at(1, 10) + timedelta(minutes=30), duration_min=60,
+                    location="Сакко и Ванцетти 93А", trainer=self.trainer)
+        with self.assertNumQueries(2):
+            with self.assertRaises(ValidationError) as ctx:
+                s.clean()
+        self.assertIn("start_at", ctx.exception.message_dict)
+        self.assertIn("trainer", ctx.exception.message_dict)
+
+    def test_adjacent_session_is_allowed(self):
+        s = Session(title="Pilates", start_at=_at(1, 11), duration_min=60,
+                    location=self.location, trainer=self.trainer)
+        s.clean()
+
+
+class ScheduleQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        _skip_materialization()
+        self.trainer = Trainer.objects.create(name="Coach")
+        self.location = "Сакко и Ванцетти, 93а"
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.user = _user("viewer", "79000000010")
+        self.other = _user("other", "79000000011")
+
+    def _add_sessions(self, n: int, first_hour: int):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_sessions(n, first_hour)
+
+    def _create_sessions(self, n: int, first_hour: int):
+        for i in range(n):
+            s = Session.objects.create(
+                title=f"Class {first_hour + i}",
+                start_at=_at(1, first_hour + i),
+                duration_min=50,
+                location=self.location,
+                trainer=self.trainer,
+                capacity=3,
+            )
+            Booking.objects.create(user=self.other, session=s)
+            Booking.objects.create(user=self.user, session=s, booking_status=Booking.Status.WAITLIST)
+
+    def _get_fragment(self):
+        return self.client.get(
+            reverse("schedule:fragment"),
+            {"day": self.day.isoformat(), "loc": self.location},
+        )
+
+    def _fragment_queries(self) -> int:
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._get_fragment()
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_anonymous_fragment_is_a_single_query(self):
+        self._add_sessions(4, 8)
+        with self.assertNumQueries(1):
+            response = self._get_fragment()
+        self.assertContains(response, "Мест: 2", count=4)
+
+    def test_cached_fragment_is_invalidated_by_booking(self):
+        self._add_sessions(1, 8)
+        self._get_fragment()
+        with self.assertNumQueries(0):
+            self.assertContains(self._get_fragment(), "Мест: 2")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.get(user=self.user).delete()
+            Booking.objects.create(user=self.user, session=Session.objects.get())
+        self.assertContains(self._get_fragment(), "Мест: 1")
+
+    def test_unchanged_fragment_revalidates_without_rendering(self):
+        self._add_sessions(1, 8)
+        first = self._get_fragment()
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                reverse("schedule:fragment"),
+                {"day": self.day.isoformat(), "loc": self.location},
+                HTTP_IF_NONE_MATCH=first["ETag"],
+            )
+        self.assertEqual(response.status_code, 304)
+
+        self._add_sessions(1, 12)
+        response = self.client.get(
+            reverse("schedule:fragment"),
+            {"day": self.day.isoformat(), "loc": self.location},
+            HTTP_IF_NONE_MATCH=first["ETag"],
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_range_returns_ten_days_from_one_query(self):
+        self._add_sessions(3, 8)
+        url = reverse("schedule:range")
+        params = {"start": timezone.localdate().isoformat(), "loc": self.location}
+        with self.assertNumQueries(1):
+            data = self.client.get(url, params).json()
+
+        self.assertEqual(len(data["days"]), 10)
+        by_date = {d["date"]: d for d in data["days"]}
+        tomorrow = by_date[self.day.isoformat()]
+        self.assertEqual((tomorrow["classes"], tomorrow["free_seats"]), (3, 6))
+        self.assertEqual(by_date[timezone.localdate().isoformat()]["classes"], 0)
+        row = dict(zip(data["fields"], tomorrow["sessions"][0]))
+        self.assertEqual((row["time"], row["seats_left"], row["waitlist_count"]), ("08:00", 2, 1))
+        self.assertEqual(data["my"], {})
+
+        self.client.force_login(self.user)
+        data = self.client.get(url, params).json()
+        self.assertEqual(set(data["my"].values()), {Booking.Status.WAITLIST})
+
+    def test_viewer_status_is_overlaid_on_cached_html(self):
+        self._add_sessions(2, 8)
+        self._get_fragment()
+
+        self.client.force_login(self.user)
+        response = self._get_fragment()
+        self.assertContains(response, "Вы в листе ожидания", count=2)
+
+    def test_query_count_does_not_grow_with_sessions(self):
+        self.client.force_login(self.user)
+        self._add_sessions(2, 8)
+        few = self._fragment_queries()
+        self._add_sessions(6, 12)
+        many = self._fragment_queries()
+        self.assertEqual(few, many)
+
+    def test_viewer_status_is_annotated(self):
+        self._add_sessions(1, 8)
+        s = Session.objects.get()
+        Booking.objects.filter(user=self.user, session=s).delete()
+        Booking.objects.create(user=self.user, session=s)
+
+        row = Session.objects.with_occupancy(self.user).get(pk=s.pk)
+        self.assertEqual(row.my_status, Booking.Status.BOOKED)
+        self.assertEqual(row.booked_count, 2)
+        self.assertEqual(row.waitlist_count, 0)
+
+
+class RepeatWeekTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = _user("planner", "79000000030")
+        self.staff.is_staff = True
+        self.staff.save(update_fields=["is_staff"])
+        self.client.force_login(self.staff)
+
+        self.anna = Trainer.objects.create(name="Anna")
+        self.boris = Trainer.objects.create(name="Boris")
+        self.hall_a = "Сакко и Ванцетти, 93а"
+        self.hall_b = "Ленина, 8б"
+
+        today = timezone.localdate()
+        self.src_monday = today - timedelta(days=today.weekday()) + timedelta(days=7)
+        self.dst_monday = self.src_monday + timedelta(days=7)
+
+    def _at(self, monday, weekday: int, hour: int, minute: int = 0):
+        naive = datetime.combine(monday + timedelta(days=weekday), time(hour, minute))
+        return timezone.make_aware(naive, timezone.get_current_timezone())
+
+    def _session(self, monday, weekday, hour, *, location, trainer, minute=0, duration=60):
+        return Session.objects.create(
+            title=f"{trainer.name} {hour}:{minute:02d}",
+            start_at=self._at(monday, weekday, hour, minute),
+            duration_min=duration,
+            location=location,
+            trainer=trainer,
+            capacity=10,
+        )
+
+    def _post(self, **extra):
+        data = {"src_day": self.src_monday.isoformat(), "dst_day": self.dst_monday.isoformat(), **extra}
+        return self.client.post(reverse("crm_planning_repeat_week"), data)
+
+    def test_conflicting_copies_are_skipped_with_reasons(self):
+        self._session(self.src_monday, 0, 10, location=self.hall_a, trainer=self.anna)
+        self._session(self.src_monday, 0, 12, location=self.hall_a, trainer=self.anna)
+        self._session(self.src_monday, 1, 10, location=self.hall_b, trainer=self.boris)
+        # в неделе назначения: зал A занят в пн 10:30, Борис занят во вт 9:30 в другом зале
+        self._session(self.dst_monday, 0, 10, minute=30, location=self.hall_a, trainer=self.boris, duration=30)
+        self._session(self.dst_monday, 1, 9, minute=30, location=self.hall_a, trainer=self.boris)
+
+        response = self._post(dry_run="1")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Будет создано: 1")
+        self.assertContains(response, "Зал занят")
+        self.assertContains(response, "Тренер занят")
+        self.assertEqual(Session.objects.filter(start_at__gte=self._at(self.dst_monday, 0, 0)).count(), 2)
+
+        self._post()
+        copy = Session.objects.get(title="Anna 12:00", start_at__gte=self._at(self.dst_monday, 0, 0))
+        self.assertEqual(copy.start_at, self._at(self.dst_monday, 0, 12))
+        self.assertEqual(copy.end_at, self._at(self.dst_monday, 0, 13))
+        self.assertEqual(copy.hall_id, Session.objects.get(title="Anna 12:00", start_at__lt=self._at(self.dst_monday, 0, 0)).hall_id)
+        copy.full_clean()
+
+    def test_skip_reason_names_the_blocking_session(self):
+        self._session(self.src_monday, 0, 12, minute=30, location=self.hall_a, trainer=self.anna, duration=30)
+        # зал A в неделе назначения: 10:00–11:00 и 10:30–13:30 сливаются в один интервал
+        self._session(self.dst_monday, 0, 10, location=self.hall_a, trainer=self.boris)
+        self._session(self.dst_monday, 0, 10, minute=30, location=self.hall_a, trainer=self.boris, duration=180)
+
+        response = self._post(dry_run="1")
+        day = self.dst_monday.strftime("%d.%m")
+        self.assertContains(response, f"Зал занят: {day} 10:30–13:30")
+        self.assertNotContains(response, f"{day} 10:00–13:30")
+
+    def test_copies_do_not_overlap_each_other(self):
+        # в источнике уже есть пересечение по тренеру (записано в обход clean) — копируется только первое
+        self._session(self.src_monday, 2, 10, location=self.hall_a, trainer=self.anna)
+        Session.objects.create(
+            title="Anna overlap", start_at=self._at(self.src_monday, 2, 10, 30), duration_min=60,
+            location=self.hall_b, trainer=self.boris, capacity=10,
+        )
+        Session.objects.filter(title="Anna overlap").update(trainer=self.anna)
+
+        self._post()
+        copies = Session.objects.filter(start_at__gte=self._at(self.dst_monday, 0, 0))
+        self.assertEqual(list(copies.values_list("title", flat=True)), ["Anna 10:00"])
+
+    def test_month_copy_uses_constant_number_of_queries(self):
+        for weekday in range(7):
+            for hour in range(8, 20, 2):
+                self._session(self.src_monday, weekday, hour, location=self.hall_a, trainer=self.anna)
+                self._session(self.src_monday, weekday, hour, location=self.hall_b, trainer=self.boris)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self._post(weeks="4")
+        self.assertEqual(Session.objects.filter(start_at__gte=self._at(self.dst_monday, 0, 0)).count(), 4 * 84)
+        self.assertLess(len(ctx.captured_queries), 15)
+
+
+class PlanningGridTests(TestCase):
+    def setUp(self):
+        self.staff = _user("board", "79000000040")
+        self.staff.is_staff = True
+        self.staff.save(update_fields=["is_staff"])
+        self.client.force_login(self.staff)
+        self.trainer = Trainer.objects.create(name="Anna")
+        _skip_materialization()
+
+        today = timezone.localdate()
+        self.monday = today - timedelta(days=today.weekday()) + timedelta(days=7)
+
+    def _session(self, weekday: int, hour: int, location="Сакко и Ванцетти, 93а"):
+        start = timezone.make_aware(
+            datetime.combine(self.monday + timedelta(days=weekday), time(hour)),
+            timezone.get_current_timezone(),
+        )
+        return Session.objects.create(
+            title=f"Class {weekday}-{hour}", start_at=start, duration_min=60,
+            location=location, trainer=self.trainer, capacity=5,
+        )
+
+    def _week_json(self):
+        return self.client.get(reverse("crm_planning"), {
+            "day": (self.monday + timedelta(days=2)).isoformat(), "mode": "week", "format": "json",
+        })
+
+    def test_week_json_groups_blocks_by_day_and_hall(self):
+        self._session(0, 10)
+        self._session(2, 12, location="САККО и  Ванцетти, 93а")
+        self._session(2, 14, location="Неизвестный адрес")
+
+        data = self._week_json().json()
+        self.assertEqual([d["date"] for d in data["days"]][0], self.monday.isoformat())
+        self.assertEqual(len(data["days"]), 7)
+
+        wednesday = {c["location"]: c["blocks"] for c in data["days"][2]["columns"]}
+        self.assertEqual([b["start"] for b in wednesday["Сакко и Ванцетти, 93а"]], ["12:00"])
+        self.assertEqual([b["start"] for b in wednesday["Неизвестный адрес"]], ["14:00"])
+        self.assertEqual(data["days"][2]["columns"][0]["blocks"][0]["top_px"], 4 * 72)
+
+    def test_week_is_served_from_one_sessions_query(self):
+        self._session(0, 10)
+        with CaptureQueriesContext(connection) as small:
+            self._week_json()
+        for weekday in range(7):
+            for hour in (9, 11, 13):
+                self._session(weekday, hour)
+        with CaptureQueriesContext(connection) as large:
+            self._week_json()
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+        response = self.client.get(reverse("crm_planning"), {"day": self.monday.isoformat(), "mode": "week"})
+        self.assertContains(response, "Class 6-13")
+        self.assertContains(response, f'data-day="{(self.monday + timedelta(days=6)).isoformat()}"')
+
+
+class MoveBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = _user("mover", "79000000050")
+        self.staff.is_staff = True
+        self.staff.save(update_fields=["is_staff"])
+        self.client.force_login(self.staff)
+
+        self.anna = Trainer.objects.create(name="Anna")
+        self.boris = Trainer.objects.create(name="Boris")
+        self.day = timezone.localdate() + timedelta(days=3)
+        self.first = self._session(10, self.anna)
+        self.second = self._session(11, self.boris)
+
+    def _session(self, hour, trainer):
+        return Session.objects.create(
+            title=f"{trainer.name} {hour}",
+            start_at=timezone.make_aware(datetime.combine(self.day, time(hour)), timezone.get_current_timezone()),
+            duration_min=60,
+            location="Сакко и Ванцетти, 93а",
+            trainer=trainer,
+        )
+
+    def _post(self, items, **extra):
+        return self.client.post(
+            reverse("crm_planning_move_batch"),
+            data=json.dumps({"items": items, **extra}),
+            content_type="application/json",
+        )
+
+    def test_swap_is_applied_atomically(self):
+        # по одному такой обмен невозможен: первый перенос упирается во второе занятие
+        items = [
+            {"session_id": self.first.id, "day": self.day.isoformat(), "start": "11:00"},
+            {"session_id": self.second.id, "day": self.day.isoformat(), "start": "10:00", "duration_min": 50},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._post(items)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["applied"], 2)
+
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(timezone.localtime(self.first.start_at).hour, 11)
+        self.assertEqual(timezone.localtime(self.second.end_at).strftime("%H:%M"), "10:50")
+
+    def test_any_conflict_rejects_the_whole_batch(self):
+        self._session(14, self.anna)
+        items = [
+            {"session_id": self.second.id, "day": self.day.isoformat(), "start": "15:00"},
+            {"session_id": self.first.id, "day": self.day.isoformat(), "start": "13:30"},
+            {"session_id": 999999, "day": self.day.isoformat(), "start": "18:00"},
+            {"session_id": self.second.id, "loc": "Нет такого зала"},
+        ]
+        response = self._post(items)
+        self.assertEqual(response.status_code, 409)
+        results = response.json()["results"]
+        self.assertTrue(results[0]["ok"])
+        self.assertEqual(results[1]["error"], "validation")
+        self.assertTrue(any("У тренера" in m for m in results[1]["messages"]))
+        self.assertTrue(any("В этом зале" in m for m in results[1]["messages"]))
+        self.assertEqual(results[2]["error"], "not_found")
+        self.assertEqual(results[3]["error"], "unknown_location")
+
+        self.second.refresh_from_db()
+        self.assertEqual(timezone.localtime(self.second.start_at).hour, 11)
+
+    def test_moved_items_are_checked_against_each_other(self):
+        items = [
+            {"session_id": self.first.id, "day": self.day.isoformat(), "start": "16:00"},
+            {"session_id": self.second.id, "day": self.day.isoformat(), "start": "16:30"},
+        ]
+        response = self._post(items, dry_run=True)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([r["error"] for r in response.json()["results"]], ["validation", "validation"])
+
+    def _paid_rent(self, hour: int):
+        hall = Location.objects.get(key="саккоиванцетти93а")
+        intent = _intent(hall, _at(3, hour))
+        reservations.reserve(hall, [intent.slot_start], intent=intent)
+        [(session, _)] = rent.book(intent, paid_at=timezone.now(), tb_status="CONFIRMED")
+        return hall, session
+
+    def test_moved_rent_session_takes_its_reservation_along(self):
+        hall, session = self._paid_rent(18)
+        items = [{"session_id": session.id, "day": self.day.isoformat(), "start": "20:00"}]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self._post(items).status_code, 200)
+
+        self.assertEqual(
+            list(SlotReservation.objects.filter(session=session).values_list("slot_start", flat=True)),
+            [_at(3, 20)],
+        )
+        # старый час снова можно забронировать
+        fresh = _intent(hall, _at(3, 18), full_name="Next")
+        reservations.reserve(hall, [fresh.slot_start], intent=fresh)
+
+    def test_rent_session_cannot_be_moved_onto_a_held_hour(self):
+        hall, session = self._paid_rent(18)
+        holder = _intent(hall, _at(3, 20), full_name="Holder")
+        reservations.reserve(hall, [holder.slot_start], intent=holder)
+
+        response = self._post([{"session_id": session.id, "day": self.day.isoformat(), "start": "20:00"}])
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["results"][0]["error"], "validation")
+        session.refresh_from_db()
+        self.assertEqual(session.start_at, _at(3, 18))
+        self.assertEqual(SlotReservation.objects.get(session=session).slot_start, _at(3, 18))
+
+    def test_single_move_of_rent_session_uses_the_same_reservation_check(self):
+        hall, session = self._paid_rent(18)
+        holder = _intent(hall, _at(3, 20), full_name="Holder")
+        reservations.reserve(hall, [holder.slot_start], intent=holder)
+
+        def move(start):
+            return self.client.post(
+                reverse("crm_planning_move"),
+                data=json.dumps({"session_id": session.id, "day": self.day.isoformat(), "start": start, "loc": hall.name}),
+                content_type="application/json",
+            )
+
+        response = move("20:00")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["error"], "validation")
+        session.refresh_from_db()
+        self.assertEqual(session.start_at, _at(3, 18))
+        self.assertEqual(SlotReservation.objects.get(session=session).slot_start, _at(3, 18))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(move("21:00").status_code, 200)
+        self.assertEqual(SlotReservation.objects.get(session=session).slot_start, _at(3, 21))
+
+
+class RecurringSessionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hall = Location.objects.get(key="саккоиванцетти93а")
+        self.trainer = Trainer.objects.create(name="Rule coach")
+        today = timezone.localdate()
+        self.monday = today - timedelta(days=today.weekday()) + timedelta(days=7)
+        self.rule = RecurringSession.objects.create(
+            title="Пилатес",
+            weekday=RecurringSession.Weekday.TUE,
+            start_time=time(19, 0),
+            duration_min=55,
+            hall=self.hall,
+            trainer=self.trainer,
+            capacity=12,
+            valid_from=self.monday,
+        )
+
+    def _materialize(self, days=14):
+        out = StringIO()
+        call_command("materialize_sessions", "--from", self.monday.isoformat(), "--days", str(days), stdout=out)
+        return out.getvalue()
+
+    def test_command_is_idempotent(self):
+        self.assertIn("Created 2 sessions", self._materialize())
+        self.assertIn("Created 0 sessions", self._materialize())
+
+    def test_rule_and_exception_edits_reset_the_schedule_cache(self):
+        before = generation("schedule")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rule.start_time = time(20, 0)
+            self.rule.save()
+        after_rule = generation("schedule")
+        self.assertNotEqual(after_rule, before)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RecurringSessionException.objects.create(
+                rule=self.rule,
+                occurrence_date=self.monday + timedelta(days=1),
+                action=RecurringSessionException.Action.CANCEL,
+            )
+        self.assertNotEqual(generation("schedule"), after_rule)
+
+    def test_change_feed_gets_ids_of_inserted_occurrences(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._materialize()
+        created = ScheduleChange.objects.filter(kind=ScheduleChange.Kind.CREATED)
+        self.assertEqual(
+            sorted(created.values_list("session_id", flat=True)),
+            sorted(Session.objects.filter(rule=self.rule).values_list("id", flat=True)),
+        )
+
+        tuesday = Session.objects.get(occurrence_date=self.monday + timedelta(days=1))
+        self.assertEqual(timezone.localtime(tuesday.start_at).strftime("%H:%M"), "19:00")
+        self.assertEqual(timezone.localtime(tuesday.end_at).strftime("%H:%M"), "19:55")
+        self.assertEqual((tuesday.hall, tuesday.location, tuesday.capacity), (self.hall, self.hall.name, 12))
+
+    def test_viewing_a_window_materializes_it(self):
+        self.assertFalse(Session.objects.exists())
+        response = self.client.get(reverse("schedule:range"), {"start": self.monday.isoformat(), "days": 7})
+        tuesday = response.json()["days"][1]
+        self.assertEqual(len(tuesday["sessions"]), 1)
+        self.assertEqual(Session.objects.filter(rule=self.rule).count(), 1)
+
+    def test_exceptions_cancel_and_move_single_occurrences(self):
+        self._materialize()
+        first, second = self.monday + timedelta(days=1), self.monday + timedelta(days=8)
+        RecurringSessionException.objects.create(rule=self.rule, occurrence_date=first)
+        moved_to = timezone.make_aware(datetime.combine(second, time(20, 0)), timezone.get_current_timezone())
+        RecurringSessionException.objects.create(
+            rule=self.rule, occurrence_date=second, action=RecurringSessionException.Action.MOVE, new_start_at=moved_to,
+        )
+
+        self._materialize()
+        self.assertFalse(Session.objects.filter(occurrence_date=first).exists())
+        self.assertEqual(Session.objects.get(occurrence_date=second).start_at, moved_to)
+
+    def test_rule_change_rebuilds_only_untouched_occurrences(self):
+        self._materialize()
+        booked = Session.objects.get(occurrence_date=self.monday + timedelta(days=1))
+        Booking.objects.create(user=_user("rule_client", "79000000060"), session=booked)
+
+        self.rule.start_time = time(18, 0)
+        self.rule.save()
+        self._materialize()
+
+        booked.refresh_from_db()
+        self.assertEqual(timezone.localtime(booked.start_at).hour, 19)
+        rebuilt = Session.objects.get(occurrence_date=self.monday + timedelta(days=8))
+        self.assertEqual(timezone.localtime(rebuilt.start_at).hour, 18)
+
+
+class ScheduleChangeFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.trainer = Trainer.objects.create(name="Feed coach")
+        self.client_user = _user("feed_client", "79000000070")
+
+    def _changes(self, since, **params):
+        return self.client.get(reverse("schedule:changes"), {"since": since, **params}).json()
+
+    def _cursor(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Session.objects.create(title="Seed", start_at=_at(5, 8), location="Сакко и Ванцетти, 93а", trainer=self.trainer)
+        return self._changes(0)["last_id"]
+
+    def test_feed_reports_create_booking_and_move(self):
+        cursor = self._cursor()
+        with self.captureOnCommitCallbacks(execute=True):
+            session = Session.objects.create(
+                title="Live", start_at=_at(1, 10), location="Сакко и Ванцетти, 93а", trainer=self.trainer, capacity=5,
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(user=self.client_user, session=session)
+        with self.captureOnCommitCallbacks(execute=True):
+            session = Session.objects.get(pk=session.pk)
+            session.start_at = _at(2, 10)
+            session.save()
+
+        data = self._changes(cursor)
+        self.assertFalse(data["reset"])
+        self.assertEqual([c["kind"] for c in data["changes"]], ["created", "booking", "moved"])
+        self.assertEqual(data["changes"][1]["seats_left"], 4)
+        moved_days = data["changes"][2]["days"]
+        self.assertEqual(moved_days, sorted({timezone.localdate(_at(1, 10)).isoformat(), timezone.localdate(_at(2, 10)).isoformat()}))
+
+        self.assertEqual(self._changes(data["last_id"])["changes"], [])
+
+    def test_booking_writes_without_seat_change_are_not_logged(self):
+        session = Session.objects.create(
+            title="Quiet", start_at=_at(1, 10), location="Сакко и Ванцетти, 93а", trainer=self.trainer, capacity=5,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(user=self.client_user, session=session)
+        cursor = self._changes(0)["last_id"]
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Booking.objects.get(pk=booking.pk).mark_attended()
+        self.assertEqual(self._changes(cursor)["changes"], [])
+        self.assertEqual(len(callbacks), 1)  # только сброс кэша расписания
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.get(pk=booking.pk).cancel()
+        self.assertEqual([c["seats_left"] for c in self._changes(cursor)["changes"]], [5])
+
+    def test_private_sessions_are_visible_to_staff_only(self):
+        cursor = self._cursor()
+        with self.captureOnCommitCallbacks(execute=True):
+            Session.objects.create(
+                title="Аренда", kind=Session.Kind.RENT, start_at=_at(1, 12), location="Сакко и Ванцетти, 93а", trainer=self.trainer,
+            )
+        self.assertEqual(self._changes(cursor)["changes"], [])
+
+        staff = _user("feed_staff", "79000000071")
+        staff.is_staff = True
+        staff.save(update_fields=["is_staff"])
+        self.client.force_login(staff)
+        self.assertEqual([c["kind"] for c in self._changes(cursor)["changes"]], ["created"])
+
+    def test_public_clients_get_short_poll(self):
+        cursor = self._cursor()
+        with mock.patch("schedule.views.time.sleep") as sleep:
+            data = self._changes(cursor, wait=20)
+        sleep.assert_not_called()
+        self.assertEqual(data["changes"], [])
+        self.assertGreater(data["poll_after"], 0)
+
+    def test_unknown_cursor_asks_for_reset(self):
+        cursor = self._cursor()
+        self.assertTrue(self._changes(cursor + 1000)["reset"])
+
+
+class RentAvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hall = Location.objects.get(key="саккоиванцетти93а")
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.user = _user("renter", "79000000031")
+        self.trainer = Trainer.objects.create(name="Coach")
+
+    def _state(self, hour: int, viewer_id=None) -> str:
+        occ = availability.occupancy_for_days(self.hall.id, [self.day])[self.day]
+        return occ.state(hour, viewer_id=viewer_id, now_ts=timezone.now().timestamp())
+
+    def _hold(self, hour: int, **extra):
+        intent = _intent(self.hall, _at(1, hour), **extra)
+        reservations.reserve(self.hall, [intent.slot_start], intent=intent)
+        return intent
+
+    def test_grid_is_served_from_cache_and_reset_by_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Session.objects.create(title="Йога", start_at=_at(1, 10), duration_min=90, hall=self.hall, trainer=self.trainer, capacity=5)
+        self.assertEqual(self._state(10), "training")
+        self.assertEqual(self._state(11), "training")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self._state(12), "")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._hold(12)
+        self.assertEqual(self._state(12), "pending")
+
+    def test_moving_a_session_frees_the_old_hours(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            session = Session.objects.create(
+                title="Аренда", kind=Session.Kind.RENT, client=self.user,
+                start_at=_at(1, 10), duration_min=60, hall=self.hall, trainer=self.trainer, capacity=1,
+            )
+        self.assertEqual(self._state(10, viewer_id=self.user.id), "rent_paid")
+        self.assertEqual(self._state(10), "busy")
+
+        session = Session.objects.get(pk=session.pk)
+        session.start_at = _at(1, 15)
+        with self.captureOnCommitCallbacks(execute=True):
+            session.save()
+        self.assertEqual(self._state(10), "")
+        self.assertEqual(self._state(15), "busy")
+
+    def test_expired_pending_intent_reads_as_free_without_reset(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._hold(9, expires_at=timezone.now() + timedelta(seconds=30))
+        occ = availability.occupancy_for_days(self.hall.id, [self.day])[self.day]
+        later = (timezone.now() + timedelta(minutes=1)).timestamp()
+        self.assertEqual(occ.state(9, viewer_id=None, now_ts=timezone.now().timestamp()), "pending")
+        self.assertEqual(occ.state(9, viewer_id=None, now_ts=later), "")
+
+
+class ExpireRentIntentsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hall = Location.objects.get(key="саккоиванцетти93а")
+
+    def test_sweep_cancels_only_expired_unpaid_intents(self):
+        expired = _intent(self.hall, _at(1, 9), expires_in_min=-1, status=RentPaymentIntent.Status.PENDING)
+        live = _intent(self.hall, _at(1, 10), expires_in_min=10, status=RentPaymentIntent.Status.PENDING)
+        paid = _intent(self.hall, _at(1, 11), expires_in_min=-1, status=RentPaymentIntent.Status.PAID)
+        self.assertEqual(list(RentPaymentIntent.objects.holding()), [live])
+
+        out = StringIO()
+        call_command("expire_rent_intents", stdout=out)
+        self.assertIn("Expired 1", out.getvalue())
+
+        expired.refresh_from_db()
+        live.refresh_from_db()
+        paid.refresh_from_db()
+        self.assertEqual(expired.status, RentPaymentIntent.Status.CANCELED)
+        self.assertEqual(expired.tb_status, "DEADLINE_EXPIRED")
+        self.assertEqual(live.status, RentPaymentIntent.Status.PENDING)
+        self.assertEqual(paid.status, RentPaymentIntent.Status.PAID)
+
+    def test_second_instance_exits_while_lock_is_held(self):
+        expired = _intent(self.hall, _at(1, 9), expires_in_min=-1, status=RentPaymentIntent.Status.PENDING)
+        cache.add("lock:expire_rent_intents", "other", 60)
+
+        out = StringIO()
+        call_command("expire_rent_intents", stdout=out)
+        self.assertIn("Another sweeper is running", out.getvalue())
+        expired.refresh_from_db()
+        self.assertEqual(expired.status, RentPaymentIntent.Status.PENDING)
+
+
+class SlotReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hall = Location.objects.get(key="саккоиванцетти93а")
+        self.trainer = Trainer.objects.create(name="Coach")
+
+    def test_second_reservation_of_the_same_hour_fails(self):
+        first = _intent(self.hall, _at(1, 10))
+        reservations.reserve(self.hall, [first.slot_start], intent=first)
+
+        second = _intent(self.hall, _at(1, 10))
+        with self.assertRaises(reservations.SlotTaken):
+            reservations.reserve(self.hall, [second.slot_start], intent=second)
+        # соседний час не мешает
+        reservations.reserve(self.hall, [_at(1, 11)], intent=second)
+        self.assertEqual(SlotReservation.objects.count(), 2)
+
+    def test_expired_reservation_is_taken_over(self):
+        stale = _intent(self.hall, _at(1, 10), expires_in_min=-1)
+        reservations.reserve(self.hall, [stale.slot_start], intent=stale)
+
+        fresh = _intent(self.hall, _at(1, 10))
+        reservations.reserve(self.hall, [fresh.slot_start], intent=fresh)
+        self.assertEqual(SlotReservation.objects.get().intent, fresh)
+
+    def test_cancel_releases_and_payment_confirms(self):
+        canceled = _intent(self.hall, _at(1, 10))
+        reservations.reserve(self.hall, [canceled.slot_start], intent=canceled)
+        canceled.status = RentPaymentIntent.Status.CANCELED
+        canceled.save(update_fields=["status"])
+        self.assertFalse(SlotReservation.objects.exists())
+
+        paid = _intent(self.hall, _at(1, 10))
+        reservations.reserve(self.hall, [paid.slot_start], intent=paid)
+        [(session, _)] = rent.book(paid, paid_at=timezone.now(), tb_status="CONFIRMED")
+        reservation = SlotReservation.objects.get()
+        self.assertEqual(reservation.session, session)
+        self.assertIsNone(reservation.expires_at)
+
+        session.delete()
+        self.assertFalse(SlotReservation.objects.exists())
+
+
+class MultiSlotRentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hall = Location.objects.get(key="саккоиванцетти93а")
+        self.user = _user("renter", "79000000061")
+
+    def test_one_intent_books_runs_of_adjacent_slots(self):
+        slots = [_at(1, 10), _at(1, 11), _at(1, 15)]
+        intent = _intent(self.hall, slots[0], user=self.user, duration_min=6 * 60, amount_rub=3 * 650)
+        reservations.reserve(self.hall, slots, intent=intent)
+
+        runs = rent.slot_runs(rent.intent_slots(intent))
+        self.assertEqual([(r.start, r.count) for r in runs], [(slots[0], 2), (slots[2], 1)])
+        with self.assertNumQueries(1):
+            self.assertEqual(rent.busy_runs(self.hall.id, runs), [])
+
+        booked = rent.book(intent, paid_at=timezone.now(), tb_status="CONFIRMED")
+        self.assertEqual([(s.start_at, s.duration_min) for s, _ in booked], [(slots[0], 120), (slots[2], 60)])
+        self.assertEqual([r.price_rub for _, r in booked], [1300, 650])
+        intent.refresh_from_db()
+        self.assertEqual(intent.status, RentPaymentIntent.Status.PAID)
+        self.assertFalse(SlotReservation.objects.filter(session__isnull=True).exists())
+
+        # оплаченные часы теперь заняты, промежуток между ними — нет
+        self.assertEqual(len(rent.busy_runs(self.hall.id, rent.slot_runs([_at(1, 11), _at(1, 13)]))), 1)
@@ -6,6 +6,8 @@ app_name = "schedule"
 urlpatterns = [
     path("", views.schedule_list, name="list"),
     path("fragment/", views.schedule_fragment, name="fragment"),
+    path("range/", views.schedule_range, name="range"),
+    path("changes/", views.schedule_changes, name="changes"),
 
     path("session/<int:session_id>/", views.session_detail, name="detail"),
 
@@ -1,20 +1,35 @@
 from datetime import date, datetime, timedelta
-import re
+import time
 from django.urls import reverse
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ValidationError
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.safestring import mark_safe
 from django.db.models import Q
 from django.db import transaction
 
+from core.cache import generation, get_versioned, set_versioned
+from core.conditional import conditional_page
 from core.telegram_notify import notify_booking_canceled, notify_booking_created
 from core.legal import client_ip, is_checked
 from payments.receipt import build_receipt, receipt_item
 
-from .models import Session, Booking, PaymentIntent
+from .models import Location, Session, SessionFull, Booking, PaymentIntent, _norm_addr, location_aliases
+from .changes import changes_since, latest_id
+from .recurrence import ensure_materialized
+
+FRAGMENT_CACHE_TTL = 10 * 60
+
+_MY_STATUS_LABELS = {
+    Booking.Status.BOOKED: "Вы записаны · ",
+    Booking.Status.WAITLIST: "Вы в листе ожидания · ",
+    Booking.Status.INVITED: "Вы приглашены · ",
+}
 
 
 def _detail_url(session_id: int, notice: str | None = None) -> str:
@@ -43,6 +58,8 @@ def _create_single_visit_membership(user):
 def _set_booked(*, user, session: Session, membership=None):
     """Создаёт/обновляет Booking в BOOKED, привязывая абонемент (если указан)."""
     b, _ = Booking.objects.get_or_create(user=user, session=session)
+    # держим в памяти тот же объект занятия, чтобы booked_count в нём был актуален
+    b.session = session
     b.booking_status = Booking.Status.BOOKED
     b.canceled_at = None
     b.membership = membership
@@ -107,18 +124,16 @@ def _days_between(start: date, end: date):
     return days
 
 
-def _norm_addr(s: str) -> str:
-    if not s:
-        return ""
-    s = s.strip().lower().replace("ё", "е")
-    return re.sub(r"[^0-9a-zа-я]+", "", s)
+def _sessions_for_day_loc(*, selected: date, loc: str, user):
+    return _sessions_for_days_loc(first_day=selected, days=1, loc=loc, user=user)
 
 
-def _sessions_for_day_loc(*, selected: date, loc: str, user):
+def _sessions_for_days_loc(*, first_day: date, days: int, loc: str, user):
     tz = timezone.get_current_timezone()
+    ensure_materialized(first_day, first_day + timedelta(days=days - 1))
 
-    start_dt = datetime.combine(selected, datetime.min.time(), tzinfo=tz)
-    end_dt = start_dt + timedelta(days=1)
+    start_dt = datetime.combine(first_day, datetime.min.time(), tzinfo=tz)
+    end_dt = datetime.combine(first_day + timedelta(days=days), datetime.min.time(), tzinfo=tz)
 
     vis_q = Q(kind="group")
 
@@ -126,31 +141,106 @@ def _sessions_for_day_loc(*, selected: date, loc: str, user):
         Session.objects.select_related("trainer")
         .filter(vis_q)
         .filter(start_at__gte=start_dt, start_at__lt=end_dt)
-        .exclude(location__isnull=True)
-        .exclude(location__exact="")
+        .filter(hall__isnull=False)
+        .with_occupancy(user)
         .order_by("start_at")
     )
+    if loc:
+        # JOIN по уникальному ключу зала, фильтр идёт по индексу (hall, start_at)
+        base_qs = base_qs.filter(hall__key__in=location_aliases(loc))
 
     sessions_list = list(base_qs)
-    if loc:
-        target = _norm_addr(loc)
-        sessions_list = [s for s in sessions_list if _norm_addr(s.location) == target]
-
-    session_ids = [s.id for s in sessions_list]
-
-    booked_ids = set()
-    if getattr(user, "is_authenticated", False) and session_ids:
-        booked_ids = set(
-            Booking.objects.filter(
-                user=user,
-                session_id__in=session_ids,
-                booking_status="booked",
-            ).values_list("session_id", flat=True)
-        )
+
+    booked_ids = {s.id for s in sessions_list if s.my_status == Booking.Status.BOOKED}
 
     return sessions_list, booked_ids
 
 
+def _day_fragment(*, selected: date, loc: str) -> tuple[str, list[int]]:
+    """Общий для всех зрителей HTML дня (без персональных статусов) + id занятий.
+
+    Ключ включает поколение расписания: любое сохранение/удаление Session или
+    Booking его сдвигает, и старые фрагменты просто перестают читаться.
+    """
+    key = f"fragment:{selected.isoformat()}:{_norm_addr(loc)}"
+    cached = get_versioned("schedule", key)
+    if cached is None:
+        sessions_list, _ = _sessions_for_day_loc(selected=selected, loc=loc, user=None)
+        html = render_to_string(
+            "schedule/_sessions.html",
+            {"sessions": sessions_list, "selected": selected, "selected_location": loc},
+        )
+        cached = (str(html), [s.id for s in sessions_list])
+        set_versioned("schedule", key, cached, FRAGMENT_CACHE_TTL)
+    return cached
+
+
+def _overlay_my_status(html: str, session_ids: list[int], user) -> tuple[str, set[int]]:
+    """Проставляет в закэшированный фрагмент статусы записей зрителя (один запрос)."""
+    if not getattr(user, "is_authenticated", False) or not session_ids:
+        return mark_safe(html), set()
+
+    statuses = dict(
+        Booking.objects
+        .filter(user=user, session_id__in=session_ids)
+        .values_list("session_id", "booking_status")
+    )
+    for session_id, status in statuses.items():
+        label = _MY_STATUS_LABELS.get(status)
+        if label:
+            html = html.replace(
+                f'<span data-my-status="{session_id}"></span>',
+                f'<span data-my-status="{session_id}">{label}</span>',
+            )
+    booked_ids = {sid for sid, status in statuses.items() if status == Booking.Status.BOOKED}
+    return mark_safe(html), booked_ids
+
+
+RANGE_MAX_DAYS = 31
+
+# Порядок полей в строках занятий ответа schedule_range
+_RANGE_FIELDS = ("id", "time", "duration_min", "title", "trainer", "seats_left", "waitlist_count")
+
+
+def _range_payload(*, first_day: date, days: int, loc: str) -> dict:
+    """Занятия за days дней одним запросом, сгруппированные по дням (общая для всех часть)."""
+    key = f"range:{first_day.isoformat()}:{days}:{_norm_addr(loc)}"
+    cached = get_versioned("schedule", key)
+    if cached is not None:
+        return cached
+
+    sessions_list, _ = _sessions_for_days_loc(first_day=first_day, days=days, loc=loc, user=None)
+    by_day = {first_day + timedelta(days=i): [] for i in range(days)}
+    for s in sessions_list:
+        by_day[timezone.localdate(s.start_at)].append(s)
+
+    payload = {
+        "fields": list(_RANGE_FIELDS),
+        "days": [
+            {
+                "date": day.isoformat(),
+                "classes": len(items),
+                "free_seats": sum(s.seats_left for s in items),
+                "sessions": [
+                    [
+                        s.id,
+                        timezone.localtime(s.start_at).strftime("%H:%M"),
+                        s.duration_min,
+                        s.title,
+                        s.trainer.name if s.trainer_id else "",
+                        s.seats_left,
+                        s.waitlist_count,
+                    ]
+                    for s in items
+                ],
+            }
+            for day, items in by_day.items()
+        ],
+    }
+    set_versioned("schedule", key, payload, FRAGMENT_CACHE_TTL)
+    return payload
+
+
 def _membership_sort_key(m):
     # Сначала абонементы с ближайшим окончанием, бессрочные/неактивированные — в конце.
     return (
@@ -174,6 +264,12 @@ def _group_memberships_for_payment(user):
     return memberships
 
 
+def _schedule_stamp(request):
+    # «сегодня» входит в метку: прошедшие дни подменяются текущим
+    return f"{generation('schedule')}:{timezone.localdate().isoformat()}", None
+
+
+@conditional_page(_schedule_stamp)
 def schedule_list(request):
     today = timezone.localdate()
     selected = _parse_iso_date(request.GET.get("day") or "") or today
@@ -181,7 +277,7 @@ def schedule_list(request):
         selected = today
 
     loc = (request.GET.get("loc") or "").strip()
-    locations = [x for x in getattr(__import__("django.conf").conf.settings, "WOOMFIT_LOCATIONS", []) if x]
+    locations = list(Location.objects.active().values_list("name", flat=True))
     if not loc and locations:
         loc = locations[0]
 
@@ -190,7 +286,8 @@ def schedule_list(request):
     end_day = start_day + timedelta(days=STRIP_N - 1)
     days = _days_between(start_day, end_day)
 
-    sessions_list, booked_ids = _sessions_for_day_loc(selected=selected, loc=loc, user=request.user)
+    html, session_ids = _day_fragment(selected=selected, loc=loc)
+    sessions_html, booked_ids = _overlay_my_status(html, session_ids, request.user)
 
     return render(
         request,
@@ -203,12 +300,13 @@ def schedule_list(request):
             "strip_start": start_day.isoformat(),
             "strip_end": end_day.isoformat(),
             "today_iso": today.isoformat(),
-            "sessions": sessions_list,
+            "sessions_html": sessions_html,
             "booked_ids": booked_ids,
         },
     )
 
 
+@conditional_page(_schedule_stamp)
 def schedule_fragment(request):
     today = timezone.localdate()
     selected = _parse_iso_date(request.GET.get("day") or "") or today
@@ -216,18 +314,91 @@ def schedule_fragment(request):
         selected = today
     loc = (request.GET.get("loc") or "").strip()
 
-    sessions_list, booked_ids = _sessions_for_day_loc(selected=selected, loc=loc, user=request.user)
+    html, session_ids = _day_fragment(selected=selected, loc=loc)
+    sessions_html, _ = _overlay_my_status(html, session_ids, request.user)
+    return HttpResponse(sessions_html)
 
-    return render(
-        request,
-        "schedule/_sessions.html",
-        {
-            "sessions": sessions_list,
-            "booked_ids": booked_ids,
-            "selected": selected,
-            "selected_location": loc,
-        },
+
+@conditional_page(_schedule_stamp)
+def schedule_range(request):
+    """JSON для полосы дней: занятия и бейджи (кол-во занятий, свободные места) на N дней."""
+    today = timezone.localdate()
+    first_day = _parse_iso_date(request.GET.get("start") or "") or today
+    if first_day < today:
+        first_day = today
+    try:
+        days = int(request.GET.get("days") or 10)
+    except ValueError:
+        days = 10
+    days = max(1, min(RANGE_MAX_DAYS, days))
+    loc = (request.GET.get("loc") or "").strip()
+
+    payload = _range_payload(first_day=first_day, days=days, loc=loc)
+
+    my = {}
+    if request.user.is_authenticated:
+        session_ids = [row[0] for day in payload["days"] for row in day["sessions"]]
+        if session_ids:
+            my = {
+                str(session_id): status
+                for session_id, status in Booking.objects
+                .filter(user=request.user, session_id__in=session_ids)
+                .exclude(booking_status=Booking.Status.CANCELED)
+                .values_list("session_id", "booking_status")
+            }
+
+    return JsonResponse({**payload, "my": my}, json_dumps_params={"ensure_ascii": False, "separators": (",", ":")})
+
+
+CHANGES_MAX_WAIT_SEC = 20
+CHANGES_POLL_INTERVAL_SEC = 1.0
+# публичные вкладки не держат поток gunicorn: короткий опрос раз в N секунд
+CHANGES_PUBLIC_POLL_SEC = 30
+CHANGES_BATCH = 200
+
+
+def schedule_changes(request):
+    """Изменения расписания после id=since.
+
+    since=0 — только узнать текущий курсор. reset=true — клиенту проще
+    перечитать страницу. poll_after — через сколько секунд спрашивать снова.
+
+    Long-poll (wait, до CHANGES_MAX_WAIT_SEC) — только для персонала: ожидание
+    спит в потоке запроса и раз в CHANGES_POLL_INTERVAL_SEC читает поколение
+    "changes" из кэша (в docker это таблица кэша в БД). Остальным отвечаем сразу.
+    """
+    try:
+        since = max(0, int(request.GET.get("since") or 0))
+        wait = max(0.0, min(CHANGES_MAX_WAIT_SEC, float(request.GET.get("wait") or 0)))
+    except ValueError:
+        return JsonResponse({"error": "bad_params"}, status=400)
+
+    include_private = bool(request.user.is_authenticated and request.user.is_staff)
+    if not include_private:
+        wait = 0.0
+    poll_after = 0 if include_private else CHANGES_PUBLIC_POLL_SEC
+
+    if since == 0:
+        return JsonResponse({"last_id": latest_id(), "changes": [], "reset": False, "poll_after": poll_after})
+
+    deadline = time.monotonic() + wait
+    gen = generation("changes") if wait else None
+    rows, reset = changes_since(since, include_private=include_private, limit=CHANGES_BATCH)
+    while not rows and not reset and time.monotonic() < deadline:
+        time.sleep(CHANGES_POLL_INTERVAL_SEC)
+        if generation("changes") == gen:
+            continue
+        gen = generation("changes")
+        rows, reset = changes_since(since, include_private=include_private, limit=CHANGES_BATCH)
+
+    if reset:
+        return JsonResponse({"last_id": latest_id(), "changes": [], "reset": True, "poll_after": poll_after})
+    response = JsonResponse(
+        {"last_id": rows[-1]["id"] if rows else since, "changes": rows, "reset": False, "poll_after": poll_after},
+        json_dumps_params={"separators": (",", ":")},
     )
+    response["Cache-Control"] = "no-store"
+    return response
 
 
 def session_detail(request, session_id: int):
@@ -272,7 +443,11 @@ def session_detail(request, session_id: int):
                 messages.success(request, "Вы уже записаны")
                 return redirect("schedule:detail", session_id=s.id)
 
-            b, _ = Booking.objects.get_or_create(user=request.user, session=s)
+            b, _ = Booking.objects.get_or_create(
+                user=request.user,
+                session=s,
+                defaults={"booking_status": Booking.Status.WAITLIST},
+            )
             b.booking_status = Booking.Status.WAITLIST
             b.canceled_at = None
             b.invite_sent_at = None
@@ -357,11 +532,17 @@ def session_choose_payment(request, session_id: int):
                 messages.error(request, "Этот абонемент нельзя использовать для групповой тренировки")
                 return redirect("schedule:detail", session_id=s.id)
 
-            if not m.consume_visit():
-                messages.error(request, "На этом абонементе закончились посещения")
+            try:
+                # посещение списываем вместе с записью: нет места — нет и списания
+                with transaction.atomic():
+                    if not m.consume_visit():
+                        messages.error(request, "На этом абонементе закончились посещения")
+                        return redirect("schedule:detail", session_id=s.id)
+                    _set_booked(user=request.user, session=s, membership=m)
+            except SessionFull:
+                messages.error(request, "Свободных мест нет")
                 return redirect("schedule:detail", session_id=s.id)
 
-            _set_booked(user=request.user, session=s, membership=m)
             notify_booking_created(
                 user=request.user,
                 session=s,
@@ -428,34 +609,41 @@ def session_pay(request, session_id: int):
                 return redirect("schedule:pay", session_id=s.id)
 
             try:
-                debit(
-                    request.user,
-                    Decimal(str(amount_rub)),
-                    reason=f"Оплата разового занятия: {s.title} ({timezone.localtime(s.start_at).strftime('%d.%m %H:%M')})",
-                )
-            except ValidationError as e:
-                messages.error(request, str(e) or "Не удалось списать средства из кошелька")
-                return redirect("schedule:pay", session_id=s.id)
-
-            intent = PaymentIntent.objects.create(
-                user=request.user,
-                session=s,
-                amount_rub=amount_rub,
-                status=PaymentIntent.Status.PAID,
-                paid_at=timezone.now(),
-                tb_status="WALLET_PAID",
-                legal_accepted_at=timezone.now(),
-                legal_accept_ip=client_ip(request),
-            )
-
-            # Loyalty should grow only once, at the moment of real payment.
-            from loyalty.services import add_spent
-            add_spent(request.user, Decimal(str(amount_rub)))
+                # списание, оплата и запись — вместе: нет места — деньги остаются в кошельке
+                with transaction.atomic():
+                    try:
+                        debit(
+                            request.user,
+                            Decimal(str(amount_rub)),
+                            reason=f"Оплата разового занятия: {s.title} ({timezone.localtime(s.start_at).strftime('%d.%m %H:%M')})",
+                        )
+                    except ValidationError as e:
+                        messages.error(request, str(e) or "Не удалось списать средства из кошелька")
+                        return redirect("schedule:pay", session_id=s.id)
+
+                    intent = PaymentIntent.objects.create(
+                        user=request.user,
+                        session=s,
+                        amount_rub=amount_rub,
+                        status=PaymentIntent.Status.PAID,
+                        paid_at=timezone.now(),
+                        tb_status="WALLET_PAID",
+                        legal_accepted_at=timezone.now(),
+                        legal_accept_ip=client_ip(request),
+                    )
+
+                    # Loyalty should grow only once, at the moment of real payment.
+                    from loyalty.services import add_spent
+                    add_spent(request.user, Decimal(str(amount_rub)))
+
+                    # ✅ разовый абонемент на 1 и сразу списание
+                    m = _create_single_visit_membership(request.user)
+                    m.consume_visit()
+                    _set_booked(user=request.user, session=s, membership=m)
+            except SessionFull:
+                messages.error(request, "Свободных мест нет")
+                return redirect("schedule:detail", session_id=s.id)
 
-            # ✅ разовый абонемент на 1 и сразу списание
-            m = _create_single_visit_membership(request.user)
-            m.consume_visit()
-            _set_booked(user=request.user, session=s, membership=m)
             notify_booking_created(
                 user=request.user,
                 session=s,
@@ -466,7 +654,7 @@ def session_pay(request, session_id: int):
             return redirect(_detail_url(s.id, notice="booked"))
 
         if method == "online":
-            from payments.tbank import TBankClient
+            from payments.tbank import TBankError, get_client
 
             intent = PaymentIntent.objects.create(
                 user=request.user,
@@ -477,7 +665,7 @@ def session_pay(request, session_id: int):
                 legal_accept_ip=client_ip(request),
             )
 
-            client = TBankClient(settings.TBANK_TERMINAL_KEY, settings.TBANK_PASSWORD, settings.TBANK_IS_TEST)
+            client = get_client()
 
             notification_url = request.build_absolute_uri(reverse("payments:tbank_webhook"))
             success_url = request.build_absolute_uri(reverse("schedule:pay_success", args=[intent.id]))
@@ -489,15 +677,18 @@ def session_pay(request, session_id: int):
                 [receipt_item(name=f"Разовое посещение: {s.title}", price_kopeks=amount_kopeks, quantity=1)],
             )
 
-            pay = client.init_payment(
-                order_id=f"S-{intent.id}",
-                amount_kopeks=amount_kopeks,
-                description=f"WOOM FIT session #{s.id} intent #{intent.id}",
-                notification_url=notification_url,
-                success_url=success_url,
-                fail_url=fail_url,
-                receipt=receipt,
-            )
+            try:
+                pay = client.init_payment(
+                    order_id=f"S-{intent.id}",
+                    amount_kopeks=amount_kopeks,
+                    description=f"WOOM FIT session #{s.id} intent #{intent.id}",
+                    notification_url=notification_url,
+                    success_url=success_url,
+                    fail_url=fail_url,
+                    receipt=receipt,
+                )
+            except TBankError:
+                pay = {"Status": "INIT_FAILED"}
 
             if pay.get("Success"):
                 intent.tb_payment_id = str(pay.get("PaymentId") or "")
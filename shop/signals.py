@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.cache import bump
+
+from .models import Category, Product, TrialUse
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=TrialUse)
+@receiver(post_delete, sender=TrialUse)
+def invalidate_shop_cache(sender, **kwargs):
+    transaction.on_commit(lambda: bump("shop"))
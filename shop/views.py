@@ -3,6 +3,9 @@ from decimal import Decimal
 from django.contrib import messages
 from django.shortcuts import render, redirect, get_object_or_404
 
+from core.cache import generation
+from core.conditional import conditional_page
+
 from .cart import Cart
 from .models import Category, Product, TrialUse
 from wallet.services import get_wallet
@@ -43,6 +46,12 @@ def shop_menu(request):
     return render(request, "shop/menu.html", {"cards": cards})
 
 
+def _shop_stamp(request, section: str):
+    # TrialUse тоже сдвигает поколение: от него зависит видимость «пробного»
+    return str(generation("shop")), None
+
+
+@conditional_page(_shop_stamp)
 def shop_section(request, section: str):
     allowed = {k for (k, _) in Category.Section.choices}
     if section not in allowed: